@@ -55,4 +55,12 @@ Also see [Template](#template).
 from .message import Message
 from .attachment import Attachment, ImageAttachment
 from .postman import Postman
-from . import connection, template
+from .util import lazy_imports
+
+# Connections and templates are imported on first use: they pull in smtplib, ssl, and jinja2
+__getattr__ = lazy_imports(__name__, {
+    'connection': ('.connection', None),
+    'template': ('.template', None),
+})
+
+__all__ = ['Message', 'Attachment', 'ImageAttachment', 'Postman']
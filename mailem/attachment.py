@@ -1,9 +1,14 @@
 """ Attachments """
 
+import hashlib
+
 from email.encoders import encode_base64
 from email.mime.base import MIMEBase
 from email.mime.image import MIMEImage
-from future.moves.urllib.parse import quote_plus
+try:
+    from urllib.parse import quote_plus
+except ImportError:  # Python 2
+    from urllib import quote_plus
 
 from .util import unicode_header
 
@@ -36,13 +41,32 @@ class Attachment(object):
         if self.disposition == 'inline':
             self.headers.setdefault('Content-ID', '<{}>'.format(quote_plus(filename)))
 
+    def _sha256(self):
+        """ Get the SHA-256 of the data, hex. Cached: templates share attachments between messages.
+
+        :rtype: str
+        """
+        cached = getattr(self, '_sha256_cache', None)
+        if cached is not None and cached[0] is self.data:
+            return cached[1]
+        data = self.data if self.data is not None else b''
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        self._sha256_cache = (self.data, digest)
+        return digest
+
     def _build_mime_object(self):
         """ Create a MIMe object
 
         :rtype: email.mime.base.MIMEBase
         """
         obj = MIMEBase(*self.content_type.split('/'))
-        obj.set_payload(self.data)
+        data = self.data
+        if data is not None and not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.encode('utf-8')  # text
+            obj.set_param('charset', 'utf-8')
+        obj.set_payload(data)
         encode_base64(obj)
         return obj
 
@@ -99,4 +123,7 @@ class ImageAttachment(Attachment):
         super(ImageAttachment, self).__init__(filename, data, None, disposition, headers)
 
     def _build_mime_object(self):
-        return MIMEImage(self.data)
+        data = self.data
+        if isinstance(data, memoryview):
+            data = data.tobytes()  # image type detection needs bytes
+        return MIMEImage(data)
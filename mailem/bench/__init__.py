@@ -0,0 +1,14 @@
+""" Load testing tools: a local SMTP sink, and a load generator.
+
+    $ python -m mailem.bench -n 10000 -c 8 --size 20000
+
+Python 3 only.
+"""
+
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError('mailem.bench requires Python 3.5+: the sink runs on asyncio')
+
+from .sink import SMTPSink
+from .load import run_load, make_template
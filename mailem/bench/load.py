@@ -0,0 +1,138 @@
+from __future__ import print_function
+
+import sys
+import time
+import argparse
+import threading
+import itertools
+
+from .. import Postman, Attachment
+from ..connection import SMTPConnection
+from ..metrics import HistogramMetrics
+from ..template import Template
+from .sink import SMTPSink
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def make_template(size, attachment_size=0):
+    """ Create a template for load testing
+
+    :param size: Approximate HTML body size, bytes
+    :type size: int
+    :param attachment_size: Attachment size, bytes; 0 for none
+    :type attachment_size: int
+    :rtype: mailem.template.Template
+    """
+    paragraph = u'<p>Hello $user, this is message #$n. Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>\n'
+    html = paragraph * max(1, size // len(paragraph))
+    attachments = [Attachment(u'data.bin', b'\x00' * attachment_size)] if attachment_size else []
+    return Template(u'Load test #$n', html, attachments=attachments)
+
+
+def run_load(postman, template, n, concurrency=1):
+    """ Push `n` templated messages through a Postman
+
+    Every worker thread has its own connection.
+
+    :param postman: Postman to send with. Its metrics collector, if any, receives the stages.
+    :type postman: mailem.postman.Postman
+    :param template: Template to render messages with
+    :type template: mailem.template.Template
+    :param n: The number of messages
+    :type n: int
+    :param concurrency: The number of worker threads
+    :type concurrency: int
+    :return: (seconds elapsed, list of errors)
+    :rtype: (float, list[Exception])
+    """
+    counter = itertools.count()
+    errors = []
+
+    def worker():
+        try:
+            with postman.connect() as c:
+                for i in iter(lambda: next(counter), None):
+                    if i >= n:
+                        break
+                    c.sendmail(template(['user{}@example.com'.format(i)], {'user': 'User', 'n': i}))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for i in range(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.time() - start, errors
+
+
+def max_rss():
+    """ Get the peak memory usage of the process, bytes
+
+    :rtype: int|None
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # kilobytes on Linux
+
+
+def report(n, elapsed, errors, metrics, sink=None, out=sys.stdout):
+    """ Print the results of a load test """
+    print('Messages:     {}  ({} errors)'.format(n, len(errors)), file=out)
+    print('Elapsed:      {:.2f}s'.format(elapsed), file=out)
+    print('Throughput:   {:.1f} msgs/sec'.format(n / elapsed), file=out)
+    rss = max_rss()
+    if rss is not None:
+        print('Peak RSS:     {:.1f} MB'.format(rss / 1048576.0), file=out)
+    if sink is not None:
+        print('Sink:         {} messages, {:.1f} MB, {} sessions'.format(
+            sink.messages, sink.bytes / 1048576.0, sink.sessions), file=out)
+    if errors:
+        print('First error:  {!r}'.format(errors[0]), file=out)
+
+    print('', file=out)
+    print('{:<10} {:>8} {:>10} {:>10} {:>10} {:>10}'.format('stage', 'count', 'mean', 'p50', 'p99', 'max'), file=out)
+    for stage, s in sorted(metrics.summary().items()):
+        print('{:<10} {:>8} {:>9.2f}ms {:>9.2f}ms {:>9.2f}ms {:>9.2f}ms'.format(
+            stage, s['count'], s['mean'] * 1000, s['p50'] * 1000, s['p99'] * 1000, s['max'] * 1000), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mailem.bench',
+        description='Load test: push templated messages through Postman. '
+                    'Sends to a bundled local SMTP sink, unless --host is given.')
+    parser.add_argument('-n', '--messages', type=int, default=1000, help='The number of messages')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='The number of connections (threads)')
+    parser.add_argument('-s', '--size', type=int, default=10000, help='HTML body size, bytes')
+    parser.add_argument('-a', '--attachment', type=int, default=0, help='Attachment size, bytes')
+    parser.add_argument('--host', help='SMTP server to send to. Default: a bundled sink')
+    parser.add_argument('--port', type=int, default=25, help='SMTP server port')
+    parser.add_argument('--delay', type=float, default=0, help='Sink: seconds to wait before accepting a message')
+    args = parser.parse_args(argv)
+
+    sink = None
+    if args.host is None:
+        sink = SMTPSink(delay=args.delay).start()
+        host, port = sink.host, sink.port
+    else:
+        host, port = args.host, args.port
+
+    metrics = HistogramMetrics()
+    postman = Postman('bench@example.com', SMTPConnection(host, port, None, None), metrics=metrics)
+    template = make_template(args.size, args.attachment).set_metrics(metrics)
+
+    try:
+        elapsed, errors = run_load(postman, template, args.messages, args.concurrency)
+    finally:
+        if sink is not None:
+            sink.stop()
+
+    report(args.messages, elapsed, errors, metrics, sink)
+    return 1 if errors else 0
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+
+class SMTPSink(object):
+    """ Local SMTP server that accepts everything, counts it, and throws it away.
+
+    Runs an asyncio event loop in a background thread:
+
+    ```python
+    from mailem.bench import SMTPSink
+
+    sink = SMTPSink(delay=0.01)  # simulate a relay that takes 10ms to accept a message
+    sink.start()
+
+    postman = Postman('user@example.com', SMTPConnection('localhost', sink.port, None, None))
+    # ... send
+
+    sink.messages  #-> 100
+    sink.stop()
+    ```
+
+    It speaks just enough SMTP for smtplib: EHLO (with 8BITMIME, SMTPUTF8), HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT.
+
+    :param host: Host to listen on
+    :type host: str
+    :param port: Port to listen on; 0 to pick a free one
+    :type port: int
+    :param delay: Seconds to wait before accepting a message
+    :type delay: float
+    """
+
+    def __init__(self, host='localhost', port=0, delay=0):
+        self.host = host
+        self.port = port
+        self.delay = delay
+
+        #: The number of messages received
+        self.messages = 0
+        #: The number of recipients received
+        self.recipients = 0
+        #: The number of message bytes received
+        self.bytes = 0
+        #: The number of sessions
+        self.sessions = 0
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    #region Server
+
+    def start(self):
+        """ Start the server in a background thread, and wait until it's ready """
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name='mailem-sink')
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """ Stop the server """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self, ready):
+        self._loop = loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._server = loop.run_until_complete(
+            asyncio.start_server(self._session, self.host, self.port, limit=1 << 26))
+        self.port = self._server.sockets[0].getsockname()[1]
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            loop.run_until_complete(self._server.wait_closed())
+            loop.close()
+
+    #endregion
+
+    async def _session(self, reader, writer):
+        self.sessions += 1
+        writer.write(b'220 mailem sink ready\r\n')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line[:4].upper()
+
+                if command == b'EHLO':
+                    writer.write(b'250-mailem sink\r\n250-8BITMIME\r\n250-SMTPUTF8\r\n250 PIPELINING\r\n')
+                elif command == b'DATA':
+                    writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                    await writer.drain()
+                    data = await reader.readuntil(b'\r\n.\r\n')
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.messages += 1
+                    self.bytes += len(data) - 5
+                    writer.write(b'250 OK: thrown away\r\n')
+                elif command == b'RCPT':
+                    self.recipients += 1
+                    writer.write(b'250 OK\r\n')
+                elif command in (b'HELO', b'MAIL', b'RSET', b'NOOP'):
+                    writer.write(b'250 OK\r\n')
+                elif command == b'QUIT':
+                    writer.write(b'221 Bye\r\n')
+                    break
+                else:
+                    writer.write(b'502 Command not implemented\r\n')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
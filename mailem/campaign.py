@@ -0,0 +1,266 @@
+import os
+import re
+import time
+import hashlib
+import threading
+
+from .util import Address
+
+
+class Journal(object):
+    """ Append-only journal of message outcomes, for resuming campaigns
+
+    Every outcome is a line: `<status> <Message-ID> <SMTP code>`, where the status is 'sent', 'partial' or 'failed'.
+    Lines are written right away, but are flushed to disk in batches: every `fsync_every` outcomes,
+    or every `fsync_interval` seconds, whichever comes first. Outcomes that were not flushed before a crash
+    are lost, and those messages are sent again: delivery is at-least-once.
+
+    A line torn by a crash is ignored.
+
+    :param path: Journal file path. Created if it does not exist; appended to otherwise.
+    :type path: str
+    :param fsync_every: Flush after this many outcomes
+    :type fsync_every: int
+    :param fsync_interval: Flush when the last flush was this many seconds ago
+    :type fsync_interval: float
+    """
+
+    def __init__(self, path, fsync_every=1000, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        self._file = None
+        self._pending = 0
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+        #: The number of fsync() calls made
+        self.fsyncs = 0
+
+    def read(self):
+        """ Read the outcomes recorded so far
+
+        :return: { Message-ID: status }: the latest outcome of every message
+        :rtype: dict
+        """
+        outcomes = {}
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return outcomes
+        with f:
+            for line in f:
+                fields = line.decode('utf-8', 'replace').split()
+                # Lines torn by a crash are incomplete
+                if line.endswith(b'\n') and len(fields) == 3 and fields[0] in ('sent', 'partial', 'failed'):
+                    outcomes[fields[1]] = fields[0]
+        return outcomes
+
+    def _open(self):
+        if self._file is None:
+            # Terminate a line torn by a crash, so it does not glue to the next one
+            torn = False
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b'\n'
+            self._file = open(self.path, 'ab')
+            if torn:
+                self._file.write(b'\n')
+        return self._file
+
+    def record(self, msgid, status, code=None):
+        """ Record the outcome of a message
+
+        :param msgid: Message-ID
+        :type msgid: str
+        :param status: 'sent', 'partial' (accepted for some recipients only), or 'failed'
+        :type status: str
+        :param code: SMTP reply code, if known
+        :type code: int|None
+        """
+        line = u'{} {} {}\n'.format(status, msgid, code or '-').encode('utf-8')
+        with self._lock:
+            self._open().write(line)
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.time() - self._flushed_at >= self.fsync_interval:
+                self._flush()
+
+    def _flush(self):
+        if self._file is not None and self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        self._pending = 0
+        self._flushed_at = time.time()
+
+    def flush(self):
+        """ Flush recorded outcomes to disk """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """ Flush, and close the file """
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Campaign(object):
+    """ Sends a Template to a long list of recipients, and can resume after a crash without resending.
+
+    With a journal, every message gets a deterministic Message-ID, derived from the campaign name and the recipient.
+    Outcomes are recorded in the [`Journal`](#journal) by Message-ID, and when the campaign is run again,
+    messages that were already accepted are skipped: they're not even rendered.
+    Without a journal, Message-IDs are unique, as usual: receivers drop messages with a Message-ID they've seen.
+
+    Example:
+
+    ```python
+    from mailem.campaign import Campaign, Journal
+
+    campaign = Campaign('newsletter-2016-05', newsletter_template, postman,
+                        Journal('/var/lib/mailem/newsletter-2016-05.journal'))
+
+    stats = campaign.run(([user.email], {'name': user.name}) for user in users)
+    # After a crash, run it again with the same recipients: it continues where it has stopped
+    ```
+
+    Messages that have failed are sent again when resuming. Messages that were accepted for some recipients only
+    (see `PartialDeliveryError`) are not: they're reported as failed, and journaled as 'partial'.
+    Rows that the template fails to render are reported as failed too, and the campaign goes on.
+
+    :param name: Campaign name: letters, digits, '.', '_', '-'. Part of the Message-IDs: keep it for the resume,
+        and never reuse it for another campaign.
+    :type name: str
+    :param template: Template to render messages with
+    :type template: mailem.template.Template
+    :param postman: Postman to send messages with
+    :type postman: mailem.postman.Postman
+    :param journal: Journal of outcomes; `None` to send without one: nothing is skipped, and Message-IDs are random
+    :type journal: Journal|None
+    :param key: Callable(recipients, values) that identifies a message within the campaign.
+        Default: the e-mail addresses of the recipients
+    :type key: callable|None
+    :param domain: Domain for the Message-IDs. Default: the domain of the Postman's sender
+    :type domain: str|None
+    """
+
+    def __init__(self, name, template, postman, journal, key=None, domain=None):
+        assert re.match(r'^[\w.-]+$', name), 'Invalid campaign name: {!r}'.format(name)
+        self.name = name
+        self._template = template
+        self._postman = postman
+        self._journal = journal
+        self._key = key or (lambda recipients, values: ','.join(Address(r).email for r in recipients))
+        self.domain = domain or Address(postman._sender).email.rpartition('@')[2]
+
+    def message_id(self, key):
+        """ Get the Message-ID of a message
+
+        :param key: Message key
+        :type key: str
+        :rtype: str
+        """
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+        return '<{}.{}@{}>'.format(self.name, digest, self.domain)
+
+    def run(self, items, workers=1, on_sent=None, on_failed=None):
+        """ Send the campaign, skipping messages that were accepted by an earlier run
+
+        :param items: Iterable of (recipients, values). Iterated lazily: a generator over a database cursor is fine.
+        :type items: Iterable[tuple]
+        :param workers: The number of threads (connections) to send with
+        :type workers: int
+        :param on_sent: Callback(message) for every message sent
+        :type on_sent: callable|None
+        :param on_failed: Callback(message, exception) for every message that has failed.
+            The message is `None` when the template has failed to render it: the exception tells why.
+        :type on_failed: callable|None
+        :return: { 'sent': int, 'failed': int, 'skipped': int }
+        :rtype: dict
+        """
+        from .connection.smtp import PartialDeliveryError, error_reply
+
+        outcomes = self._journal.read() if self._journal is not None else {}
+        sent = set(msgid for msgid, status in outcomes.items() if status in ('sent', 'partial'))
+        stats = {'sent': 0, 'failed': 0, 'skipped': 0}
+        items = iter(items)
+        lock = threading.Lock()
+        errors = []
+
+        def next_message():
+            """ Get the next message to send, skipping the ones sent already, and failing the ones that won't render """
+            while True:
+                with lock:
+                    for recipients, values in items:
+                        if self._journal is None:
+                            msgid = None  # unique
+                            break
+                        msgid = self.message_id(self._key(recipients, values))
+                        if msgid not in sent:
+                            break
+                        stats['skipped'] += 1
+                    else:
+                        return None
+                try:
+                    return self._template(recipients, values, msgid=msgid)  # render outside of the lock
+                except Exception as e:
+                    # A bad row fails its message, not the campaign
+                    outcome(msgid, None, e)
+
+        def outcome(msgid, message, e=None):
+            if self._journal is None:
+                pass
+            elif e is None:
+                self._journal.record(msgid, 'sent', 250)
+            elif isinstance(e, PartialDeliveryError):
+                self._journal.record(msgid, 'partial', error_reply(e)[0])  # not to be resent
+            else:
+                self._journal.record(msgid, 'failed', error_reply(e)[0])
+            with lock:
+                stats['sent' if e is None else 'failed'] += 1
+            if e is None:
+                if on_sent:
+                    on_sent(message)
+            elif on_failed:
+                on_failed(message, e)
+
+        def worker():
+            from .connection.smtp import is_disconnect_error
+
+            try:
+                with self._postman.connect() as c:
+                    message = next_message()
+                    while message is not None:
+                        try:
+                            c.sendmail(message)
+                        except Exception as e:
+                            outcome(message._msgid, message, e)
+                            if is_disconnect_error(e):
+                                c.reconnect()  # failure to reconnect stops the worker: resume later
+                        else:
+                            outcome(message._msgid, message)
+                        message = next_message()
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            if workers == 1:
+                worker()
+            else:
+                threads = [threading.Thread(target=worker, name='mailem-campaign-{}'.format(i))
+                           for i in range(workers)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        finally:
+            if self._journal is not None:
+                self._journal.flush()
+
+        if errors:
+            raise errors[0]
+        return stats
@@ -1,4 +1,16 @@
 """ Connection object represents a connection to a service which can send e-mail messages for us. """
 
-from .smtp import SMTPConnection
-from .lo import LoopbackConnection
+from ..util import lazy_imports
+
+# Connections are imported on first use: `SMTPConnection` pulls in smtplib and ssl
+__getattr__ = lazy_imports(__name__, {
+    'SMTPConnection': ('.smtp', 'SMTPConnection'),
+    'LoopbackConnection': ('.lo', 'LoopbackConnection'),
+    'MultiConnection': ('.multi', 'MultiConnection'),
+    'PooledConnection': ('.pool', 'PooledConnection'),
+    'BlackholeConnection': ('.blackhole', 'BlackholeConnection'),
+    'MXConnection': ('.mx', 'MXConnection'),
+})
+
+__all__ = ['SMTPConnection', 'LoopbackConnection', 'MultiConnection', 'PooledConnection', 'BlackholeConnection',
+           'MXConnection']
@@ -1,17 +1,56 @@
 class IConnection(object):
     """ Interface for connection objects """
 
+    #: Metrics collector
+    #: :type: mailem.metrics.IMetrics|None
+    metrics = None
+
+    def set_metrics(self, metrics):
+        """ Install a metrics collector
+
+        :type metrics: mailem.metrics.IMetrics|None
+        """
+        self.metrics = metrics
+
+    #: DKIM signer
+    #: :type: mailem.dkim.DKIMSigner|None
+    dkim = None
+
+    def set_dkim(self, dkim):
+        """ Install a DKIM signer: messages are signed right after they're serialized
+
+        :type dkim: mailem.dkim.DKIMSigner|None
+        """
+        self.dkim = dkim
+
     def connect(self):
-        """ Establish a connection """
+        """ Establish a connection
+
+        :return: Client object
+        """
         raise NotImplementedError()
 
-    def disconnect(self):
+    def disconnect(self, client):
         """ Terminate the connection """
         raise NotImplementedError()
 
-    def sendmail(self, message):
+    def discard(self, client):
+        """ Terminate a connection that has failed, and is not usable anymore
+
+        Errors are ignored: it's most likely dead already.
+        """
+        try:
+            self.disconnect(client)
+        except Exception:
+            pass
+
+    def warmup(self, n=None, wait=False):
+        """ Open connections ahead of time, if supported """
+        pass
+
+    def sendmail(self, client, message):
         """ Send the message
 
-        :type msg: Message
+        :type message: Message
         """
         raise NotImplementedError()
@@ -0,0 +1,75 @@
+import time
+import threading
+
+from .base import IConnection
+from .smtp import prepare_message
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class BlackholeConnection(IConnection):
+    """ Blackhole connection: prepares every message for the wire exactly as `SMTPConnection` does, and throws it away.
+
+    Unlike `LoopbackConnection`, which only records the `Message` objects, this one pays the full CPU cost
+    of building and serializing messages: use it to benchmark everything except the network.
+
+    ```python
+    from mailem import Postman
+    from mailem.connection import BlackholeConnection
+
+    blackhole = BlackholeConnection()
+    postman = Postman('user@example.com', blackhole)
+
+    with postman.connect() as c:
+        for msg in messages:
+            c.sendmail(msg)
+
+    blackhole.messages  #-> 1000
+    blackhole.bytes  #-> 10485760
+    blackhole.seconds  #-> 0.95: time spent preparing messages
+    ```
+
+    It is thread-safe, so it can be shared by concurrent senders.
+
+    :param eightbit: Pretend the server supports 8BITMIME
+    :type eightbit: bool
+    :param utf8: Pretend the server supports SMTPUTF8
+    :type utf8: bool
+    """
+
+    def __init__(self, eightbit=True, utf8=False):
+        self.eightbit = eightbit
+        self.utf8 = eightbit and utf8
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Reset the counters """
+        with self._lock:
+            #: The number of messages sent
+            self.messages = 0
+            #: The number of envelope recipients
+            self.recipients = 0
+            #: The number of bytes that would have been transmitted
+            self.bytes = 0
+            #: Seconds spent preparing messages
+            self.seconds = 0.0
+
+    def connect(self):
+        pass
+
+    def disconnect(self, client):
+        pass
+
+    def sendmail(self, client, message):
+        start = _clock()
+        sender, recipients, message_bytes, mail_options = prepare_message(
+            message, self.eightbit, self.utf8, self.metrics, dkim=self.dkim)
+        seconds = _clock() - start
+
+        with self._lock:
+            self.messages += 1
+            self.recipients += len(recipients)
+            self.bytes += len(message_bytes)
+            self.seconds += seconds
@@ -1,3 +1,7 @@
+import threading
+import itertools
+from collections import defaultdict, deque
+
 from .base import IConnection
 
 
@@ -47,10 +51,47 @@ class LoopbackConnection(list, IConnection):
     ```
 
     Also note that `LoopbackConnection` subclasses `list`, so all list methods, including iteration, is available.
+
+    For high-volume tests, the loopback can be bounded, and indexed:
+
+    ```python
+    with postman.loopback(maxlen=1000) as lo:  # keep only the latest 1000 messages
+        # ... send 100000 messages
+
+    lo.sent  #-> 100000
+    len(lo)  #-> 1000
+    lo.find(recipient='user@example.com')  #-> [Message, ...]
+    lo.find(subject=u'Welcome!')
+    lo.find(msgid=msg._msgid)
+    ```
+
+    A bounded loopback keeps its messages in a ring buffer, and is a read-only list:
+    `len()`, iteration, indexing, slicing, comparison, `index()` and `count()` are available.
+
+    With `store=False`, messages are only counted: see `sent` and `recipients`.
+
+    :param maxlen: Keep only the latest `maxlen` messages; `None` for no limit
+    :type maxlen: int|None
+    :param store: Keep the messages. When `False`, only the counters are updated
+    :type store: bool
     """
 
-    def __init__(self):
+    def __init__(self, maxlen=None, store=True):
         super(LoopbackConnection, self).__init__()
+        self.maxlen = maxlen
+        self.store = store
+
+        #: Bounded mode: the ring buffer of messages, the oldest at the left. Otherwise, messages are in the list
+        self._ring = deque(maxlen=maxlen) if maxlen is not None else None
+
+        #: The number of messages sent through the loopback, including those no longer kept
+        self.sent = 0
+        #: The number of envelope recipients of all messages sent through the loopback
+        self.recipients = 0
+
+        #: Indexes: { index name: { key: deque([ message, ... ]) } }, the oldest messages at the left
+        self._indexes = {name: defaultdict(deque) for name in self._index_keys}
+        self._lock = threading.Lock()
 
     def connect(self):
         pass
@@ -59,16 +100,140 @@ class LoopbackConnection(list, IConnection):
         pass
 
     def sendmail(self, client, message):
-        self.append(message)
+        with self._lock:
+            self.sent += 1
+            self.recipients += len(message._envelope())
+            if not self.store or self.maxlen == 0:
+                return
+
+            if self._ring is None:
+                self.append(message)
+            else:
+                if len(self._ring) >= self.maxlen:
+                    self._unindex(self._ring[0])  # evicted by the append
+                self._ring.append(message)
+            self._index(message)
+
+    #region Indexes
+
+    #: Index name -> function that gets the keys of a message
+    _index_keys = {
+        'recipient': lambda m: {a.email.lower() for a in itertools.chain(m._recipients, m._cc, m._bcc)},
+        'subject': lambda m: (m._subject,),
+        'msgid': lambda m: (m._msgid,),
+    }
+
+    def _index(self, message):
+        for name, keys in self._index_keys.items():
+            index = self._indexes[name]
+            for key in keys(message):
+                index[key].append(message)
+
+    def _unindex(self, message):
+        """ Remove the oldest message from the indexes """
+        for name, keys in self._index_keys.items():
+            index = self._indexes[name]
+            for key in keys(message):
+                messages = index[key]
+                messages.popleft()  # the oldest message is always the leftmost
+                if not messages:
+                    del index[key]
+
+    def find(self, recipient=None, subject=None, msgid=None):
+        """ Find the kept messages by recipient, subject, or Message-ID
+
+        When multiple criteria are given, messages should match all of them.
+        Only the messages sent with `sendmail()` are indexed.
+
+        :param recipient: E-mail address of a recipient (To, Cc or Bcc). Case-insensitive
+        :type recipient: basestring|None
+        :param subject: Message subject
+        :type subject: basestring|None
+        :param msgid: Message-ID
+        :type msgid: basestring|None
+        :return: Messages, in send order
+        :rtype: list[mailem.Message]
+        """
+        criteria = [(name, key) for name, key in (('recipient', recipient.lower() if recipient else None),
+                                                  ('subject', subject),
+                                                  ('msgid', msgid))
+                    if key is not None]
+        assert criteria, 'At least one criterion is required'
+
+        with self._lock:
+            candidates = [self._indexes[name].get(key, ()) for name, key in criteria]
+            candidates.sort(key=len)
+            if len(candidates) == 1:
+                return list(candidates[0])
+            matching = set.intersection(*(set(map(id, c)) for c in candidates[1:]))
+            return [m for m in candidates[0] if id(m) in matching]
+
+    #endregion
 
     #region Access messages
 
+    # In bounded mode, the list is empty, and reading methods look into the ring buffer
+
+    def __len__(self):
+        return list.__len__(self) if self._ring is None else len(self._ring)
+
+    def __iter__(self):
+        return list.__iter__(self) if self._ring is None else iter(self._ring)
+
+    def __reversed__(self):
+        return list.__reversed__(self) if self._ring is None else reversed(self._ring)
+
+    def __contains__(self, message):
+        return list.__contains__(self, message) if self._ring is None else message in self._ring
+
+    def __getitem__(self, index):
+        if self._ring is None:
+            return list.__getitem__(self, index)
+        if isinstance(index, slice):
+            return list(self._ring)[index]
+        return self._ring[index]
+
+    def __getslice__(self, i, j):  # Python 2
+        return self.__getitem__(slice(i, j))
+
+    def __eq__(self, other):
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return list.__repr__(self) if self._ring is None else repr(list(self._ring))
+
+    def index(self, message, *args):
+        return list.index(self, message, *args) if self._ring is None else list(self._ring).index(message, *args)
+
+    def count(self, message):
+        return list.count(self, message) if self._ring is None else self._ring.count(message)
+
     def get_messages(self):
         """ Get all messages and reset the internal queue
 
-        :return: List of recorded messages
+        :return: List of recorded messages, in send order
         :rtype: list[mailem.Message]
         """
-        return [self.pop() for i in range(len(self))]
+        with self._lock:
+            if self._ring is None:
+                messages = self[:]
+                del self[:]
+            else:
+                messages = list(self._ring)
+                self._ring.clear()
+            for index in self._indexes.values():
+                index.clear()
+        return messages
 
     #endregion
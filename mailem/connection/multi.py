@@ -0,0 +1,213 @@
+import time
+import threading
+
+from .base import IConnection
+from .smtp import is_transient_error
+
+
+class Relay(object):
+    """ A single relay within a `MultiConnection`, and its health state
+
+    :param connection: Connection to the relay
+    :type connection: mailem.connection.IConnection
+    :param weight: Relay weight: how much traffic it gets compared to the others
+    :type weight: int
+    """
+
+    def __init__(self, connection, weight=1):
+        assert weight > 0, 'Relay weight should be positive'
+        self.connection = connection
+        self.weight = weight
+
+        #: Consecutive failures count
+        self.failures = 0
+        #: Time until which the relay is considered dead
+        self.down_until = 0
+        #: Number of messages being sent through this relay right now
+        self.outstanding = 0
+        #: Smooth weighted round-robin: current weight
+        self._current_weight = 0
+
+    def is_up(self, now):
+        return self.down_until <= now
+
+    def __repr__(self):
+        return 'Relay({!r}, weight={})'.format(self.connection, self.weight)
+
+
+class MultiConnection(IConnection):
+    """ Composite connection which spreads messages over multiple relays, and fails over when one goes down.
+
+    Example:
+
+    ```python
+    from mailem import Postman
+    from mailem.connection import SMTPConnection, MultiConnection
+
+    postman = Postman('user@example.com',
+                  MultiConnection([
+                      (SMTPConnection('smtp1.example.com', 587, 'user', 'pass', tls=True), 2),  # weight=2
+                      SMTPConnection('smtp2.example.com', 587, 'user', 'pass', tls=True),
+                  ]))
+
+    with postman.connect() as c:
+        for msg in messages:
+            c.sendmail(msg)
+    ```
+
+    Sessions to relays are opened lazily, when a relay is first picked within a `connect()` block.
+
+    Health is tracked passively: a relay that fails `max_failures` times in a row is considered dead for `cooldown`
+    seconds, and gets no traffic. Any successful send resets its failure counter.
+
+    When a relay fails with a transient error (disconnect, timeout, 4xx reply), the very same message is re-sent
+    through another relay, so no messages are lost mid-batch. Permanent errors (5xx) are raised immediately:
+    they are about the message, not about the relay.
+    When all relays have failed, the last error is raised.
+
+    :param relays: List of connections, or (connection, weight) tuples
+    :type relays: Iterable[mailem.connection.IConnection|tuple]
+    :param strategy: Load balancing strategy:
+        'round-robin' (weighted round-robin), or 'least-outstanding' (relay with the least messages in flight,
+        useful when the connection is shared between threads)
+    :type strategy: str
+    :param max_failures: The number of consecutive failures after which a relay is considered dead
+    :type max_failures: int
+    :param cooldown: The number of seconds a dead relay gets no traffic
+    :type cooldown: float
+    """
+
+    STRATEGIES = ('round-robin', 'least-outstanding')
+
+    def __init__(self, relays, strategy='round-robin', max_failures=1, cooldown=30.0):
+        assert strategy in self.STRATEGIES, 'Unknown strategy: {}'.format(strategy)
+        self.relays = [Relay(*r) if isinstance(r, tuple) else Relay(r) for r in relays]
+        assert self.relays, 'At least one relay is required'
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    #region Relay selection
+
+    def _pick(self, exclude):
+        """ Pick a relay to send the next message through
+
+        :param exclude: Relays that have already been tried
+        :type exclude: set[Relay]
+        :rtype: Relay|None
+        """
+        with self._lock:
+            now = time.time()
+            candidates = [r for r in self.relays if r not in exclude]
+            if not candidates:
+                return None
+
+            # Prefer live relays. When all are dead, try the one that is going to recover first.
+            alive = [r for r in candidates if r.is_up(now)]
+            if not alive:
+                relay = min(candidates, key=lambda r: r.down_until)
+            elif self.strategy == 'least-outstanding':
+                relay = min(alive, key=lambda r: float(r.outstanding) / r.weight)
+            else:
+                # Smooth weighted round-robin: evenly interleaves relays according to their weights
+                total = 0
+                for r in alive:
+                    r._current_weight += r.weight
+                    total += r.weight
+                relay = max(alive, key=lambda r: r._current_weight)
+                relay._current_weight -= total
+
+            relay.outstanding += 1
+            return relay
+
+    def _report(self, relay, success):
+        """ Report the outcome of a send through the relay """
+        with self._lock:
+            relay.outstanding -= 1
+            if success:
+                relay.failures = 0
+                relay.down_until = 0
+            else:
+                relay.failures += 1
+                if relay.failures >= self.max_failures:
+                    relay.down_until = time.time() + self.cooldown
+
+    #endregion
+
+    def connect(self):
+        return _MultiClient()
+
+    def disconnect(self, client):
+        for relay, session in list(client.sessions.items()):
+            del client.sessions[relay]
+            try:
+                relay.connection.disconnect(session)
+            except Exception:
+                pass  # one bad relay should not prevent closing the others
+
+    def discard(self, client):
+        for relay in list(client.sessions):
+            self._drop_session(client, relay)
+
+    def set_metrics(self, metrics):
+        super(MultiConnection, self).set_metrics(metrics)
+        for relay in self.relays:
+            relay.connection.set_metrics(metrics)
+
+    def set_dkim(self, dkim):
+        super(MultiConnection, self).set_dkim(dkim)
+        for relay in self.relays:
+            relay.connection.set_dkim(dkim)
+
+    def warmup(self, n=None, wait=False):
+        for relay in self.relays:
+            relay.connection.warmup(n, wait)
+
+    def _drop_session(self, client, relay):
+        """ Close a broken session to a relay """
+        relay.connection.discard(client.sessions.pop(relay))
+
+    def sendmail(self, client, message):
+        tried = set()
+        while True:
+            relay = self._pick(tried)
+            if relay is None:
+                raise error  # all relays have failed
+            tried.add(relay)
+
+            # Lazy connect
+            try:
+                session = client.sessions.get(relay)
+                if session is None:
+                    session = client.sessions[relay] = relay.connection.connect()
+            except Exception as e:
+                # Can't connect: the relay is at fault
+                self._report(relay, False)
+                error = e
+                continue
+
+            # Send
+            try:
+                relay.connection.sendmail(session, message)
+            except Exception as e:
+                if not is_transient_error(e):
+                    # Permanent errors are about the message: the relay is fine
+                    self._report(relay, True)
+                    raise
+
+                # The session is broken: try another relay
+                self._report(relay, False)
+                self._drop_session(client, relay)
+                error = e
+            else:
+                self._report(relay, True)
+                return
+
+
+class _MultiClient(object):
+    """ Client object for MultiConnection: holds sessions to individual relays """
+
+    def __init__(self):
+        #: Open sessions: { Relay: client }
+        self.sessions = {}
@@ -0,0 +1,287 @@
+import time
+import smtplib
+import threading
+from collections import OrderedDict
+
+from .base import IConnection
+from .smtp import SMTPConnection, PartialDeliveryError, is_transient_error, is_disconnect_error, error_reply
+from .pool import PooledConnection
+
+
+#region Resolvers
+
+class IResolver(object):
+    """ Interface for MX resolvers """
+
+    def resolve(self, domain):
+        """ Get the mail servers of a domain
+
+        :param domain: Domain name
+        :type domain: str
+        :return: (list of hosts, most preferred first; time to live, seconds).
+            A host is a hostname, or a (hostname, port) tuple.
+            An empty list means there are no MX records: the domain itself is used (RFC 5321, 5.1).
+        :rtype: (list[str|tuple], float)
+        :raises LookupError: The domain does not exist
+        """
+        raise NotImplementedError()
+
+
+class StaticResolver(IResolver):
+    """ Resolver with a fixed table: for tests, and for routing some domains to known hosts
+
+    ```python
+    StaticResolver({
+        'example.com': ['mx1.example.com', 'mx2.example.com'],
+        'example.org': [('localhost', 2525)],
+    })
+    ```
+
+    :param table: { domain: [ host, ... ] }. Unknown domains raise `LookupError`.
+    :type table: dict
+    :param ttl: Time to live for the answers, seconds
+    :type ttl: float
+    """
+
+    def __init__(self, table, ttl=300.0):
+        self.table = table
+        self.ttl = ttl
+
+    def resolve(self, domain):
+        try:
+            return list(self.table[domain]), self.ttl
+        except KeyError:
+            raise LookupError('Unknown domain: {}'.format(domain))
+
+
+class DNSResolver(IResolver):
+    """ Resolves MX records with [dnspython](https://www.dnspython.org/), which is an optional dependency
+
+    :param resolver: dnspython resolver to use. Default: the system resolver
+    :type resolver: dns.resolver.Resolver|None
+    """
+
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+
+    def resolve(self, domain):
+        import dns.resolver
+
+        resolver = self.resolver or dns.resolver.get_default_resolver()
+        try:
+            answer = resolver.resolve(domain, 'MX')
+        except dns.resolver.NXDOMAIN:
+            raise LookupError('Domain does not exist: {}'.format(domain))
+        except dns.resolver.NoAnswer:
+            return [], 300.0
+        records = sorted(answer, key=lambda r: r.preference)
+        return [r.exchange.to_text(omit_final_dot=True) for r in records], answer.rrset.ttl
+
+#endregion
+
+
+class MXConnection(IConnection):
+    """ Direct-to-MX delivery: sends straight to the mail servers of recipient domains, without a smart host.
+
+    For every message, recipients are grouped by domain, and every domain gets a single transaction
+    with all of its recipients. MX records are cached for their TTL, and every mail server has its own
+    pool of sessions ([`PooledConnection`](#pooledconnection)), which is shared by all `connect()` blocks.
+
+    Example:
+
+    ```python
+    from mailem import Postman
+    from mailem.connection import MXConnection
+
+    postman = Postman('user@example.com',
+                  MXConnection(local_hostname='mail.example.com'))  # resolves with dnspython
+
+    with postman.connect() as c:
+        c.sendmail(msg)
+    ```
+
+    When a mail server can't be reached, or fails with a transient error, the next one (by MX preference) is tried.
+
+    When delivery fails for some domains, but not for the others, `PartialDeliveryError` is raised
+    with the recipients that have failed, and those that have accepted the message. It's never retried
+    as a whole: retry the failed recipients only. When delivery fails for all domains,
+    `smtplib.SMTPRecipientsRefused` is raised; when all recipients are at a single domain, its error is raised as is.
+
+    :param resolver: MX resolver. Default: `DNSResolver`
+    :type resolver: IResolver|None
+    :param port: SMTP port of mail servers
+    :type port: int
+    :param max_ttl: Cache MX records for at most this many seconds
+    :type max_ttl: float
+    :param pool_size: The number of idle sessions to keep for every mail server
+    :type pool_size: int
+    :param max_idle_time: The maximum number of seconds a session can be idle to be reused
+    :type max_idle_time: float
+    :param connection_factory: Callable(host, port) that creates a connection to a mail server.
+        Default: `SMTPConnection` with no authentication, and `smtp_kwargs`
+    :type connection_factory: callable|None
+    :param smtp_kwargs: Arguments for `SMTPConnection`: `local_hostname`, `tls`, timeouts, ...
+    """
+
+    def __init__(self, resolver=None, port=25, max_ttl=3600.0, pool_size=2, max_idle_time=30.0,
+                 connection_factory=None, **smtp_kwargs):
+        self.resolver = resolver or DNSResolver()
+        self.port = port
+        self.max_ttl = max_ttl
+        self.pool_size = pool_size
+        self.max_idle_time = max_idle_time
+        self._connection_factory = connection_factory or (
+            lambda host, port: SMTPConnection(host, port, None, None, **smtp_kwargs))
+
+        #: MX cache: { domain: (expires, hosts) }
+        self._mx = {}
+        #: Session pools: { (host, port): PooledConnection }
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    #region Routing
+
+    def _resolve(self, domain):
+        """ Get the mail servers of a domain, using the cache
+
+        :return: [ (host, port) ]
+        :rtype: list[tuple]
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._mx.get(domain)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        hosts, ttl = self.resolver.resolve(domain)
+        hosts = [h if isinstance(h, tuple) else (h, self.port) for h in hosts] or [(domain, self.port)]
+        with self._lock:
+            self._mx[domain] = (now + min(ttl, self.max_ttl), hosts)
+        return hosts
+
+    def _pool(self, host):
+        """ Get the session pool for a mail server
+
+        :type host: tuple
+        :rtype: PooledConnection
+        """
+        with self._lock:
+            pool = self._pools.get(host)
+            if pool is None:
+                pool = self._pools[host] = PooledConnection(self._connection_factory(*host), self.pool_size,
+                                                            max_idle_time=self.max_idle_time)
+                if self.metrics is not None:
+                    pool.set_metrics(self.metrics)
+                if self.dkim is not None:
+                    pool.set_dkim(self.dkim)
+            return pool
+
+    @staticmethod
+    def _group(message):
+        """ Group the envelope recipients of a message by domain
+
+        :return: { domain: [ email ] }, in the order of appearance
+        :rtype: collections.OrderedDict
+        """
+        domains = OrderedDict()
+        for email in message._envelope():
+            domains.setdefault(email.rpartition('@')[2], []).append(email)
+        return domains
+
+    #endregion
+
+    def connect(self):
+        return _MXClient()
+
+    def disconnect(self, client):
+        for host, session in list(client.sessions.items()):
+            del client.sessions[host]
+            self._pool(host).disconnect(session)  # back to the pool
+
+    def discard(self, client):
+        for host, session in list(client.sessions.items()):
+            del client.sessions[host]
+            self._pool(host).discard(session)
+
+    def set_metrics(self, metrics):
+        super(MXConnection, self).set_metrics(metrics)
+        with self._lock:
+            for pool in self._pools.values():
+                pool.set_metrics(metrics)
+
+    def set_dkim(self, dkim):
+        super(MXConnection, self).set_dkim(dkim)
+        with self._lock:
+            for pool in self._pools.values():
+                pool.set_dkim(dkim)
+
+    def close(self):
+        """ Close all idle sessions """
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+    def _send_to(self, client, host, message, recipients):
+        """ Send a message to a mail server. A pooled session that turns out to be dead is replaced once. """
+        pool = self._pool(host)
+        for attempt in (0, 1):
+            session = client.sessions.get(host)
+            reused = session is not None
+            if not reused:
+                session = client.sessions[host] = pool.connect()
+            try:
+                pool.connection.sendmail(session, message, recipients)
+                return
+            except Exception as e:
+                if is_transient_error(e):
+                    pool.discard(client.sessions.pop(host))  # not worth reusing
+                if not (reused and is_disconnect_error(e)):
+                    raise
+
+    def _send_domain(self, client, domain, message, recipients):
+        """ Send a message to the recipients at a domain, trying its mail servers in order """
+        try:
+            hosts = self._resolve(domain)
+        except LookupError as e:
+            raise smtplib.SMTPRecipientsRefused({r: (550, str(e).encode()) for r in recipients})
+        except Exception as e:
+            # DNS failures are temporary
+            raise smtplib.SMTPConnectError(451, 'Failed to resolve {}: {!r}'.format(domain, e).encode())
+
+        error = None
+        for host in hosts:
+            try:
+                self._send_to(client, host, message, recipients)
+                return
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                error = e  # try the next mail server
+        raise error
+
+    def sendmail(self, client, message):
+        domains = self._group(message)
+        failed = {}
+        accepted = []
+        for domain, recipients in domains.items():
+            try:
+                self._send_domain(client, domain, message, recipients)
+            except Exception as e:
+                if len(domains) == 1:
+                    raise
+                failed.update({r: error_reply(e) for r in recipients})
+            else:
+                accepted.extend(recipients)
+        if failed and accepted:
+            raise PartialDeliveryError(failed, accepted)
+        if failed:
+            raise smtplib.SMTPRecipientsRefused(failed)
+
+
+class _MXClient(object):
+    """ Client object for MXConnection: holds sessions to mail servers """
+
+    def __init__(self):
+        #: Open sessions: { (host, port): client }
+        self.sessions = {}
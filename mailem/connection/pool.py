@@ -0,0 +1,178 @@
+import time
+import threading
+from collections import deque
+
+from .base import IConnection
+
+
+class PooledConnection(IConnection):
+    """ Connection pool: keeps authenticated sessions open between `connect()` blocks, and opens them ahead of time.
+
+    Opening an SMTP session costs DNS, TCP, TLS and AUTH round-trips. With a pool, `postman.connect()` takes a ready
+    session, and returning it puts it back to the pool instead of saying QUIT.
+
+    Example:
+
+    ```python
+    from mailem import Postman
+    from mailem.connection import SMTPConnection, PooledConnection
+
+    postman = Postman('user@example.com',
+                  PooledConnection(SMTPConnection(...), size=4, min_idle=2),
+                  reconnect=1)  # idle sessions might have been dropped by the server
+
+    # At process start: open the sessions in the background
+    postman.warmup()
+
+    # Later: returns immediately with a ready session
+    with postman.connect() as c:
+        c.sendmail(msg)
+    ```
+
+    Sessions that have been idle for longer than `max_idle_time` are not reused: servers drop idle sessions anyway.
+    Sessions that have failed (the `connect()` block has raised, or its last message has failed) are not reused
+    either: they may be in the middle of a transaction.
+    Still, a pooled session may turn out to be dead: use `Postman(reconnect=1)` to handle that transparently.
+
+    :param connection: The connection to pool the sessions of
+    :type connection: mailem.connection.IConnection
+    :param size: The maximum number of idle sessions to keep
+    :type size: int
+    :param min_idle: When the number of idle sessions gets below this, the pool is refilled in the background
+    :type min_idle: int
+    :param max_idle_time: The maximum number of seconds a session can be idle to be reused
+    :type max_idle_time: float
+    """
+
+    def __init__(self, connection, size=4, min_idle=0, max_idle_time=60.0):
+        assert min_idle <= size, 'min_idle should not exceed the pool size'
+        self.connection = connection
+        self.size = size
+        self.min_idle = min_idle
+        self.max_idle_time = max_idle_time
+
+        #: Idle sessions: [ (client, idle since) ]; the freshest at the right
+        self._idle = deque()
+        self._lock = threading.Lock()
+        #: Background warm-up thread, if running
+        self._warmer = None
+        #: The number of sessions the warm-up thread should have in the pool
+        self._warmup_target = 0
+
+    def __len__(self):
+        """ The number of idle sessions """
+        return len(self._idle)
+
+    #region Warm-up
+
+    def warmup(self, n=None, wait=False):
+        """ Open sessions ahead of time, in a background thread
+
+        Connection errors are ignored: `connect()` will report them anyway.
+
+        :param n: The number of idle sessions to have. Default: the pool size
+        :type n: int|None
+        :param wait: Wait until the sessions are ready
+        :type wait: bool
+        """
+        n = self.size if n is None else min(n, self.size)
+        with self._lock:
+            self._warmup_target = max(self._warmup_target, n)
+            if self._warmer is None:
+                self._warmer = threading.Thread(target=self._warmup_thread, name='mailem-warmup')
+                self._warmer.daemon = True
+                self._warmer.start()
+            warmer = self._warmer
+        if wait:
+            warmer.join()
+
+    def _warmup_thread(self):
+        try:
+            while True:
+                with self._lock:
+                    # Check and stop under the lock `warmup()` raises the target with: a new target is never lost
+                    if len(self._idle) >= self._warmup_target:
+                        self._warmer = None
+                        self._warmup_target = 0
+                        return
+                try:
+                    client = self.connection.connect()
+                except Exception:
+                    return
+                if not self._put(client):
+                    return
+        finally:
+            with self._lock:
+                # Gave up on errors: the next `warmup()` starts over
+                if self._warmer is threading.current_thread():
+                    self._warmer = None
+                    self._warmup_target = 0
+
+    #endregion
+
+    def _put(self, client):
+        """ Put a session into the pool, or close it if the pool is full
+
+        :return: Whether it was put into the pool
+        :rtype: bool
+        """
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((client, time.time()))
+                return True
+        self.connection.discard(client)
+        return False
+
+    def _get(self):
+        """ Get a fresh idle session from the pool
+
+        :rtype: object|None
+        """
+        stale = []
+        client = None
+        with self._lock:
+            min_time = time.time() - self.max_idle_time
+            while self._idle:
+                c, since = self._idle.pop()
+                if since >= min_time:
+                    client = c
+                    break
+                stale.append(c)
+            low = len(self._idle) < self.min_idle
+
+        for c in stale:
+            self.connection.discard(c)
+        if low:
+            self.warmup(self.min_idle)
+        return client
+
+    def close(self):
+        """ Close all idle sessions """
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for client, since in idle:
+            self.connection.discard(client)
+
+    def set_metrics(self, metrics):
+        super(PooledConnection, self).set_metrics(metrics)
+        self.connection.set_metrics(metrics)
+
+    def set_dkim(self, dkim):
+        super(PooledConnection, self).set_dkim(dkim)
+        self.connection.set_dkim(dkim)
+
+    def connect(self):
+        client = self._get()
+        if client is None:
+            client = self.connection.connect()
+        return client
+
+    def disconnect(self, client):
+        self._put(client)  # a clean session: failed ones are discarded
+
+    def discard(self, client):
+        self.connection.discard(client)
+
+    def sendmail(self, client, message):
+        return self.connection.sendmail(client, message)
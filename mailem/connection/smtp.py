@@ -1,8 +1,240 @@
+import ssl
+import sys
+import time
+import socket
 import smtplib
-import itertools
-from future.utils import PY2
 
 from .base import IConnection
+from ..metrics import timer
+
+PY2 = sys.version_info[0] == 2
+
+
+class PartialDeliveryError(smtplib.SMTPRecipientsRefused):
+    """ The message was accepted for some recipients, but not for the others.
+
+    Never retried as a whole, as the recipients that have accepted it would get duplicates:
+    neither `is_transient_error()` nor `is_disconnect_error()` hold for it.
+    To retry, send the message again to the failed recipients only.
+
+    :param recipients: The recipients that have failed: { email: (code, message) }
+    :type recipients: dict
+    :param accepted: The recipients that have accepted the message
+    :type accepted: list[str]
+    """
+
+    def __init__(self, recipients, accepted):
+        super(PartialDeliveryError, self).__init__(recipients)
+        self.accepted = accepted
+
+
+def is_transient_error(e):
+    """ Tell whether an exception, raised while talking to an SMTP server, is a temporary failure.
+
+    Transient failures are worth retrying later, or through another server:
+
+    * 4xx replies (e.g. "421 Too many messages", "451 Try again later")
+    * Disconnects, timeouts, connection resets
+
+    Everything else is permanent: 5xx replies, refused recipients, authentication errors,
+    and partial deliveries (`PartialDeliveryError`): retrying those would duplicate the message.
+
+    :param e: The exception
+    :type e: Exception
+    :rtype: bool
+    """
+    if isinstance(e, PartialDeliveryError):
+        return False
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, msg in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPException):
+        return False
+    return isinstance(e, (socket.error, socket.timeout))
+
+
+def is_disconnect_error(e):
+    """ Tell whether an exception means that the SMTP session is gone, but a new one might work.
+
+    This is the case with dropped idle connections, "421 Too many messages on this connection", and network errors.
+    Never the case with partial deliveries (`PartialDeliveryError`): the message has been sent to someone already.
+
+    :param e: The exception
+    :type e: Exception
+    :rtype: bool
+    """
+    if isinstance(e, PartialDeliveryError):
+        return False
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return any(code == 421 for code, msg in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code == 421
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPException):
+        return False
+    return isinstance(e, (socket.error, socket.timeout))
+
+
+def error_reply(e):
+    """ Describe an exception as an SMTP reply: (code, message)
+
+    SMTP errors keep the server's reply (the lowest one, for refused recipients).
+    Other errors get 451 when they're transient (see `is_transient_error()`), and 554 otherwise.
+
+    :param e: The exception
+    :type e: Exception
+    :rtype: (int, bytes)
+    """
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code, e.smtp_error
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return min(e.recipients.values())
+    if is_transient_error(e):
+        return 451, str(e).encode()
+    return 554, str(e).encode()
+
+
+def prepare_message(message, eightbit=False, utf8=False, metrics=None, recipients=None, dkim=None):
+    """ Prepare a message for the wire: the envelope, and the serialized message
+
+    :param message: The message
+    :type message: mailem.Message
+    :param eightbit: The server supports 8BITMIME
+    :type eightbit: bool
+    :param utf8: The server supports SMTPUTF8
+    :type utf8: bool
+    :param metrics: Metrics collector to report the 'build', 'serialize' and 'sign' stages to
+    :type metrics: mailem.metrics.IMetrics|None
+    :param recipients: Envelope recipients. Default: all message recipients (To, Cc, Bcc), with no duplicates
+    :type recipients: list[str]|None
+    :param dkim: DKIM signer
+    :type dkim: mailem.dkim.DKIMSigner|None
+    :return: (sender, recipients, message bytes, MAIL FROM options)
+    :rtype: (str, list[str], bytes, list[str])
+    """
+    if PY2:
+        utf8 = False  # Python 2 can't write raw UTF-8 headers
+    mail_options = []
+    if eightbit:
+        mail_options.append('BODY=8BITMIME')
+    if utf8:
+        mail_options.append('SMTPUTF8')
+    message_bytes = message._serialize(eightbit, utf8, metrics)
+
+    if dkim is not None:
+        with timer(metrics, 'sign'):
+            # The body only depends on the contents, and the encodings: no need to hash it again
+            message_bytes = dkim.sign(message_bytes, body_key=(message._digest(), eightbit, utf8))
+
+    if recipients is None:
+        recipients = message._envelope(utf8)
+
+    sender = message._sender.email if utf8 else message._sender.ascii_email
+    return sender, recipients, message_bytes, mail_options
+
+
+def get_size_limit(client):
+    """ Get the message size limit advertised by an SMTP server with the SIZE extension (RFC 1870)
+
+    :param client: SMTP client, after EHLO
+    :type client: smtplib.SMTP
+    :return: The limit, bytes; `None` when there's none
+    :rtype: int|None
+    """
+    try:
+        return int(client.esmtp_features.get('size', '')) or None
+    except ValueError:
+        return None
+
+
+def _too_big(message, limit):
+    """ The error for a message over the server's size limit: same as the server would reply with """
+    return smtplib.SMTPSenderRefused(
+        552, '5.3.4 Message size exceeds fixed maximum message size: {} bytes'.format(limit).encode('ascii'),
+        message._sender.ascii_email)
+
+
+class _DeadlineMixin:
+    """ smtplib client with a read timeout, and a deadline on a whole exchange.
+
+    Before every command and every reply, the socket timeout is set to whatever is left before the deadline,
+    so the total time of a multi-step exchange (EHLO, STARTTLS, AUTH, DATA) stays bounded.
+
+    Not derived from `object`: smtplib classes are old-style on Python 2, and `object.__init__` would shadow theirs.
+    """
+
+    #: Read timeout: seconds
+    read_timeout = None
+    #: Deadline: absolute time
+    deadline = None
+    #: The socket timeout set on connect
+    _base_timeout = None
+
+    def set_deadline(self, seconds):
+        """ Set a deadline for the following exchange
+
+        :param seconds: The number of seconds since now, or `None` to remove the deadline
+        :type seconds: float|None
+        """
+        self.deadline = None if seconds is None else time.time() + seconds
+
+    def _update_timeout(self):
+        """ Update the socket timeout before a network operation
+
+        :raises smtplib.SMTPServerDisconnected: the deadline has passed.
+            The session is closed: it may be in the middle of an exchange, with replies still to come.
+        """
+        timeout = self.read_timeout if self.read_timeout is not None else self._base_timeout
+        if self.deadline is not None:
+            left = self.deadline - time.time()
+            if left <= 0:
+                self.close()  # same as smtplib does on socket errors
+                raise smtplib.SMTPServerDisconnected('SMTP deadline exceeded')
+            timeout = left if timeout is None else min(timeout, left)
+        self.sock.settimeout(timeout)
+
+    def connect(self, host='localhost', *args, **kwargs):
+        # The greeting is read within connect(): it needs the timeout as well
+        self._base_timeout = self.timeout if isinstance(self.timeout, (int, float)) else socket.getdefaulttimeout()
+        # smtplib only remembers the host (for TLS server_hostname) when it's given to the constructor
+        self._host = host
+        return smtplib.SMTP.connect(self, host, *args, **kwargs)
+
+    def send(self, s):
+        if self.sock:
+            self._update_timeout()
+        return smtplib.SMTP.send(self, s)
+
+    def getreply(self):
+        if self.sock:
+            self._update_timeout()
+        return smtplib.SMTP.getreply(self)
+
+
+class _SMTP(_DeadlineMixin, smtplib.SMTP):
+    pass
+
+
+class _SMTP_SSL(_DeadlineMixin, smtplib.SMTP_SSL):
+    pass
+
+
+class _ResumingContext(object):
+    """ SSLContext wrapper which resumes the last TLS session of an SMTPConnection.
+
+    smtplib has no way to pass a session to `wrap_socket()`: this wrapper does it.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def wrap_socket(self, sock, **kwargs):
+        kwargs.setdefault('session', self._connection._tls_session)
+        return self._connection.get_ssl_context().wrap_socket(sock, **kwargs)
 
 
 class SMTPConnection(IConnection):
@@ -33,19 +265,49 @@ class SMTPConnection(IConnection):
     :type host: str
     :param port: SMTP server port number.
     :type port: int
-    :param username: User name to authenticate with
-    :type username: str
+    :param username: User name to authenticate with; `None` to skip authentication
+    :type username: str|None
     :param password: Password
-    :type password: str
+    :type password: str|None
     :param local_hostname: FQDN of the local host for the HELO/EHLO command. When `None`, is detected automatically.
     :type local_hostname: str|None
     :param ssl: Use SSL protocol?
     :type ssl: bool
     :param tls: Use TLS handshake?
     :type tls: bool
+    :param ssl_context: SSL context for SSL and TLS connections, with your own CA, ciphers, certificates.
+        When `None`, a default one is created, which (just like smtplib) does not verify certificates.
+
+        The context is shared by all connections, and TLS sessions are resumed on reconnect:
+        this saves CPU and round-trips on full handshakes.
+        Python 2's smtplib can't take a context: it's ignored there, and every connection does a full handshake.
+    :type ssl_context: ssl.SSLContext|None
+    :param connect_timeout: Timeout for establishing a TCP connection, seconds.
+        Also the default read timeout. When `None`, the global default socket timeout is used.
+    :type connect_timeout: float|None
+    :param read_timeout: Timeout for every network operation, seconds
+    :type read_timeout: float|None
+    :param deadline: Deadline for a whole exchange, seconds:
+        for connecting (EHLO, STARTTLS, AUTH), and for sending every single message (MAIL, RCPT, DATA).
+        When a timeout or the deadline is exceeded, `socket.timeout` or `smtplib.SMTPServerDisconnected` is raised.
+    :type deadline: float|None
+    :param metrics: Metrics collector to report the 'connect', 'build', 'serialize', 'smtp' stages to
+    :type metrics: mailem.metrics.IMetrics|None
+    :param eightbit: Send 8-bit messages when the server supports it.
+
+        With 8BITMIME, text parts are sent as is, instead of being encoded with base64 or quoted-printable.
+        With SMTPUTF8, headers and internationalized addresses are sent as UTF-8, unencoded.
+        This saves bandwidth and encoding CPU on non-ASCII messages.
+    :type eightbit: bool
+
+    When the server advertises a size limit (the SIZE extension), messages over it are refused
+    with `smtplib.SMTPSenderRefused` (code 552, a permanent error) before anything is sent:
+    a message way too big is refused by [`Message.estimate_size()`](#messageestimate_size),
+    without even being serialized. smtplib declares the size in MAIL FROM as well.
     """
 
-    def __init__(self, host, port, username, password, local_hostname=None, ssl=False, tls=False):
+    def __init__(self, host, port, username, password, local_hostname=None, ssl=False, tls=False, ssl_context=None,
+                 connect_timeout=None, read_timeout=None, deadline=None, metrics=None, eightbit=True):
         self.host = host
         self.port = port
         self.username = username
@@ -53,42 +315,103 @@ class SMTPConnection(IConnection):
         self.local_hostname = local_hostname
         self.ssl = ssl
         self.tls = tls
+        self.ssl_context = ssl_context
+        self._tls_session = None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.metrics = metrics
+        self.eightbit = eightbit
+
+    def get_ssl_context(self):
+        """ Get the SSL context shared by all connections
+
+        :rtype: ssl.SSLContext
+        """
+        if self.ssl_context is None:
+            # Same as smtplib's default: no certificate verification. Provide your own context to verify.
+            self.ssl_context = ssl.create_default_context()
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        return self.ssl_context
+
+    def _save_tls_session(self, client):
+        """ Remember the TLS session to resume it on reconnect """
+        session = getattr(client.sock, 'session', None)
+        if session is not None:
+            self._tls_session = session
 
     def _get_client(self):
-        SMTP_CLS = smtplib.SMTP_SSL if self.ssl else smtplib.SMTP
-        return SMTP_CLS(self.host, self.port, self.local_hostname)
+        kwargs = {} if self.connect_timeout is None else {'timeout': self.connect_timeout}
+        if self.ssl:
+            if not PY2:
+                kwargs['context'] = _ResumingContext(self)
+            s = _SMTP_SSL(local_hostname=self.local_hostname, **kwargs)
+        else:
+            s = _SMTP(local_hostname=self.local_hostname, **kwargs)
+        s.read_timeout = self.read_timeout
+        s.set_deadline(self.deadline)
+        s.connect(self.host, self.port)
+        return s
 
     def connect(self):
-        # Init
-        s = self._get_client()
+        with timer(self.metrics, 'connect'):
+            # Init
+            s = self._get_client()
 
-        # Handshake
-        if self.tls:
-            s.starttls()
-        s.login(self.username, self.password)
+            # Handshake
+            if self.tls:
+                s.starttls(**({} if PY2 else {'context': _ResumingContext(self)}))
+            if self.username is not None:
+                s.login(self.username, self.password)
 
         # Finish
+        s.set_deadline(None)
         return s
 
     def disconnect(self, client):
-        client.quit()
+        # By now, the server has surely sent us a session ticket
+        self._save_tls_session(client)
 
-    def sendmail(self, client, message):
-        if PY2:
-            message_bytes = str(message)
-        else:
-            message_bytes = str(message).encode()
+        try:
+            client.quit()
+        except smtplib.SMTPServerDisconnected:
+            client.close()  # already dropped by the server
+
+    def sendmail(self, client, message, recipients=None):
+        """ Send the message
+
+        :param recipients: Envelope recipients, when only some of the message recipients are served by this server.
+            Default: all message recipients (To, Cc, Bcc)
+        :type recipients: list[str]|None
+        """
+        client.set_deadline(self.deadline)
+        try:
+            self._sendmail(client, message, recipients)
+        finally:
+            client.set_deadline(None)
+
+    def _sendmail(self, client, message, recipients=None):
+        client.ehlo_or_helo_if_needed()
+
+        # Negotiate 8-bit transport
+        eightbit = utf8 = False
+        if self.eightbit and not PY2:
+            eightbit = client.has_extn('8bitmime')
+            utf8 = eightbit and client.has_extn('smtputf8')
+
+        # Size limit: refuse obviously oversized messages before serializing them
+        limit = get_size_limit(client)
+        if limit and message.estimate_size(eightbit) > limit + limit // 20:
+            raise _too_big(message, limit)
 
-        client.sendmail(
-            # From
-            message._sender.email,
+        sender, recipients, message_bytes, mail_options = prepare_message(
+            message, eightbit, utf8, self.metrics, recipients, self.dkim)
 
-            # To
-            [r.email for r in itertools.chain(
-                message._recipients,
-                message._cc,
-                message._bcc)],
+        # The estimate is approximate: check the real size before streaming it
+        if limit and len(message_bytes) > limit:
+            raise _too_big(message, limit)
 
-            # Message
-            message_bytes
-        )
+        with timer(self.metrics, 'smtp', bytes=len(message_bytes), recipients=len(recipients)) as t:
+            client.sendmail(sender, recipients, message_bytes, mail_options)
+            t.info['code'] = 250
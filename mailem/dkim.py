@@ -0,0 +1,181 @@
+""" DKIM signing (RFC 6376) """
+
+import re
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class DKIMSigner(object):
+    """ Signs outgoing messages with DKIM.
+
+    Install it on a Postman, and every message is signed right after it's serialized:
+
+    ```python
+    from mailem import Postman
+    from mailem.dkim import DKIMSigner
+
+    postman = Postman('user@example.com', SMTPConnection(...),
+                      dkim=DKIMSigner('mail', 'example.com', open('dkim.pem', 'rb').read()))
+    ```
+
+    The private key is parsed once, when the signer is created. RSA keys sign with `rsa-sha256`,
+    Ed25519 keys with `ed25519-sha256` (RFC 8463). Requires [cryptography](https://cryptography.io/).
+
+    Body hashes are cached: when the same body is signed again with different headers
+    (the same message to multiple envelopes, servers, retries; per-recipient copies of a templated message),
+    the body is not canonicalized and hashed again. MIME boundaries are derived from the contents,
+    so this works for multipart messages as well.
+
+    Messages are signed with CRLF line endings, and are sent that way.
+
+    :param selector: DKIM selector: the DNS record is at `<selector>._domainkey.<domain>`
+    :type selector: str
+    :param domain: Signing domain
+    :type domain: str
+    :param private_key: Private key: PEM, or a key object loaded with `cryptography`
+    :type private_key: bytes|str|object
+    :param headers: Names of the headers to sign, when present. 'From' is always signed.
+    :type headers: Iterable[str]
+    :param canonicalization: Header and body canonicalization: 'relaxed/relaxed', 'relaxed/simple', 'simple/simple', ...
+    :type canonicalization: str
+    :param cache_size: The number of body hashes to remember
+    :type cache_size: int
+    """
+
+    #: Headers signed by default
+    HEADERS = ('From', 'To', 'Cc', 'Subject', 'Date', 'Message-ID', 'Reply-To',
+               'MIME-Version', 'Content-Type', 'Content-Transfer-Encoding')
+
+    def __init__(self, selector, domain, private_key, headers=HEADERS, canonicalization='relaxed/relaxed',
+                 cache_size=128):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+
+        self.selector = selector
+        self.domain = domain
+        self.headers = [h.lower() for h in headers]
+        if 'from' not in self.headers:
+            self.headers.insert(0, 'from')
+        self.header_canon, self.body_canon = (canonicalization.split('/') + ['simple'])[:2]
+        assert self.header_canon in ('simple', 'relaxed') and self.body_canon in ('simple', 'relaxed'), \
+            'Unknown canonicalization: {}'.format(canonicalization)
+        self.cache_size = cache_size
+
+        # Parse the key once
+        if not isinstance(private_key, bytes) and hasattr(private_key, 'encode'):  # text
+            private_key = private_key.encode('ascii')
+        if isinstance(private_key, bytes):
+            private_key = serialization.load_pem_private_key(private_key, password=None)
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm = 'rsa-sha256'
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            self.algorithm = 'ed25519-sha256'
+        else:
+            raise ValueError('Unsupported DKIM key type: {}'.format(type(private_key).__name__))
+        self._key = private_key
+
+        #: Body hash cache: { body key: body hash }
+        self._body_hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    #region Canonicalization
+
+    _trailing_wsp_rex = re.compile(br'[ \t]+\r\n')
+    _wsp_rex = re.compile(br'[ \t]+')
+    _unfold_rex = re.compile(br'\r\n(?=[ \t])')
+
+    def _canonicalize_body(self, body):
+        if self.body_canon == 'relaxed':
+            body = self._trailing_wsp_rex.sub(b'\r\n', body)
+            body = self._wsp_rex.sub(b' ', body)
+            body = body.rstrip(b'\r\n')
+            return body + b'\r\n' if body else b''
+        return body.rstrip(b'\r\n') + b'\r\n'
+
+    def _canonicalize_header(self, header):
+        """ Canonicalize a header: 'Name: value\\r\\n', possibly folded """
+        if self.header_canon == 'relaxed':
+            name, _, value = header.partition(b':')
+            value = self._wsp_rex.sub(b' ', self._unfold_rex.sub(b'', value)).strip()
+            return name.strip().lower() + b':' + value + b'\r\n'
+        return header
+
+    #endregion
+
+    def body_hash(self, body, key=None):
+        """ Get the body hash, from the cache if possible
+
+        :param body: Message body, with CRLF line endings
+        :type body: bytes
+        :param key: Cache key that identifies the body: the same key for the same body, always.
+            Default: the body itself, which costs hashing it with SHA-1 on every lookup
+        :type key: hashable|None
+        :return: Body hash, base64
+        :rtype: bytes
+        """
+        if key is None:
+            key = (len(body), hashlib.sha1(body).digest())
+        with self._lock:
+            bh = self._body_hashes.pop(key, None)
+            if bh is not None:
+                self._body_hashes[key] = bh  # the most recently used: to the end
+                return bh
+
+        bh = base64.b64encode(hashlib.sha256(self._canonicalize_body(body)).digest())
+
+        with self._lock:
+            self._body_hashes[key] = bh
+            while len(self._body_hashes) > self.cache_size:
+                self._body_hashes.popitem(last=False)
+        return bh
+
+    def sign(self, message_bytes, body_key=None):
+        """ Sign a serialized message
+
+        :param message_bytes: Serialized message
+        :type message_bytes: bytes
+        :param body_key: Cache key of the message body. See `body_hash()`
+        :type body_key: hashable|None
+        :return: The message with CRLF line endings, and the DKIM-Signature header on top
+        :rtype: bytes
+        """
+        message_bytes = message_bytes.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+        head, sep, body = message_bytes.partition(b'\r\n\r\n')
+        head += b'\r\n'
+
+        # Headers: [ (lowercase name, full header) ], folded lines joined
+        headers = [(h.partition(b':')[0].strip().lower().decode('ascii'), h)
+                   for h in re.split(br'\r\n(?![ \t])', head) if h]
+
+        # Headers to sign: the last instance of each
+        signed = []
+        for name in self.headers:
+            for n, h in reversed(headers):
+                if n == name:
+                    signed.append((name, h + b'\r\n'))
+                    break
+
+        # DKIM-Signature, with an empty signature
+        dkim_header = 'DKIM-Signature: v=1; a={a}; c={hc}/{bc}; d={d}; s={s};\r\n\tt={t}; h={h};\r\n\tbh={bh};\r\n\tb='.format(
+            a=self.algorithm, hc=self.header_canon, bc=self.body_canon, d=self.domain, s=self.selector,
+            t=int(time.time()), h=':'.join(name for name, h in signed),
+            bh=self.body_hash(body, body_key).decode('ascii'),
+        ).encode('ascii')
+
+        data = b''.join(self._canonicalize_header(h) for name, h in signed)
+        data += self._canonicalize_header(dkim_header + b'\r\n')[:-2]  # without the trailing CRLF
+        signature = base64.b64encode(self._sign(data))
+
+        # Fold the signature
+        folded = b'\r\n\t'.join(signature[i:i + 72] for i in range(0, len(signature), 72))
+        return dkim_header + folded + b'\r\n' + message_bytes
+
+    def _sign(self, data):
+        if self.algorithm == 'rsa-sha256':
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.asymmetric import padding
+            return self._key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        return self._key.sign(hashlib.sha256(data).digest())
@@ -0,0 +1,272 @@
+""" Mail merge: stream recipients from CSV/JSONL files, render them with a template, and send """
+
+from __future__ import print_function
+
+import io
+import os
+import re
+import sys
+import csv
+import codecs
+import json
+import gzip
+import time
+import argparse
+import threading
+
+from .campaign import Campaign, Journal
+
+PY2 = sys.version_info[0] == 2
+
+
+#region Rows
+
+def read_rows(path, format=None):
+    """ Stream rows from a CSV or JSONL file, one at a time: the file is never loaded as a whole
+
+    * CSV: the first line is the header; every row is a dict keyed by column names
+    * JSONL: every line is a JSON object; blank lines are skipped
+
+    Files ending with '.gz' are decompressed on the fly.
+
+    :param path: File path; '-' for stdin
+    :type path: str
+    :param format: 'csv' or 'jsonl'. Default: guessed from the file extension
+    :type format: str|None
+    :return: Iterator of dicts
+    :rtype: Iterator[dict]
+    :raises ValueError: Unknown format
+    """
+    if format is None:
+        ext = os.path.splitext(path[:-3] if path.endswith('.gz') else path)[1].lower()
+        format = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl'}.get(ext)
+    if format not in ('csv', 'jsonl'):
+        raise ValueError('Unknown file format: {!r}. Use csv or jsonl'.format(format))
+
+    if path == '-':
+        f = getattr(sys.stdin, 'buffer', sys.stdin)
+    elif path.endswith('.gz'):
+        f = gzip.open(path, 'rb')
+    else:
+        f = io.open(path, 'rb')
+
+    with f:
+        if PY2:
+            # Python 2 csv only reads bytes: decode the values
+            lines = _strip_bom(f)
+            if format == 'csv':
+                for row in csv.DictReader(lines):
+                    yield {_decode(k): _decode(v) for k, v in row.items()}
+            else:
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line.decode('utf-8'))
+            return
+
+        # utf-8-sig: spreadsheets like to start CSV files with a BOM
+        f = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+        if format == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _strip_bom(lines):
+    """ Python 2: skip the UTF-8 BOM at the start of a binary file """
+    for i, line in enumerate(lines):
+        yield line[len(codecs.BOM_UTF8):] if i == 0 and line.startswith(codecs.BOM_UTF8) else line
+
+
+def _decode(value):
+    """ Python 2: decode a CSV value (or the list of extra values) """
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def rows_to_items(rows, to='email', name=None):
+    """ Convert rows to (recipients, values) items for sending
+
+    Rows with no e-mail address are skipped.
+
+    :param rows: Rows
+    :type rows: Iterable[dict]
+    :param to: Name of the column with the e-mail address
+    :type to: str
+    :param name: Name of the column with the recipient name, if any
+    :type name: str|None
+    :rtype: Iterator[tuple]
+    """
+    for row in rows:
+        email = (row.get(to) or '').strip()
+        if not email:
+            continue
+        recipient = (email, row[name]) if name and row.get(name) else email
+        yield [recipient], row
+
+#endregion
+
+
+class Progress(object):
+    """ Counts rows and messages, and reports progress and throughput periodically
+
+    :param out: Stream to report to
+    :param interval: Report every this many seconds; 0 to report only at the end
+    :type interval: float
+    """
+
+    def __init__(self, out=sys.stderr, interval=5.0):
+        self.out = out
+        self.interval = interval
+        self.rows = 0
+        self.sent = 0
+        self.failed = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def count_rows(self, rows):
+        """ Count rows as they're read
+
+        :type rows: Iterable
+        :rtype: Iterator
+        """
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def on_sent(self, message):
+        with self._lock:
+            self.sent += 1
+
+    def on_failed(self, message, e):
+        with self._lock:
+            self.failed += 1
+
+    def report(self):
+        """ Print a line with progress and throughput """
+        elapsed = time.time() - self.started
+        self.out.write(u'{:>10,} rows {:>10,} sent {:>8,} failed {:>9.1f} msgs/sec {:>8.0f}s\n'.format(
+            self.rows, self.sent, self.failed, (self.sent + self.failed) / elapsed if elapsed else 0, elapsed))
+        self.out.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def __enter__(self):
+        self.started = time.time()
+        if self.interval:
+            self._thread = threading.Thread(target=self._run, name='mailem-merge-progress')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.report()
+
+
+def merge(rows, template, postman, to='email', name=None, workers=4, journal=None, campaign=None, progress=None):
+    """ Mail merge: render a message for every row, and send it
+
+    Rows are pulled as the workers need them: with a generator, like [`read_rows()`](#read_rows),
+    memory stays flat however long the list is.
+
+    ```python
+    from mailem.merge import merge, read_rows
+    from mailem.template import TemplateRegistry
+
+    templates = TemplateRegistry.from_directory('templates/')
+    stats = merge(read_rows('subscribers.csv'), templates.get('newsletter'), postman, workers=8)
+    ```
+
+    The same is available from the command line: see `mailem-merge --help`.
+
+    :param rows: Rows: dicts with template values
+    :type rows: Iterable[dict]
+    :param template: Template to render
+    :type template: mailem.template.Template
+    :param postman: Postman to send messages with
+    :type postman: mailem.postman.Postman
+    :param to: Name of the column with the e-mail address. Rows with none are skipped.
+    :type to: str
+    :param name: Name of the column with the recipient name, if any
+    :type name: str|None
+    :param workers: The number of threads (connections) to send with
+    :type workers: int
+    :param journal: Journal path, to resume an interrupted merge without resending. See [`Campaign`](#campaign)
+    :type journal: str|None
+    :param campaign: Campaign name: part of the Message-IDs, with a journal.
+        Default: the journal file name. Never reuse it for another campaign: receivers drop repeated Message-IDs.
+    :type campaign: str|None
+    :param progress: Progress reporter
+    :type progress: Progress|None
+    :return: { 'sent': int, 'failed': int, 'skipped': int }
+    :rtype: dict
+    """
+    if progress is not None:
+        rows = progress.count_rows(rows)
+    if journal and not campaign:
+        campaign = re.sub(r'[^\w.-]+', '-', os.path.splitext(os.path.basename(journal))[0]) or 'merge'
+    journal = Journal(journal) if journal else None
+    try:
+        return Campaign(campaign or 'merge', template, postman, journal).run(
+            rows_to_items(rows, to, name), workers=workers,
+            on_sent=progress.on_sent if progress else None,
+            on_failed=progress.on_failed if progress else None)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def main(argv=None):
+    from . import Postman
+    from .connection import SMTPConnection, BlackholeConnection
+    from .template import TemplateRegistry
+
+    parser = argparse.ArgumentParser(
+        prog='mailem-merge',
+        description='Mail merge: stream recipients from a CSV or JSONL file, render a template for each, and send.')
+    parser.add_argument('file', help='CSV or JSONL file with recipients (.gz is fine); "-" for stdin')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='File format. Default: by extension')
+    parser.add_argument('-t', '--templates', required=True, help='Templates directory: a subdirectory per template')
+    parser.add_argument('-T', '--template', required=True, help='Template name')
+    parser.add_argument('-f', '--sender', required=True, help='Sender e-mail address')
+    parser.add_argument('--to', default='email', help='Column with the e-mail address. Default: email')
+    parser.add_argument('--name', help='Column with the recipient name')
+    parser.add_argument('--host', default='localhost', help='SMTP server')
+    parser.add_argument('--port', type=int, default=25, help='SMTP server port')
+    parser.add_argument('--user', help='SMTP user name. The password is taken from $MAILEM_PASSWORD')
+    parser.add_argument('--tls', action='store_true', help='Use STARTTLS')
+    parser.add_argument('--ssl', action='store_true', help='Use SSL')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='The number of connections. Default: 4')
+    parser.add_argument('--journal', help='Journal file: makes the merge resumable')
+    parser.add_argument('--campaign', help='Campaign name, for Message-IDs with --journal. Default: the journal file name')
+    parser.add_argument('--progress', type=float, default=5.0, help='Report progress every N seconds')
+    parser.add_argument('--dry-run', action='store_true', help='Render and serialize the messages, but send nothing')
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        connection = BlackholeConnection()
+    else:
+        connection = SMTPConnection(args.host, args.port, args.user, os.environ.get('MAILEM_PASSWORD'),
+                                    ssl=args.ssl, tls=args.tls)
+    postman = Postman(args.sender, connection, reconnect=1)
+    template = TemplateRegistry.from_directory(args.templates).get(args.template)
+
+    with Progress(interval=args.progress) as progress:
+        stats = merge(read_rows(args.file, args.format), template, postman, to=args.to, name=args.name,
+                      workers=args.concurrency, journal=args.journal, campaign=args.campaign, progress=progress)
+    print('Done: {sent} sent, {failed} failed, {skipped} skipped'.format(**stats), file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,105 @@
+import sys
+import copy
+import hashlib
 import itertools
 
+from email import charset
+from email.charset import Charset
+from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate, make_msgid
+try:
+    from email.policy import SMTPUTF8
+except ImportError:  # Python 2: no 8-bit support
+    SMTPUTF8 = None
 
-from .util import Address, unicode_header
+from .util import Address, unicode_header, parse_addresses, unique_emails
+from .metrics import timer
+
+PY2 = sys.version_info[0] == 2
+
+
+# UTF-8 with no transfer encoding: for ASCII texts, and 8BITMIME servers
+_utf8_8bit = Charset('utf-8')
+_utf8_8bit.body_encoding = None
+
+# UTF-8 with quoted-printable: for mostly-ASCII texts that are not allowed on the wire as is
+_utf8_qp = Charset('utf-8')
+_utf8_qp.body_encoding = charset.QP
+
+# UTF-8 with base64: for non-ASCII texts, when 8bit is not allowed
+_utf8_base64 = Charset('utf-8')
+_utf8_base64.body_encoding = charset.BASE64
+
+
+def _text_charset(text, eightbit):
+    """ Choose the charset (and hence, the transfer encoding) for a text part
+
+    :param eightbit: Is the 8bit transfer encoding allowed?
+    :type eightbit: bool
+    :rtype: email.charset.Charset
+    """
+    try:
+        text.encode('ascii')
+        ascii = True
+    except UnicodeError:
+        ascii = False
+
+    # Non-ASCII texts have to be encoded, unless 8bit is allowed
+    if not ascii and not eightbit:
+        return _utf8_base64
+
+    # Lines longer than 998 octets are not allowed on the wire, unless encoded (RFC 5321, 4.5.3.1.6).
+    # Characters are at most 4 bytes in UTF-8: check the lines only when the text is large enough.
+    if len(text) > 998 // 4 and any(len(line.encode('utf-8')) > 998 for line in text.splitlines()):
+        return _utf8_qp if ascii else _utf8_base64
+
+    return _utf8_8bit
+
+
+def _mime_text(text, subtype, cs):
+    """ Create a text part with the charset (and hence, the transfer encoding) given
+
+    :type cs: email.charset.Charset
+    :rtype: email.mime.base.MIMEBase
+    """
+    if PY2:
+        # Python 2 MIMEText only takes charset names: a Charset object is set on the payload instead
+        msg = MIMEBase('text', subtype)
+        msg.set_payload(text, cs)
+        return msg
+    return MIMEText(text, subtype, cs)
+
+
+#region Size estimation
+
+def _base64_size(n):
+    """ The size of `n` bytes encoded with base64, with line breaks every 76 characters """
+    return (n + 2) // 3 * 4 + (n + 56) // 57
+
+
+def _text_size(text, eightbit):
+    """ Estimate the encoded size of a text part """
+    cs = _text_charset(text, eightbit)
+    n = len(text.encode('utf-8'))
+    if cs is _utf8_base64:
+        return _base64_size(n)
+    if cs is _utf8_qp:
+        return n + n // 70  # soft line breaks
+    return n
+
+
+def _header_size(value):
+    """ Estimate the encoded size of a header value """
+    try:
+        value.encode('ascii')
+        return len(value)
+    except UnicodeError:
+        n = len(value.encode('utf-8'))
+        return _base64_size(n) + 12 * (n // 45 + 1)  # encoded words: =?utf-8?b?...?=
+
+#endregion
 
 
 class Message(object):
@@ -19,6 +114,11 @@ class Message(object):
 
         * `'user@example.com'`: Just an e-mail address
         * `('user@example.com', u'Honored User')`: email address with name
+        * `u'Honored User <user@example.com>'`: the same, as a string
+
+      Address lists can also be given as a single string: `'a@example.com, B <b@example.com>'`.
+    * Domains are lowercased, and internationalized domains are IDNA-encoded for servers with no SMTPUTF8.
+      A recipient listed more than once (e.g. in both To and Cc) gets a single copy.
 
     Arguments:
 
@@ -44,39 +144,129 @@ class Message(object):
     :type date: datetime|None
     :param headers: Additional headers
     :type headers: dict
+    :param msgid: Message-ID. Default: a new unique one
+    :type msgid: str|None
     """
 
-    def __init__(self, recipients, subject, html=None, text=None, sender=None, cc=None, bcc=None, attachments=None, reply_to=None, date=None, headers=None):
-        self._recipients = [Address(r) for r in recipients]
+    def __init__(self, recipients, subject, html=None, text=None, sender=None, cc=None, bcc=None, attachments=None, reply_to=None, date=None, headers=None, msgid=None):
+        self._recipients = parse_addresses(recipients)
         self._subject = subject
         self._html = html
         self._text = text
         self._sender = Address(sender) if sender else None
-        self._cc =  [Address(c) for c in cc or ()]
-        self._bcc = [Address(b) for b in bcc or ()]
+        self._cc = parse_addresses(cc or ())
+        self._bcc = parse_addresses(bcc or ())
         self._attachments = attachments or []
         self._reply_to = Address(reply_to) if reply_to else None
         self._date = date
         self._headers = headers or {}
-        self._msgid = make_msgid()
+        self._msgid = msgid or make_msgid()
+        self._body_digest = None
 
-    def _sender_default(self, sender):
-        """ Set the default sender address
+    def _with_sender(self, sender):
+        """ Get the message with the default sender address
 
-        :param sender: Sender address
+        The message itself is never modified, so it can be shared by threads, and sent by multiple Postmen at once.
+        If the sender has to be set, a shallow copy is made: the contents are shared.
+
+        :param sender: Default sender address
         :type sender: basestring|tuple[basestring]
+        :return: This message, if it has a sender; a copy with the default sender otherwise
+        :rtype: Message
+        """
+        if self._sender:
+            return self
+        message = copy.copy(self)
+        message._sender = Address(sender)
+        return message
+
+    def _envelope(self, utf8=False):
+        """ Get the envelope recipients: To, Cc and Bcc, with duplicates removed
+
+        :param utf8: Keep internationalized domains as is (for SMTPUTF8 servers)
+        :type utf8: bool
+        :rtype: list[basestring]
         """
-        if not self._sender:
-            self._sender = Address(sender)
+        return unique_emails(itertools.chain(self._recipients, self._cc, self._bcc), utf8)
+
+    def _digest(self):
+        """ Get the digest of the body contents: texts, and attachments
+
+        Messages with the same contents get the same MIME boundaries, and hence, the same body:
+        e.g. per-recipient copies of a templated message. DKIMSigner hashes such a body once.
+
+        :return: SHA-1, hex
+        :rtype: str
+        """
+        if self._body_digest is None:
+            h = hashlib.sha1()
+            for text in (self._html, self._text):
+                if text is not None and not isinstance(text, bytes):
+                    text = text.encode('utf-8')
+                h.update(b'-' if text is None else b'+' + text + b'\0')
+            for a in self._attachments:
+                h.update(repr((type(a).__name__, a.filename, a.content_type, a.disposition,
+                               sorted(a.headers.items()), a._sha256())).encode('utf-8') + b'\0')
+            self._body_digest = h.hexdigest()
+        return self._body_digest
+
+    @property
+    def _boundary(self):
+        """ MIME boundary: derived from the contents, so it can't be found in them """
+        return '=_' + self._digest()[:24]
+
+    def estimate_size(self, eightbit=False):
+        """ Estimate the size of the message on the wire, without building it
+
+        The estimate is computed from the sizes of the parts, and the encodings they'd get:
+        base64 is predictable, and attachments are most of a big message.
+        It's accurate within a few percent, and costs microseconds even for big attachments.
+
+        Use it to check messages against the server's size limit (the SIZE extension) before paying for
+        serialization. [`SMTPConnection`](#smtpconnection) does that for you.
 
-    def _mime(self):
+        :param eightbit: Estimate for an 8BITMIME server
+        :type eightbit: bool
+        :return: Size, bytes
+        :rtype: int
+        """
+        # Headers
+        size = 150 + len(self._msgid)  # Date, Message-ID, MIME-Version, Content-Type, Content-Transfer-Encoding
+        size += 10 + _header_size(self._subject or u'')
+        for a in itertools.chain(self._recipients, self._cc, self._bcc, (self._sender, self._reply_to)):
+            if a is not None:
+                size += len(a.ascii_email) + (_header_size(a.name) + 3 if a.name else 0) + 2
+        size += sum(len(k) + len(v) + 3 for k, v in self._headers.items())
+
+        # Text parts
+        parts = [_text_size(text, eightbit) for text in (self._html, self._text) if text is not None]
+        size += sum(parts)
+        if len(parts) > 1:
+            size += 100 + 160 * len(parts)  # multipart/alternative, with part headers and boundaries
+
+        # Attachments
+        if self._attachments:
+            size += 100 + 60 * (len(parts) > 1)  # multipart/mixed
+            for a in self._attachments:
+                data = a.data or b''
+                if not isinstance(data, (bytes, bytearray, memoryview)):
+                    data = data.encode('utf-8')
+                size += _base64_size(len(data)) + 200 + _header_size(a.filename or u'')
+                size += sum(len(k) + len(v) + 3 for k, v in a.headers.items())
+        return size
+
+    def _mime(self, eightbit=True, utf8=False):
         """ Build a MIME object for this message
 
+        :param eightbit: Use the 8bit transfer encoding for non-ASCII text parts (for 8BITMIME servers)
+        :type eightbit: bool
+        :param utf8: Do not encode non-ASCII headers (for SMTPUTF8 servers)
+        :type utf8: bool
         :return:
         :rtype: email.mime.text.MIMEText|email.mime.multipart.MIMEMultipart
         """
         # Text object
-        text = [ MIMEText(data, type,  'utf-8')
+        text = [ _mime_text(data, type, _text_charset(data, eightbit))
                  for data, type in (
                      (self._html, 'html'),
                      (self._text, 'plain'))
@@ -84,27 +274,27 @@ class Message(object):
         if len(text) == 1:
             msg = text[0]
         else:
-            msg = MIMEMultipart('alternative')
+            msg = MIMEMultipart('alternative', boundary=self._boundary + '_a')
             for t in text:
                 msg.attach(t)
 
         # Attachments
         if self._attachments:
             _text_msg = msg
-            msg = MIMEMultipart()
+            msg = MIMEMultipart(boundary=self._boundary + '_m')
             msg.attach(_text_msg)
             for a in self._attachments:
                 msg.attach(a._mime())
 
         # Fields
-        msg['Subject'] = unicode_header(self._subject)  # special
+        msg['Subject'] = self._subject if utf8 else unicode_header(self._subject)  # special
 
         # Headers
         headers = dict(self._headers)
         headers['Date'] = formatdate(self._date)  # handles `None` correctly
         headers['Message-ID'] = self._msgid
         headers.update({  # Address lists
-            key: ', '.join(map(str, addresses))
+            key: ', '.join(a.format(utf8) for a in addresses)
             for key, addresses in (
                 ('To', self._recipients),
                 ('Cc', self._cc),
@@ -121,6 +311,29 @@ class Message(object):
         #itertools.starmap(msg.add_header, headers.items())
         return msg
 
+    def _serialize(self, eightbit=False, utf8=False, metrics=None):
+        """ Build the MIME object and get bytes for the wire
+
+        By default, the result is 7bit-clean, and is safe to send to any server.
+
+        :param eightbit: Use the 8bit transfer encoding for non-ASCII text parts (for 8BITMIME servers)
+        :type eightbit: bool
+        :param utf8: Do not encode non-ASCII headers (for SMTPUTF8 servers)
+        :type utf8: bool
+        :param metrics: Metrics collector to report the 'build' and 'serialize' stages to
+        :type metrics: mailem.metrics.IMetrics|None
+        :rtype: bytes
+        """
+        with timer(metrics, 'build'):
+            msg = self._mime(eightbit, utf8)
+        with timer(metrics, 'serialize') as t:
+            if PY2:
+                msg_bytes = msg.as_string()  # bytes already
+            else:
+                msg_bytes = msg.as_bytes(policy=SMTPUTF8) if utf8 else msg.as_bytes()
+            t.info['bytes'] = len(msg_bytes)
+        return msg_bytes
+
     def __str__(self):
         """ Build the MIME object and get a string """
         return self._mime().as_string()
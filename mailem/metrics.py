@@ -0,0 +1,199 @@
+""" Instrumentation: per-stage timings """
+
+import math
+import time
+import threading
+from collections import defaultdict
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class IMetrics(object):
+    """ Interface for metrics collectors.
+
+    A collector receives a record for every stage of every message:
+
+    * `'render'`: `Template` rendering a message
+    * `'build'`: building the MIME tree of a message
+    * `'serialize'`: serializing the MIME tree into bytes. Info: `bytes`
+    * `'sign'`: DKIM signing
+    * `'connect'`: connecting to the server
+    * `'smtp'`: transmitting the message to the server. Info: `bytes`, `recipients`, `code`
+    * `'sendmail'`: `Postman` sending a message, including reconnects. Info: `recipients`, `code`
+    * `'queue'`: a message waiting in the `PriorityScheduler` queue. Info: `priority`
+
+    Failed stages have the `error` info: exception class name, and the `code`, if it's an SMTP error.
+    """
+
+    def record(self, stage, seconds, **info):
+        """ Record a stage
+
+        :param stage: Stage name
+        :type stage: str
+        :param seconds: Stage duration
+        :type seconds: float
+        :param info: Additional info: bytes, recipients, code, error
+        """
+        raise NotImplementedError()
+
+
+class HistogramMetrics(IMetrics):
+    """ Built-in collector: in-process histograms of stage durations.
+
+    Durations are counted in logarithmic buckets, so memory use is constant, and percentiles are accurate
+    within the `precision` (relative error).
+
+    Example:
+
+    ```python
+    from mailem import Postman
+    from mailem.metrics import HistogramMetrics
+
+    metrics = HistogramMetrics()
+    postman = Postman('user@example.com', SMTPConnection(...), metrics=metrics)
+    template.set_metrics(metrics)
+
+    # ... send
+
+    metrics.percentile('smtp', 99)  #-> 0.153
+    metrics.summary()  #-> {'smtp': {'count': 100, 'p50': 0.051, 'p99': 0.153, ...}, ...}
+    ```
+
+    :param precision: Relative precision of durations
+    :type precision: float
+    """
+
+    def __init__(self, precision=0.05):
+        self._log_base = math.log(1 + precision)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Forget everything """
+        with self._lock:
+            #: { stage: { bucket: count } }
+            self._buckets = defaultdict(lambda: defaultdict(int))
+            #: { stage: { 'count', 'seconds', 'max', 'bytes', 'recipients', 'errors' } }
+            self._totals = defaultdict(lambda: defaultdict(float))
+            #: { stage: { code: count } }
+            self._codes = defaultdict(lambda: defaultdict(int))
+
+    def _bucket(self, seconds):
+        return int(math.floor(math.log(max(seconds, 1e-9)) / self._log_base))
+
+    def _bucket_value(self, bucket):
+        """ The middle of a bucket """
+        return math.exp((bucket + 0.5) * self._log_base)
+
+    def record(self, stage, seconds, **info):
+        with self._lock:
+            self._buckets[stage][self._bucket(seconds)] += 1
+            totals = self._totals[stage]
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['max'] = max(totals['max'], seconds)
+            totals['bytes'] += info.get('bytes', 0)
+            totals['recipients'] += info.get('recipients', 0)
+            if 'error' in info:
+                totals['errors'] += 1
+            if info.get('code') is not None:
+                self._codes[stage][info['code']] += 1
+
+    def stages(self):
+        """ Get the list of stages recorded
+
+        :rtype: list[str]
+        """
+        return sorted(self._totals)
+
+    def percentile(self, stage, p):
+        """ Get a percentile of stage durations
+
+        :param stage: Stage name
+        :type stage: str
+        :param p: Percentile: 0..100
+        :type p: float
+        :return: Duration, seconds; `None` if nothing was recorded
+        :rtype: float|None
+        """
+        with self._lock:
+            buckets = self._buckets.get(stage)
+            if not buckets:
+                return None
+            if p >= 100:
+                return self._totals[stage]['max']
+            total = sum(buckets.values())
+            rank = p / 100.0 * total
+            seen = 0
+            for bucket in sorted(buckets):
+                seen += buckets[bucket]
+                if seen >= rank:
+                    break
+            return min(self._bucket_value(bucket), self._totals[stage]['max'])
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """ Get a summary for every stage
+
+        :param percentiles: Percentiles to report
+        :type percentiles: Iterable[float]
+        :return: { stage: { count, mean, max, bytes, recipients, errors, codes, p50, p90, p99 } }
+        :rtype: dict
+        """
+        summary = {}
+        for stage in self.stages():
+            totals = self._totals[stage]
+            summary[stage] = dict(
+                count=int(totals['count']),
+                mean=totals['seconds'] / totals['count'],
+                max=totals['max'],
+                bytes=int(totals['bytes']),
+                recipients=int(totals['recipients']),
+                errors=int(totals['errors']),
+                codes=dict(self._codes[stage]),
+                **{'p{:g}'.format(p): self.percentile(stage, p) for p in percentiles}
+            )
+        return summary
+
+
+def error_info(e):
+    """ Describe an exception for a metrics record
+
+    :type e: Exception
+    :rtype: dict
+    """
+    import smtplib  # only needed on errors; not imported by messages that are never sent
+
+    info = {'error': type(e).__name__}
+    if isinstance(e, smtplib.SMTPResponseException):
+        info['code'] = e.smtp_code
+    elif isinstance(e, smtplib.SMTPRecipientsRefused) and e.recipients:
+        info['code'] = min(code for code, msg in e.recipients.values())
+    return info
+
+
+class timer(object):
+    """ Context manager that records the duration of a stage
+
+    Use `timer.info` to add info while the stage is running.
+    Errors are recorded with `error_info()`.
+
+    :param metrics: Metrics collector, or `None` to do nothing
+    :type metrics: IMetrics|None
+    :param stage: Stage name
+    :type stage: str
+    """
+
+    def __init__(self, metrics, stage, **info):
+        self.metrics = metrics
+        self.stage = stage
+        self.info = info
+
+    def __enter__(self):
+        self._start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.metrics is not None:
+            if exc is not None:
+                self.info.update(error_info(exc))
+            self.metrics.record(self.stage, _clock() - self._start, **self.info)
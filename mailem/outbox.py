@@ -0,0 +1,244 @@
+import time
+import logging
+import threading
+from collections import deque
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxFull(Exception):
+    """ The outbox is full, and the producer did not want to wait """
+
+
+def _message_size(message):
+    """ Approximate size of a message in memory: its texts and attachments
+
+    :type message: mailem.message.Message
+    :rtype: int
+    """
+    return (len(message._html or '') + len(message._text or '') +
+            sum(len(a.data or b'') for a in message._attachments))
+
+
+class Outbox(object):
+    """ Bounded queue in front of a Postman: producers put messages in, consumer threads send them.
+
+    When producers (e.g. template rendering) create messages faster than they can be sent, the outbox fills up,
+    and producers are blocked (or rejected with `OutboxFull`) until there's room again.
+    This way, memory stays flat under overload.
+
+    Example:
+
+    ```python
+    from mailem import Postman
+
+    postman = Postman('user@example.com', SMTPConnection(...), reconnect=1)
+
+    with postman.outbox(max_messages=1000, max_bytes=50*1024*1024, workers=4) as outbox:
+        for user in users:
+            outbox.put(template([user.email], user.values))  # blocks while the outbox is full
+    # Leaving the block waits until everything is sent
+    ```
+
+    Every consumer keeps its session open while it's waiting for messages, so use `Postman(reconnect=1)`
+    in case the server drops it. A consumer that has lost its session connects again.
+
+    Both limits are soft for a single message: a message bigger than `max_bytes` is accepted when the outbox is empty.
+
+    :param postman: Postman to send messages with
+    :type postman: mailem.postman.Postman
+    :param max_messages: The maximum number of messages in the outbox
+    :type max_messages: int
+    :param max_bytes: The maximum total size of messages in the outbox (texts and attachments); `None` for no limit
+    :type max_bytes: int|None
+    :param block: When the outbox is full, `put()` blocks the producer (`True`), or raises `OutboxFull` (`False`)
+    :type block: bool
+    :param workers: The number of consumer threads (connections) to `start()`
+    :type workers: int
+    :param on_sent: Callback(message) for every message sent
+    :type on_sent: callable|None
+    :param on_failed: Callback(message, exception) for every message that has failed
+    :type on_failed: callable|None
+
+    Callbacks run in the consumer threads. An exception from a callback is logged,
+    and does not affect the message or the consumer.
+    """
+
+    def __init__(self, postman, max_messages=1000, max_bytes=None, block=True, workers=1, on_sent=None, on_failed=None):
+        self._postman = postman
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.block = block
+        self.workers = workers
+        self._on_sent = on_sent
+        self._on_failed = on_failed
+
+        #: Queued messages: deque([ (message, size) ])
+        self._queue = deque()
+        #: The total size of the queued messages
+        self.bytes = 0
+        #: The number of messages taken by consumers, and not sent yet
+        self._inflight = 0
+        self._closed = False
+
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._not_empty = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._threads = []
+
+    def __len__(self):
+        """ The number of messages queued """
+        return len(self._queue)
+
+    def _full(self, size):
+        if len(self._queue) >= self.max_messages:
+            return True
+        return self.max_bytes is not None and self._queue and self.bytes + size > self.max_bytes
+
+    #region Producers
+
+    def put(self, message, block=None, timeout=None):
+        """ Put a message into the outbox
+
+        :param message: The message to send
+        :type message: mailem.message.Message
+        :param block: Wait while the outbox is full. Default: as configured
+        :type block: bool|None
+        :param timeout: The maximum number of seconds to wait
+        :type timeout: float|None
+        :raises OutboxFull: The outbox is full, and `block=False` or the timeout has expired
+        :raises RuntimeError: The outbox is closed
+        """
+        block = self.block if block is None else block
+        size = _message_size(message)
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._not_full:
+            while True:
+                if self._closed:
+                    raise RuntimeError('The outbox is closed')
+                if not self._full(size):
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise OutboxFull('The outbox is full: {} messages, {} bytes'.format(len(self._queue), self.bytes))
+                self._not_full.wait(remaining)
+
+            self._queue.append((message, size))
+            self.bytes += size
+            self._not_empty.notify()
+
+    def close(self):
+        """ Stop accepting messages. Consumers stop once the outbox is empty. """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    #endregion
+
+    #region Consumers
+
+    def get(self, timeout=None):
+        """ Take a message from the outbox, waiting for one if it's empty
+
+        Every message taken should be reported with `task_done()`.
+
+        :param timeout: The maximum number of seconds to wait
+        :type timeout: float|None
+        :return: The message, or `None` if the outbox is closed and empty, or the timeout has expired
+        :rtype: mailem.message.Message|None
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._not_empty:
+            while not self._queue:
+                remaining = None if deadline is None else deadline - time.time()
+                if self._closed or (remaining is not None and remaining <= 0):
+                    return None
+                self._not_empty.wait(remaining)
+
+            message, size = self._queue.popleft()
+            self.bytes -= size
+            self._inflight += 1
+            self._not_full.notify()
+            return message
+
+    def task_done(self):
+        """ Report that a message taken with `get()` has been handled """
+        with self._lock:
+            self._inflight -= 1
+            if not self._queue and not self._inflight:
+                self._all_done.notify_all()
+
+    def join(self):
+        """ Wait until all messages are handled """
+        with self._lock:
+            while self._queue or self._inflight:
+                self._all_done.wait()
+
+    def _handled(self, message, e=None):
+        """ Report the outcome of a message to the callbacks, and mark it as done. Called exactly once per message. """
+        try:
+            if e is None:
+                if self._on_sent:
+                    self._on_sent(message)
+            elif self._on_failed:
+                self._on_failed(message, e)
+        except Exception:
+            logger.exception('Outbox callback has failed')
+        finally:
+            self.task_done()
+
+    def _consumer(self):
+        from .connection.smtp import is_disconnect_error
+
+        message = self.get()
+        while message is not None:
+            try:
+                with self._postman.connect() as c:
+                    while message is not None:
+                        # From here on, the message is handled by this loop, whatever happens
+                        sending, message = message, None
+                        try:
+                            c.sendmail(sending)
+                        except Exception as e:
+                            self._handled(sending, e)
+                            if is_disconnect_error(e):
+                                break  # connect again
+                        else:
+                            self._handled(sending)
+                        message = self.get()
+            except Exception as e:
+                # Failed to connect: the message has failed.
+                # (Failures to disconnect are ignored: the messages have been handled)
+                if message is not None:
+                    self._handled(message, e)
+                    message = None
+            if message is None:
+                message = self.get()
+
+    def start(self):
+        """ Start the consumer threads """
+        for i in range(self.workers):
+            t = threading.Thread(target=self._consumer, name='mailem-outbox-{}'.format(i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        """ Close the outbox, and wait for the consumers to send everything """
+        self.close()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    #endregion
@@ -0,0 +1,317 @@
+""" Compact Message format, for handing messages over to other processes through a queue """
+
+import os
+import sys
+import json
+import mmap
+import struct
+import tempfile
+
+from .message import Message
+from .attachment import Attachment, ImageAttachment
+
+try:
+    unicode = unicode
+except NameError:  # Python 3
+    unicode = str
+
+PY2 = sys.version_info[0] == 2
+
+
+#: Frame header: magic, version, JSON length
+_FRAME = struct.Struct('>4sBI')
+_MAGIC = b'MLEM'
+_VERSION = 1
+
+#: Attachment classes: { type name: class }. Subclasses are not supported: they may have their own state.
+_ATTACHMENT_TYPES = {'file': Attachment, 'image': ImageAttachment}
+
+
+#region Attachment stores
+
+class IAttachmentStore(object):
+    """ Content-addressed storage for attachments: lets them cross the queue only once """
+
+    def __contains__(self, key):
+        """ Is the content stored?
+
+        :param key: Content hash: SHA-256, hex
+        :type key: str
+        :rtype: bool
+        """
+        raise NotImplementedError()
+
+    def put(self, key, data):
+        """ Store the content
+
+        :param key: Content hash: SHA-256, hex
+        :type key: str
+        :param data: Content
+        :type data: bytes|memoryview
+        """
+        raise NotImplementedError()
+
+    def get(self, key):
+        """ Get the content
+
+        :param key: Content hash: SHA-256, hex
+        :type key: str
+        :rtype: bytes|memoryview
+        :raises KeyError: Not stored
+        """
+        raise NotImplementedError()
+
+
+class MemoryAttachmentStore(IAttachmentStore):
+    """ Keeps attachments in memory: for tests, and for threads within a process """
+
+    def __init__(self):
+        self._data = {}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def put(self, key, data):
+        self._data[key] = data
+
+    def get(self, key):
+        return self._data[key]
+
+
+class DirectoryAttachmentStore(IAttachmentStore):
+    """ Keeps attachments as files in a directory shared by producers and consumers
+
+    Files are named by their content hash, and are written atomically. When read, they're memory-mapped:
+    attachments are not copied into the consumer's memory.
+
+    Nothing is ever deleted: clean up old files with a cron job.
+
+    :param path: Directory path. Created if it does not exist.
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        assert len(key) == 64 and all(c in '0123456789abcdef' for c in key), 'Invalid key: {!r}'.format(key)
+        return os.path.join(self.path, key)
+
+    def __contains__(self, key):
+        return os.path.exists(self._filename(key))
+
+    def put(self, key, data):
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, self._filename(key))
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def get(self, key):
+        try:
+            f = open(self._filename(key), 'rb')
+        except IOError:
+            raise KeyError(key)
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''  # empty files can't be mapped
+            if PY2:
+                return f.read()  # mmap has no buffer interface
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+#endregion
+
+
+#region Encoding
+
+def _tobytes(data):
+    return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+
+
+if PY2:
+    # Python 2 can't join, serialize or even bytes() memoryviews: copy
+    _view = _tobytes
+else:
+    _view = memoryview
+
+
+def _address(a):
+    return None if a is None else [a.email, a.name]
+
+
+def _encode(message, store):
+    """ Encode a message
+
+    :return: [ chunk ]: the frame header, the JSON header, and inline attachment data
+    :rtype: list[bytes|memoryview]
+    """
+    attachments = []
+    payloads = []
+    offset = 0
+    inline = {}  # { id(data): offset }: the same data is included once
+    for a in message._attachments:
+        type_name = next((name for name, cls in _ATTACHMENT_TYPES.items() if type(a) is cls), None)
+        if type_name is None:
+            raise TypeError('Unsupported attachment class: {}'.format(type(a).__name__))
+
+        data = a.data if a.data is not None else b''
+        text = isinstance(data, unicode)
+        if text:
+            data = data.encode('utf-8')
+        data = _view(data)
+
+        info = {'type': type_name, 'filename': a.filename, 'content_type': a.content_type,
+                'disposition': a.disposition, 'headers': a.headers, 'size': len(data), 'text': text}
+        if store is not None:
+            info['sha256'] = key = a._sha256()
+            if key not in store:
+                store.put(key, data)
+        elif id(a.data) in inline:
+            info['offset'] = inline[id(a.data)]
+        else:
+            info['offset'] = inline[id(a.data)] = offset
+            payloads.append(data)
+            offset += len(data)
+        attachments.append(info)
+
+    header = json.dumps({
+        'to': [_address(a) for a in message._recipients],
+        'cc': [_address(a) for a in message._cc],
+        'bcc': [_address(a) for a in message._bcc],
+        'from': _address(message._sender),
+        'reply_to': _address(message._reply_to),
+        'subject': message._subject,
+        'html': message._html,
+        'text': message._text,
+        'date': message._date,
+        'headers': message._headers,
+        'msgid': message._msgid,
+        'attachments': attachments,
+    }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    return [_FRAME.pack(_MAGIC, _VERSION, len(header)), header] + payloads
+
+
+def dumps(message, store=None):
+    """ Encode a message to bytes
+
+    The format is a small binary frame: a JSON header with the fields of the message,
+    followed by the raw attachment data. Nothing is MIME-encoded: the consumer does it when it sends the message.
+
+    When an attachment store is given, attachments are put into it by content hash, and only the hash is encoded:
+    an attachment shared by many messages (e.g. a Template's) crosses the queue once.
+
+    ```python
+    from mailem.pack import dumps, loads, DirectoryAttachmentStore
+
+    store = DirectoryAttachmentStore('/var/spool/mailem')
+
+    # Producer
+    queue.put(dumps(template(['user@example.com'], values), store))
+
+    # Consumer
+    with postman.connect() as c:
+        c.sendmail(loads(queue.get(), store))
+    ```
+
+    The Message-ID is kept: the consumer sends the same message.
+
+    :param message: The message
+    :type message: mailem.message.Message
+    :param store: Attachment store; `None` to include attachments in the message
+    :type store: IAttachmentStore|None
+    :rtype: bytes
+    :raises TypeError: The message has an attachment of an unsupported class
+    """
+    return b''.join(_encode(message, store))
+
+
+def dump(message, fp, store=None):
+    """ Encode a message, and write it to a file, without joining it into a single bytes object first
+
+    :param message: The message
+    :type message: mailem.message.Message
+    :param fp: Binary file
+    :param store: Attachment store
+    :type store: IAttachmentStore|None
+    """
+    for chunk in _encode(message, store):
+        fp.write(chunk)
+
+#endregion
+
+
+#region Decoding
+
+def _unaddress(a):
+    return None if a is None else tuple(a)
+
+
+def loads(data, store=None):
+    """ Decode a message
+
+    Decoding is cheap: the header is parsed, and attachments are zero-copy `memoryview` slices of `data`
+    (or of the store's memory-mapped files). On Python 2, attachments are copied to `bytes`.
+
+    :param data: Encoded message
+    :type data: bytes|bytearray|memoryview|mmap.mmap
+    :param store: Attachment store the message was encoded with
+    :type store: IAttachmentStore|None
+    :rtype: mailem.message.Message
+    :raises ValueError: Not an encoded message, or an unsupported version
+    :raises KeyError: An attachment is missing from the store
+    """
+    view = memoryview(data)
+    if len(view) < _FRAME.size:
+        raise ValueError('Not an encoded message: too short')
+    magic, version, length = _FRAME.unpack(view[:_FRAME.size].tobytes())
+    if magic != _MAGIC:
+        raise ValueError('Not an encoded message')
+    if version != _VERSION:
+        raise ValueError('Unsupported version: {}'.format(version))
+    start = _FRAME.size + length
+    h = json.loads(view[_FRAME.size:start].tobytes().decode('utf-8'))
+
+    attachments = []
+    for info in h['attachments']:
+        if 'sha256' in info:
+            if store is None:
+                raise KeyError('The message has attachments in a store: {}'.format(info['sha256']))
+            payload = store.get(info['sha256'])
+        else:
+            offset = start + info['offset']
+            payload = view[offset:offset + info['size']]
+        if info['text']:
+            payload = _tobytes(payload).decode('utf-8')
+        elif PY2:
+            payload = _tobytes(payload)
+
+        if info['type'] == 'image':
+            a = ImageAttachment(info['filename'], payload, info['disposition'], info['headers'])
+        else:
+            a = Attachment(info['filename'], payload, info['content_type'], info['disposition'], info['headers'])
+        attachments.append(a)
+
+    return Message(
+        [_unaddress(a) for a in h['to']], h['subject'], h['html'], h['text'],
+        sender=_unaddress(h['from']), cc=[_unaddress(a) for a in h['cc']], bcc=[_unaddress(a) for a in h['bcc']],
+        attachments=attachments, reply_to=_unaddress(h['reply_to']), date=h['date'], headers=h['headers'],
+        msgid=h['msgid'])
+
+
+def load(fp, store=None):
+    """ Read an encoded message from a file
+
+    :param fp: Binary file
+    :param store: Attachment store the message was encoded with
+    :type store: IAttachmentStore|None
+    :rtype: mailem.message.Message
+    """
+    return loads(fp.read(), store)
+
+#endregion
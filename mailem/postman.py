@@ -1,4 +1,5 @@
 from .connection.lo import LoopbackConnection
+from .metrics import timer
 
 
 class Postman(object):
@@ -31,46 +32,118 @@ class Postman(object):
     :type sender: basestring|tuple[basestring]
     :param connection: Connection object to use. See below.
     :type connection: mailem.connection.IConnection
+    :param reconnect: The number of times to reconnect and retry a message when the server drops the session.
+
+        Servers drop idle sessions, as well as sessions that have sent too many messages
+        ("421 Too many messages on this connection"). With `reconnect`, the connected Postman reconnects
+        transparently and re-sends the failed message, so long batches survive that.
+    :type reconnect: int
+    :param metrics: Metrics collector: gets the 'sendmail' stage, and is installed on the connection as well.
+        See [`HistogramMetrics`](#histogrammetrics).
+    :type metrics: mailem.metrics.IMetrics|None
+    :param dkim: DKIM signer, installed on the connection: every message is signed. See [`DKIMSigner`](#dkimsigner).
+        Create it once: it parses the private key, and caches body hashes.
+    :type dkim: mailem.dkim.DKIMSigner|None
     """
 
-    def __init__(self, sender, connection):
+    def __init__(self, sender, connection, reconnect=0, metrics=None, dkim=None):
         self._sender = sender
         self._connection = connection
+        self._reconnect = reconnect
+        self._metrics = metrics
+        if metrics is not None:
+            connection.set_metrics(metrics)
+        if dkim is not None:
+            connection.set_dkim(dkim)
 
     def connect(self):
         """ Get connected Postman context manager.
 
         :rtype: mailem.postman.ConnectedPostman
         """
-        return ConnectedPostman(self._sender, self._connection)
+        return ConnectedPostman(self._sender, self._connection, self._reconnect, self._metrics)
 
-    def loopback(self):
+    def loopback(self, **kwargs):
         """ Get a context manager which installs a LoopbackConnection on this postman.
 
         This allows you to record outgoing messages by mocking a Postman.
         See [`LoopbackConnection`](#loopbackconnection).
 
+        :param kwargs: LoopbackConnection options: `maxlen`, `store`
+
         :return: Context manager which loops back outgoing messages
         :rtype: MockedPostman
         """
-        return MockedPostman(self)
+        return MockedPostman(self, **kwargs)
+
+    def outbox(self, **kwargs):
+        """ Get a bounded queue that sends messages through this postman in the background.
+
+        See [`Outbox`](#outbox).
+
+        :param kwargs: Outbox options: `max_messages`, `max_bytes`, `block`, `workers`, `on_sent`, `on_failed`
+        :return: Context manager that starts the consumers, and waits for them on exit
+        :rtype: mailem.outbox.Outbox
+        """
+        from .outbox import Outbox
+        return Outbox(self, **kwargs)
+
+    def warmup(self, n=None, wait=False):
+        """ Open and authenticate sessions ahead of time, in the background.
+
+        Only works with connections that keep sessions, like [`PooledConnection`](#pooledconnection);
+        does nothing otherwise.
+
+        :param n: The number of sessions to open
+        :type n: int|None
+        :param wait: Wait until the sessions are ready
+        :type wait: bool
+        """
+        self._connection.warmup(n, wait)
 
 
 class ConnectedPostman(Postman):
     def __init__(self, *args):
         super(ConnectedPostman, self).__init__(*args)
+        self.client = None
+        #: The last `sendmail()` has failed: the session may be in the middle of a transaction
+        self._failed = False
 
     def sendmail(self, message):
         """ Send the message
 
+        When the server has dropped the session, reconnects and retries, up to `reconnect` times.
+
+        The message is not modified, so the same Message can be sent from multiple threads.
+
         :param message: Message
         :type message: mailem.message.Message
-        :return: The same message
+        :return: The message sent: with the default sender, if it had none
         :rtype: mailem.message.Message
         """
-        message._sender_default(self._sender)
-        self._connection.sendmail(self.client, message)
-        return message
+        message = message._with_sender(self._sender)
+        self._failed = True
+
+        with timer(self._metrics, 'sendmail', recipients=len(message._envelope())) as t:
+            attempt = 0
+            while True:
+                try:
+                    self._connection.sendmail(self.client, message)
+                    t.info['code'] = 250
+                    self._failed = False
+                    return message
+                except Exception as e:
+                    from .connection.smtp import is_disconnect_error  # not at the top: smtplib is slow to import
+                    if attempt >= self._reconnect or not is_disconnect_error(e):
+                        raise
+                    attempt += 1
+                    self.reconnect()
+
+    def reconnect(self):
+        """ Drop the current session and start a new one """
+        client, self.client = self.client, None
+        self._connection.discard(client)
+        self.client = self._connection.connect()
 
     def __enter__(self):
         """ Connect """
@@ -78,9 +151,17 @@ class ConnectedPostman(Postman):
         self._connected = True
         return self
 
-    def __exit__(self, *exc):
-        """ Disconnect """
-        self._connection.disconnect(self.client)
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Disconnect
+
+        When the block has failed, or the last message has, the session is discarded:
+        it may be in the middle of a transaction, and is not fit for reuse (e.g. by a pool).
+        """
+        if self.client is not None:
+            if exc_type is not None or self._failed:
+                self._connection.discard(self.client)
+            else:
+                self._connection.disconnect(self.client)
         self._connected = False
 
 
@@ -89,12 +170,13 @@ class MockedPostman(LoopbackConnection):
 
     :param postman: Postman to mock
     :type postman: mailem.postman.Postman
+    :param kwargs: LoopbackConnection options
     """
 
-    def __init__(self, postman):
+    def __init__(self, postman, **kwargs):
         self._postman = postman
         self._connection_back = None
-        super(MockedPostman, self).__init__()
+        super(MockedPostman, self).__init__(**kwargs)
 
     def __enter__(self):
         # Backup
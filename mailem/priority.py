@@ -0,0 +1,260 @@
+import time
+import threading
+from collections import deque
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class PriorityClass(object):
+    """ Priority class: a queue of the PriorityScheduler
+
+    :param name: Class name, used with `PriorityScheduler.submit()`
+    :type name: str
+    :param weight: Share of the shared connections, relative to the other classes
+    :type weight: float
+    :param reserved: The number of connections that only serve this class
+    :type reserved: int
+    """
+
+    def __init__(self, name, weight=1.0, reserved=0):
+        assert weight > 0, 'weight should be positive'
+        self.name = name
+        self.weight = float(weight)
+        self.reserved = reserved
+
+        #: Queued messages: deque([ (queued at, message) ])
+        self._queue = deque()
+        #: Virtual finish time of the last message served (weighted fair queuing)
+        self._pass = 0.0
+
+    def __repr__(self):
+        return 'PriorityClass({!r}, weight={:g}, reserved={})'.format(self.name, self.weight, self.reserved)
+
+
+class PriorityScheduler(object):
+    """ Sends messages through a pool of connections, with priority classes.
+
+    Transactional mail (password resets) and bulk mail (newsletters) can share the same Postman
+    without resets waiting behind a draining campaign:
+
+    * Every class can have connections reserved for it: these never send anything else,
+      so an urgent message starts sending as soon as it's submitted, unless all its reserved connections are busy
+    * The other connections are shared using weighted fair queuing: when several classes have messages waiting,
+      each gets a share of the messages proportional to its weight. Idle classes give their share to the others,
+      so bulk mail uses all shared connections while nothing else is queued.
+
+    Within a class, messages are sent in the order they were submitted.
+
+    Example:
+
+    ```python
+    from mailem import Postman
+    from mailem.priority import PriorityScheduler, PriorityClass
+
+    scheduler = PriorityScheduler(
+        Postman('user@example.com', SMTPConnection(...), reconnect=1),
+        classes=[PriorityClass('urgent', weight=10, reserved=1),
+                 PriorityClass('bulk', weight=1)],
+        workers=8,
+        on_failed=lambda message, e: log.error('Failed: %s', e))
+    scheduler.start()
+
+    for msg in newsletter:
+        scheduler.submit(msg, 'bulk')
+    scheduler.submit(password_reset, 'urgent')  # sent right away
+
+    scheduler.join()  # wait until everything is sent
+    scheduler.stop()
+    ```
+
+    Every worker keeps its own session open while there's something to send;
+    a session idle for `idle_timeout` seconds is closed.
+
+    When given a metrics collector, the time messages wait in the queue is recorded as the `'queue'` stage,
+    with the `priority` info.
+
+    :param postman: Postman to send messages with
+    :type postman: mailem.postman.Postman
+    :param classes: Priority classes, highest priority first: it wins ties.
+        Default: 'urgent' (weight 10, 1 reserved connection) and 'bulk'
+    :type classes: list[PriorityClass]|None
+    :param workers: The total number of connections, reserved ones included
+    :type workers: int
+    :param idle_timeout: Close a worker's session after it has been idle for this many seconds
+    :type idle_timeout: float
+    :param on_sent: Callback(message) for every message sent
+    :type on_sent: callable|None
+    :param on_failed: Callback(message, exception) for every message that has failed
+    :type on_failed: callable|None
+    :param metrics: Metrics collector for the 'queue' stage
+    :type metrics: mailem.metrics.IMetrics|None
+    """
+
+    def __init__(self, postman, classes=None, workers=4, idle_timeout=30.0, on_sent=None, on_failed=None, metrics=None):
+        if classes is None:
+            classes = [PriorityClass('urgent', weight=10, reserved=1), PriorityClass('bulk')]
+        assert sum(c.reserved for c in classes) < workers, 'Reserved connections should leave some shared ones'
+
+        self._postman = postman
+        self.classes = classes
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self._on_sent = on_sent
+        self._on_failed = on_failed
+        self._metrics = metrics
+
+        self._classes = {c.name: c for c in classes}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        #: The number of messages being sent right now
+        self._inflight = 0
+        #: Virtual time: the virtual start time of the last message picked by a shared worker
+        self._vtime = 0.0
+
+    def __len__(self):
+        """ The number of messages queued """
+        return sum(len(c._queue) for c in self.classes)
+
+    def submit(self, message, priority=None):
+        """ Queue a message
+
+        :param message: The message to send
+        :type message: mailem.message.Message
+        :param priority: Priority class name. Default: the lowest priority class
+        :type priority: str|None
+        :raises KeyError: unknown priority class
+        """
+        cls = self._classes[priority] if priority is not None else self.classes[-1]
+        with self._cond:
+            if not cls._queue:
+                # A class that was idle does not get credit for the time it was idle
+                cls._pass = max(cls._pass, self._vtime)
+            cls._queue.append((_clock(), message))
+            self._cond.notify_all()
+
+    def _pick(self, reserved_for):
+        """ Pick the next message for a worker. Call with the lock held.
+
+        :param reserved_for: The class the worker is reserved for; `None` for shared workers
+        :type reserved_for: PriorityClass|None
+        :return: (class, (queued at, message)), or `None` if there's nothing to send
+        """
+        if reserved_for is not None:
+            if not reserved_for._queue:
+                return None
+            return reserved_for, reserved_for._queue.popleft()
+
+        # Weighted fair queuing: the class with the smallest virtual finish time goes first
+        cls = None
+        for c in self.classes:
+            if c._queue and (cls is None or c._pass + 1 / c.weight < cls._pass + 1 / cls.weight):
+                cls = c
+        if cls is None:
+            return None
+        self._vtime = cls._pass
+        cls._pass += 1 / cls.weight
+        return cls, cls._queue.popleft()
+
+    #region Workers
+
+    def start(self):
+        """ Start the worker threads """
+        with self._cond:
+            self._stopping = False
+        reserved = [c for c in self.classes for i in range(c.reserved)]
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, args=(reserved[i] if i < len(reserved) else None,),
+                                 name='mailem-priority-{}'.format(i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def _worker(self, reserved_for):
+        session = None
+        try:
+            while True:
+                picked = None
+                with self._cond:
+                    while not self._stopping:
+                        picked = self._pick(reserved_for)
+                        if picked is not None:
+                            self._inflight += 1
+                            break
+                        if not self._cond.wait(self.idle_timeout if session is not None else None) \
+                                and session is not None:
+                            break  # idle for too long: close the session
+                    else:
+                        return
+
+                if picked is None:
+                    session = self._close(session)
+                    continue
+
+                cls, (queued_at, message) = picked
+                if self._metrics is not None:
+                    self._metrics.record('queue', _clock() - queued_at, priority=cls.name)
+                try:
+                    if session is None:
+                        session = self._postman.connect().__enter__()
+                    session.sendmail(message)
+                except Exception as e:
+                    from .connection.smtp import is_disconnect_error
+                    if is_disconnect_error(e):
+                        session = self._close(session)
+                    if self._on_failed:
+                        self._on_failed(message, e)
+                else:
+                    if self._on_sent:
+                        self._on_sent(message)
+                finally:
+                    with self._cond:
+                        self._inflight -= 1
+                        self._cond.notify_all()
+        finally:
+            self._close(session)
+
+    def _close(self, session):
+        """ Close a worker's session, ignoring errors """
+        if session is not None:
+            try:
+                session.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def join(self, timeout=None):
+        """ Wait until all queued messages are sent
+
+        :param timeout: The maximum number of seconds to wait
+        :type timeout: float|None
+        :return: Whether everything was sent
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while len(self) or self._inflight:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self):
+        """ Stop the workers once they're done with the messages they're sending. Queued messages stay queued. """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.join()
+        self.stop()
+
+    #endregion
@@ -0,0 +1,178 @@
+import time
+import heapq
+import random
+import threading
+import itertools
+from collections import deque
+
+from .connection.smtp import is_transient_error, is_disconnect_error
+
+
+class RetryScheduler(object):
+    """ Sends messages through a Postman, and retries transient failures with exponential backoff.
+
+    Every error is classified (see `is_transient_error()`):
+
+    * Transient failures (4xx replies, timeouts, connection resets) are rescheduled with jittered exponential backoff
+    * Permanent failures (5xx replies, refused recipients) are reported right away
+
+    Messages wait in a time-ordered queue: failed messages do not block the others,
+    and the scheduler never sleeps while there's something to send.
+
+    Example:
+
+    ```python
+    from mailem import Postman
+    from mailem.retry import RetryScheduler
+
+    scheduler = RetryScheduler(Postman('user@example.com', SMTPConnection(...)),
+                               on_failed=lambda message, e: log.error('Failed: %s', e))
+    for msg in messages:
+        scheduler.schedule(msg)
+
+    # Send everything, waiting for the retries
+    scheduler.run()
+    ```
+
+    Alternatively, call [`tick()`](#retryschedulertick) from your own event loop: it sends whatever is due,
+    and tells how long to wait for the next one.
+
+    :param postman: Postman to send messages with
+    :type postman: mailem.postman.Postman
+    :param max_attempts: The maximum number of attempts to send a message
+    :type max_attempts: int
+    :param base_delay: Delay before the first retry, seconds. Doubles with every attempt.
+    :type base_delay: float
+    :param max_delay: The maximum delay between retries, seconds
+    :type max_delay: float
+    :param jitter: Random jitter, as a fraction of the delay: 0 (none) .. 1 (full jitter)
+    :type jitter: float
+    :param on_sent: Callback(message) for every message sent
+    :type on_sent: callable|None
+    :param on_failed: Callback(message, exception) for every message that has finally failed
+    :type on_failed: callable|None
+    :param clock: Time function. Default: `time.time`
+    :type clock: callable|None
+    """
+
+    def __init__(self, postman, max_attempts=5, base_delay=1.0, max_delay=600.0, jitter=0.5,
+                 on_sent=None, on_failed=None, clock=None):
+        self._postman = postman
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._on_sent = on_sent
+        self._on_failed = on_failed
+        self._clock = clock or time.time
+
+        #: Time-ordered queue: [ (due, seq, attempt, message) ]
+        self._queue = []
+        self._seq = itertools.count()  # keeps the ordering stable for messages with the same due time
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def backoff(self, attempt):
+        """ Get the delay before the next attempt
+
+        :param attempt: The number of attempts made so far
+        :type attempt: int
+        :rtype: float
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def schedule(self, message, delay=0, attempt=0):
+        """ Put a message into the queue
+
+        :param message: The message to send
+        :type message: mailem.message.Message
+        :param delay: Send it not earlier than in `delay` seconds
+        :type delay: float
+        :param attempt: The number of attempts made so far
+        :type attempt: int
+        """
+        with self._lock:
+            heapq.heappush(self._queue, (self._clock() + delay, next(self._seq), attempt, message))
+
+    def next_due(self):
+        """ Get the number of seconds until the next message is due
+
+        :return: Delay; 0 if something is due already; `None` if the queue is empty
+        :rtype: float|None
+        """
+        with self._lock:
+            if not self._queue:
+                return None
+            return max(0, self._queue[0][0] - self._clock())
+
+    def _pop_due(self):
+        """ Pop all messages that are due
+
+        :rtype: collections.deque
+        """
+        now = self._clock()
+        due = deque()
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                due.append(heapq.heappop(self._queue))
+        return due
+
+    def _failed(self, entry, e):
+        """ Handle a failed attempt: reschedule, or give up """
+        due, seq, attempt, message = entry
+        attempt += 1
+        if is_transient_error(e) and attempt < self.max_attempts:
+            self.schedule(message, self.backoff(attempt), attempt)
+        elif self._on_failed:
+            self._on_failed(message, e)
+
+    def tick(self):
+        """ Send all messages that are due, within a single connection
+
+        :return: The number of seconds until the next message is due, or `None` when the queue is empty
+        :rtype: float|None
+        """
+        due = self._pop_due()
+
+        if due:
+            try:
+                with self._postman.connect() as c:
+                    while due:
+                        entry = due.popleft()
+                        try:
+                            c.sendmail(entry[3])
+                        except Exception as e:
+                            self._failed(entry, e)
+                            # The session is gone: the rest will go with the next tick
+                            if is_disconnect_error(e):
+                                break
+                        else:
+                            if self._on_sent:
+                                self._on_sent(entry[3])
+            except Exception as e:
+                # Failed to connect (or disconnect): whatever's left is counted as failed
+                while due:
+                    self._failed(due.popleft(), e)
+
+            # Return the rest without penalty
+            with self._lock:
+                for entry in due:
+                    heapq.heappush(self._queue, entry)
+
+        return self.next_due()
+
+    def run(self, sleep=None):
+        """ Send everything, waiting for the retries, until the queue is empty
+
+        :param sleep: Sleep function, used only when there's nothing due. Default: `time.sleep`
+        :type sleep: callable|None
+        """
+        sleep = sleep or time.sleep
+        delay = self.tick()
+        while delay is not None:
+            if delay > 0:
+                sleep(delay)
+            delay = self.tick()
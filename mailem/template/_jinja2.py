@@ -0,0 +1,29 @@
+import jinja2
+
+from .renderer import IRenderer
+
+
+class Jinja2TemplateRenderer(IRenderer):
+    """ Jinja2 Template Renderer
+
+    See <http://jinja.pocoo.org/docs/>.
+
+    With `enable_async=True`, templates can be rendered in the event loop with `render_async()`,
+    and template values can be coroutines and async iterables: e.g. database queries, awaited by the template.
+    """
+
+    def __init__(self, template, **kwargs):
+        kwargs.setdefault('undefined', jinja2.StrictUndefined)
+        kwargs.setdefault('keep_trailing_newline', True)
+        env = jinja2.Environment(
+            loader=jinja2.FunctionLoader(lambda name: template),
+            **kwargs
+        )
+        self.template = env.get_template('x')
+        self.is_async = getattr(env, 'is_async', False)  # Jinja2 2.9+
+
+    def __call__(self, values):
+        return self.template.render(values)
+
+    def render_async(self, values):
+        return self.template.render_async(values)
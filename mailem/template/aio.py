@@ -0,0 +1,36 @@
+""" Rendering templates in asyncio applications. Python 3 only. """
+
+import asyncio
+import functools
+
+from ..metrics import timer
+
+
+async def render_async(template, recipients, values, executor=None, **kwargs):
+    """ Render a template without blocking the event loop. See [`Template.render_async()`](#templaterender_async)
+
+    :param template: The template
+    :type template: mailem.template.Template
+    :param recipients: Message recipients list
+    :type recipients: Iterable[basestring|tuple[basestring]]
+    :param values: Dictionary with template values
+    :type values: dict
+    :param executor: Executor for synchronous renderers. Default: the loop's default executor
+    :type executor: concurrent.futures.Executor|None
+    :param kwargs: keyword arguments for the Message constructor
+    :rtype: mailem.Message
+    """
+    values = template._values(values)  # also sets the default renderer: not in a thread
+    parts = (template._subject, template._html, template._text)
+
+    # Sync renderer: in a thread
+    if not all(part is None or part.is_async for part in parts):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, functools.partial(template, recipients, values, **kwargs))
+
+    # Async renderer: in the loop
+    with timer(template._metrics, 'render'):
+        subject = await template._subject.render_async(values)
+        html = await template._html.render_async(values) if template._html else None
+        text = await template._text.render_async(values) if template._text else None
+        return template._message(recipients, subject, html, text, kwargs)
@@ -54,6 +54,7 @@ class TemplateRegistry(object):
         self._templates = {}
         self._renderer = None
         self._defaults = {}
+        self._metrics = None
 
     def defaults(self, values):
         """ Set default values on all templates.
@@ -97,6 +98,23 @@ class TemplateRegistry(object):
         # Finish
         return self
 
+    def set_metrics(self, metrics):
+        """ Install a metrics collector on all templates.
+
+        Can be called both before adding templates and after.
+
+        :param metrics: Metrics collector
+        :type metrics: mailem.metrics.IMetrics|None
+        """
+        self._metrics = metrics
+
+        # Set it on all existing templates
+        for t in self._templates.values():
+            t.set_metrics(metrics)
+
+        # Finish
+        return self
+
     def add(self, name, template):
         """ Register a template
 
@@ -114,6 +132,8 @@ class TemplateRegistry(object):
         if self._renderer:
             template.set_renderer(self._renderer)
         template.defaults(self._defaults)
+        if self._metrics is not None:
+            template.set_metrics(self._metrics)
 
         # Finish
         return template
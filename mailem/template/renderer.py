@@ -1,9 +1,13 @@
+import sys
 from string import Template
 
 
 class IRenderer(object):
     """ Base class for template renderer """
 
+    #: The renderer supports `render_async()`
+    is_async = False
+
     def __init__(self, template, **kwargs):
         """ Init renderer with a template string
 
@@ -24,6 +28,18 @@ class IRenderer(object):
         """
         raise NotImplementedError()
 
+    def render_async(self, values):
+        """ Render a template with the provided values, in the event loop.
+
+        Only available when `is_async` is set.
+
+        :param values: Values to render the template with.
+        :type values: dict
+        :returns: Awaitable: the rendered template
+        :rtype: Awaitable[basestring]
+        """
+        raise NotImplementedError()
+
 
 class PythonTemplateRenderer(IRenderer):
     """ Simple Python Template renderer.
@@ -42,26 +58,21 @@ class PythonTemplateRenderer(IRenderer):
         return self.template.substitute(values)
 
 
-try:  # Only if jinja2 is available
-    import jinja2
-
-    class Jinja2TemplateRenderer(IRenderer):
-        """ Jinja2 Template Renderer
-
-        See <http://jinja.pocoo.org/docs/>.
-        """
-
-        def __init__(self, template, **kwargs):
-            kwargs.setdefault('undefined', jinja2.StrictUndefined)
-            kwargs.setdefault('keep_trailing_newline', True)
-            env = jinja2.Environment(
-                loader=jinja2.FunctionLoader(lambda name: template),
-                **kwargs
-            )
-            self.template = env.get_template('x')
-
-        def __call__(self, values):
-            return self.template.render(values)
-
-except ImportError:
-    pass
+# Jinja2 is optional, and slow to import: the renderer is imported on first use
+def __getattr__(name):
+    if name == 'Jinja2TemplateRenderer':
+        try:
+            from ._jinja2 import Jinja2TemplateRenderer
+        except ImportError:  # no jinja2
+            pass
+        else:
+            globals()[name] = Jinja2TemplateRenderer
+            return Jinja2TemplateRenderer
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    try:
+        from ._jinja2 import Jinja2TemplateRenderer
+    except ImportError:  # no jinja2
+        pass
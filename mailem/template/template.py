@@ -1,9 +1,11 @@
 import os
 import re
+import sys
 from io import open
 
 from .. import Message, Attachment
 from .renderer import PythonTemplateRenderer
+from ..metrics import timer
 
 
 class Template(object):
@@ -143,6 +145,7 @@ class Template(object):
         self._attachments = attachments
         self._default_values = {}
         self._renderer = None
+        self._metrics = None
         self.defaults(defaults or {})
 
     def defaults(self, values):
@@ -156,6 +159,15 @@ class Template(object):
         self._default_values.update(values)
         return self
 
+    def set_metrics(self, metrics):
+        """ Install a metrics collector to report the 'render' stage to.
+
+        :param metrics: Metrics collector
+        :type metrics: mailem.metrics.IMetrics|None
+        """
+        self._metrics = metrics
+        return self
+
     def set_renderer(self, Renderer, **kwargs):
         """ Set renderer to be used with this template.
 
@@ -194,17 +206,61 @@ class Template(object):
         :raises KeyError: A template value was not provided
         :raises Exception: other renderer exceptions
         """
-        # Default renderer
+        values = self._values(values)
+
+        with timer(self._metrics, 'render'):
+            return self._message(
+                recipients,
+                self._subject(values),
+                self._html(values) if self._html else None,
+                self._text(values) if self._text else None,
+                kwargs)
+
+    def render_async(self, recipients, values, executor=None, **kwargs):
+        """ Create a `Message` object using the template values, without blocking the event loop.
+
+        With an async renderer (e.g. `set_renderer(Jinja2TemplateRenderer, enable_async=True)`),
+        the template is rendered in the event loop, and template values can be coroutines and async iterables.
+        Otherwise, rendering is offloaded to an executor thread, and the loop goes on while big templates render.
+        Note that async rendering only yields to the loop while awaiting values: for big templates that await nothing,
+        the executor does better.
+
+        ```python
+        message = await signup.render_async(['user@gmail.com'], dict(user='Honored User',))
+        ```
+
+        Python 3 only.
+
+        :param recipients: Message recipients list
+        :type recipients: Iterable[basestring|tuple[basestring]]
+        :param values: Dictionary with template values
+        :type values: dict
+        :param executor: Executor for synchronous renderers. Default: the loop's default executor
+        :type executor: concurrent.futures.Executor|None
+        :param kwargs: keyword arguments for the [`Message`](#message) constructor
+        :type kwargs: dict
+        :returns: Awaitable: the rendered `Message` object
+        :rtype: Awaitable[Message]
+        :raises NotImplementedError: Python 2
+        """
+        if sys.version_info < (3, 5):
+            raise NotImplementedError('render_async() requires Python 3.5+')
+        from .aio import render_async
+        return render_async(self, recipients, values, executor, **kwargs)
+
+    def _values(self, values):
+        """ Get the template values, with defaults; set the default renderer """
         if self._renderer is None:
             self.set_renderer(PythonTemplateRenderer)
+        return dict(list(self._default_values.items()) + list(values.items()))
 
-        values = dict(list(self._default_values.items()) + list(values.items()))
-
+    def _message(self, recipients, subject, html, text, kwargs):
+        """ Create a `Message` object from rendered parts """
         return Message(
             recipients,
-            subject=self._subject(values),
-            html=self._html(values) if self._html else None,
-            text=self._text(values) if self._text else None,
+            subject=subject,
+            html=html,
+            text=text,
             attachments=list(self._attachments or []) + list(kwargs.pop('attachments', [])),
             **kwargs
         )
@@ -1,9 +1,16 @@
 """ Helpers & Utils """
 
+import re
+import sys
+import importlib
 from email import charset
 from email.header import Header
-from email.utils import formataddr
-from past.builtins import basestring
+from email.utils import formataddr, parseaddr, getaddresses
+
+try:
+    basestring = basestring
+except NameError:  # Python 3
+    basestring = str
 
 
 # Add charset to the global registry, since we're only using unicode here
@@ -11,6 +18,42 @@ from past.builtins import basestring
 charset.add_charset('utf-8', charset.SHORTEST, None, 'utf-8')
 
 
+def lazy_imports(module_name, attrs):
+    """ Import module attributes on first use (PEP 562). Python < 3.7 imports them right away.
+
+    Usage, in a package `__init__`:
+
+    ```python
+    __getattr__ = lazy_imports(__name__, {
+        'SMTPConnection': ('.smtp', 'SMTPConnection'),
+        'smtp': ('.smtp', None),  # the module itself
+    })
+    ```
+
+    :param module_name: Name of the package to set the attributes on, and to resolve relative module names against
+    :type module_name: str
+    :param attrs: { attribute name: (module name, attribute name, or `None` for the module itself) }
+    :type attrs: dict
+    :return: Module `__getattr__` function
+    :rtype: callable
+    """
+    def __getattr__(name):
+        try:
+            module, attr = attrs[name]
+        except KeyError:
+            raise AttributeError('module {!r} has no attribute {!r}'.format(module_name, name))
+        value = importlib.import_module(module, module_name)
+        if attr is not None:
+            value = getattr(value, attr)
+        setattr(sys.modules[module_name], name, value)  # next time, found without __getattr__
+        return value
+
+    if sys.version_info < (3, 7):
+        for name in attrs:
+            __getattr__(name)
+    return __getattr__
+
+
 def unicode_header(*args, **kwargs):
     """ Shortcut to create a unicode Header() string.
 
@@ -19,22 +62,77 @@ def unicode_header(*args, **kwargs):
     return str(Header(*args, charset='utf-8', **kwargs))
 
 
+#region Addresses
+
+#: Normalized domains: { domain: (lowercase domain, IDNA-encoded domain) }
+_domains = {}
+_domains_max = 10000
+
+
+def normalize_domain(domain):
+    """ Normalize a domain: lowercase, and IDNA-encoded (punycode) for the wire
+
+    Results are cached: IDNA encoding is expensive, and recipients of bulk mail share a handful of domains.
+
+    :param domain: Domain name
+    :type domain: basestring
+    :return: (lowercase domain, ASCII domain)
+    :rtype: (basestring, str)
+    """
+    try:
+        return _domains[domain]
+    except KeyError:
+        pass
+
+    lower = domain.strip().rstrip('.').lower()
+    try:
+        lower.encode('ascii')
+        ascii = lower
+    except UnicodeError:
+        try:
+            ascii = lower.encode('idna').decode('ascii')
+        except UnicodeError:
+            ascii = lower  # not a valid IDN: leave it to the server
+
+    if len(_domains) >= _domains_max:
+        _domains.clear()
+    _domains[domain] = result = (lower, ascii)
+    return result
+
+
 class Address(object):
     """ E-Mail address
 
-    :param arg: e-mail address, or a 2-tuple (email, name)
+    The domain is normalized: lowercase, and available in ASCII (IDNA) as `ascii_email` for servers with no SMTPUTF8.
+
+    :param arg: e-mail address, 'Name <email>', or a 2-tuple (email, name)
     :type arg: basestring|tuple[basestring]
     """
 
     def __init__(self, arg):
         if isinstance(arg, basestring):
-            self.email = arg
-            self.name = None
+            if '<' in arg:
+                name, email = parseaddr(arg)
+                if not email:
+                    raise ValueError('Invalid address: {!r}'.format(arg))
+                self.name = name or None
+            else:
+                email, self.name = arg.strip(), None
         elif isinstance(arg, tuple) and len(arg) == 2:
-            self.email, self.name = arg
+            email, name = arg
+            self.name = name or None
         else:
             raise ValueError('Invalid address: should be a string or a 2-tuple, having: {!r}'.format(arg))
 
+        local, at, domain = email.rpartition('@')
+        if at:
+            lower, ascii = normalize_domain(domain)
+            self.email = local + u'@' + lower
+            #: The address with an IDNA-encoded domain
+            self.ascii_email = self.email if ascii == lower else local + u'@' + ascii
+        else:
+            self.email = self.ascii_email = email
+
     def __hash__(self):
         return hash((self.email, self.name))
 
@@ -46,10 +144,67 @@ class Address(object):
     def __str__(self):
         return formataddr((
             unicode_header(self.name) if self.name else None,
-            self.email
+            self.ascii_email
         ))
 
+    _specials_rex = re.compile(r'[][\\()<>@,:;".]')
+    _escapes_rex = re.compile(r'[\\"]')
+
+    def format(self, utf8=False):
+        """ Format the address for a header
+
+        :param utf8: Leave non-ASCII characters as is (for SMTPUTF8 servers), instead of encoding them
+        :type utf8: bool
+        :rtype: str
+        """
+        if not utf8:
+            return str(self)
+        if not self.name:
+            return self.email
+
+        name = self.name
+        if self._specials_rex.search(name):
+            name = u'"{}"'.format(self._escapes_rex.sub(r'\\\g<0>', name))
+        return u'{} <{}>'.format(name, self.email)
+
     def __repr__(self):
         if not self.name:
             return u'Address({!r})'.format(self.email)
         return u'Address(({!r}, {!r}))'.format(self.email, self.name)
+
+
+def parse_addresses(addresses):
+    """ Parse addresses in bulk
+
+    :param addresses: Addresses: e-mails, 'Name <email>' strings, (email, name) tuples, `Address` objects;
+        or a single string with comma-separated addresses
+    :type addresses: Iterable[basestring|tuple[basestring]|Address]|basestring
+    :rtype: list[Address]
+    :raises ValueError: Invalid address
+    """
+    if isinstance(addresses, basestring):
+        addresses = [(email, name) for name, email in getaddresses([addresses]) if email]
+    return [a if isinstance(a, Address) else Address(a) for a in addresses]
+
+
+def unique_emails(addresses, utf8=False):
+    """ Get the envelope: e-mail addresses with duplicates removed
+
+    Addresses are compared case-insensitively, and the first one wins.
+
+    :param addresses: Addresses
+    :type addresses: Iterable[Address]
+    :param utf8: Keep internationalized domains as is (for SMTPUTF8 servers), instead of IDNA-encoding them
+    :type utf8: bool
+    :rtype: list[basestring]
+    """
+    seen = set()
+    emails = []
+    for a in addresses:
+        key = a.ascii_email.lower()
+        if key not in seen:
+            seen.add(key)
+            emails.append(a.email if utf8 else a.ascii_email)
+    return emails
+
+#endregion
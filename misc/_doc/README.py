@@ -1,4 +1,12 @@
 import mailem
+import mailem.retry
+import mailem.priority
+import mailem.outbox
+import mailem.dkim
+import mailem.pack
+import mailem.campaign
+import mailem.merge
+import mailem.metrics
 from exdoc import doc, getmembers
 
 import json
@@ -11,12 +19,31 @@ doccls = lambda cls, *predicates: {
 data = {
     'mailem': doc(mailem),
     'Message': doc(mailem.Message),
+    'Message_estimate_size': doc(mailem.Message.estimate_size, mailem.Message),
     'Attachment': doc(mailem.Attachment),
     'ImageAttachment': doc(mailem.ImageAttachment),
     'Postman': doccls(mailem.Postman),
     'connection': doc(mailem.connection),
     'SMTPConnection': doc(mailem.connection.SMTPConnection),
     'LoopbackConnection': doc(mailem.connection.LoopbackConnection),
+    'MultiConnection': doc(mailem.connection.MultiConnection),
+    'PooledConnection': doc(mailem.connection.PooledConnection),
+    'BlackholeConnection': doc(mailem.connection.BlackholeConnection),
+    'MXConnection': doc(mailem.connection.MXConnection),
+    'RetryScheduler': doccls(mailem.retry.RetryScheduler),
+    'PriorityScheduler': doccls(mailem.priority.PriorityScheduler),
+    'PriorityClass': doc(mailem.priority.PriorityClass),
+    'Outbox': doccls(mailem.outbox.Outbox),
+    'DKIMSigner': doc(mailem.dkim.DKIMSigner),
+    'Campaign': doccls(mailem.campaign.Campaign),
+    'Journal': doc(mailem.campaign.Journal),
+    'merge': doc(mailem.merge.merge),
+    'read_rows': doc(mailem.merge.read_rows),
+    'pack_dumps': doc(mailem.pack.dumps),
+    'pack_loads': doc(mailem.pack.loads),
+    'DirectoryAttachmentStore': doc(mailem.pack.DirectoryAttachmentStore),
+    'HistogramMetrics': doccls(mailem.metrics.HistogramMetrics),
+    'IMetrics': doc(mailem.metrics.IMetrics),
     'Template': doccls(mailem.template.Template, None, lambda k, v: k=='__call__' or not k.startswith('_')),
     'TemplateRegistry': doccls(mailem.template.TemplateRegistry),
 }
@@ -0,0 +1,304 @@
+#! /usr/bin/env python
+""" Microbenchmarks for the message and template hot paths.
+
+Runs offline: nothing is sent anywhere.
+
+    $ python misc/bench/micro.py                         # run all, print a table
+    $ python misc/bench/micro.py -k template             # only benchmarks matching 'template'
+    $ python misc/bench/micro.py -o before.json          # save results
+    $ python misc/bench/micro.py -c before.json          # compare the current tree against saved results
+
+To compare two revisions:
+
+    $ git checkout v1 && python misc/bench/micro.py -o v1.json
+    $ git checkout v2 && python misc/bench/micro.py -c v1.json
+
+For every benchmark, reports:
+
+* `time`: seconds per operation (the best of several rounds)
+* `peak`: peak memory allocated during one operation, bytes
+* `retained`: memory still allocated after one operation (garbage included), bytes
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from mailem import Message, Attachment, ImageAttachment
+from mailem.util import Address, unicode_header
+from mailem.template import Template
+from mailem.template.renderer import PythonTemplateRenderer
+
+try:
+    from mailem.template.renderer import Jinja2TemplateRenderer
+except ImportError:
+    Jinja2TemplateRenderer = None
+
+
+#region Benchmarks
+
+BENCHMARKS = []
+
+
+def benchmark(f):
+    """ Register a benchmark: a function that prepares the data, and returns the operation to measure """
+    BENCHMARKS.append(f)
+    return f
+
+
+TEXT = u'Lorem ipsum dolor sit amet, consectetur adipiscing elit. '
+TEXT_UNICODE = u'Съешь же ещё этих мягких французских булок, да выпей чаю. '
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF' + b'\x00' * 1000
+
+
+@benchmark
+def address_str():
+    address = Address(('user@example.com', u'Honored User'))
+    return lambda: str(address)
+
+
+@benchmark
+def address_str_unicode():
+    address = Address(('user@example.com', u'Уважаемый Пользователь'))
+    return lambda: str(address)
+
+
+@benchmark
+def unicode_header_ascii():
+    return lambda: unicode_header(u'Welcome to our website!')
+
+
+@benchmark
+def unicode_header_unicode():
+    return lambda: unicode_header(u'Добро пожаловать на наш сайт!')
+
+
+@benchmark
+def message_small():
+    msg = Message(['user@example.com'], u'Hello', u'<b>Hello!</b>', sender='noreply@example.com')
+    return lambda: str(msg)
+
+
+@benchmark
+def message_small_mime():
+    msg = Message(['user@example.com'], u'Hello', u'<b>Hello!</b>', sender='noreply@example.com')
+    return msg._mime
+
+
+@benchmark
+def message_html_text_unicode():
+    msg = Message([('user@example.com', u'Уважаемый Пользователь')], u'Привет!',
+                  u'<p>{}</p>'.format(TEXT_UNICODE * 20), TEXT_UNICODE * 20,
+                  sender=('noreply@example.com', u'Почтальон'))
+    return lambda: str(msg)
+
+
+@benchmark
+def message_huge():
+    msg = Message(['user@example.com'], u'Hello', u'<p>{}</p>\n'.format(TEXT) * 20000)  # ~1 MB
+    return lambda: str(msg)
+
+
+@benchmark
+def message_huge_unicode():
+    msg = Message(['user@example.com'], u'Hello', u'<p>{}</p>\n'.format(TEXT_UNICODE) * 10000)  # ~1 MB
+    return lambda: str(msg)
+
+
+@benchmark
+def message_many_recipients():
+    msg = Message(['user{}@example.com'.format(i) for i in range(1000)], u'Hello', u'<b>Hello!</b>',
+                  cc=[('cc{}@example.com'.format(i), u'Копия {}'.format(i)) for i in range(100)])
+    return lambda: str(msg)
+
+
+@benchmark
+def message_inline_images():
+    msg = Message(['user@example.com'], u'Hello', u'<img src="cid:1.jpg"><img src="cid:2.jpg">',
+                  attachments=[ImageAttachment('1.jpg', JPEG, 'inline'),
+                               ImageAttachment('2.jpg', JPEG, 'inline')])
+    return lambda: str(msg)
+
+
+@benchmark
+def attachment_large_mime():
+    attachment = Attachment(u'data.bin', os.urandom(5 * 1024 * 1024))
+    return attachment._mime
+
+
+@benchmark
+def message_large_attachment():
+    msg = Message(['user@example.com'], u'Hello', u'<b>See attached</b>',
+                  attachments=[Attachment(u'data.bin', os.urandom(5 * 1024 * 1024))])
+    return lambda: str(msg)
+
+
+def _template(Renderer, subject, html):
+    template = Template(subject, html, defaults={'domain': 'example.com'})
+    template.set_renderer(Renderer)
+    return lambda: template(['user@example.com'], {'user': u'Honored User', 'items': range(10)})
+
+
+@benchmark
+def template_python():
+    return _template(PythonTemplateRenderer,
+                     u'Hello $user', u'<b>Welcome, $user!</b> -- $domain\n' * 20)
+
+
+@benchmark
+def template_jinja2():
+    if Jinja2TemplateRenderer is None:
+        return None
+    return _template(Jinja2TemplateRenderer,
+                     u'Hello {{ user }}', u'<b>Welcome, {{ user }}!</b> -- {{ domain }}\n' * 20)
+
+
+@benchmark
+def template_jinja2_loop():
+    if Jinja2TemplateRenderer is None:
+        return None
+    return _template(Jinja2TemplateRenderer,
+                     u'Hello {{ user }}', u'{% for i in items %}<li>{{ i }}: {{ user }}</li>\n{% endfor %}' * 5)
+
+#endregion
+
+
+#region Measurement
+
+def measure_time(op, min_time=0.2, rounds=5):
+    """ Seconds per operation: the best of several rounds """
+    # Find the number of loops that takes at least `min_time`
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(loops):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_time / elapsed))
+
+    best = elapsed / loops
+    for r in range(rounds - 1):
+        start = time.perf_counter()
+        for i in range(loops):
+            op()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+def measure_memory(op):
+    """ Peak and retained memory of one operation, bytes """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        result = op()
+        peak = tracemalloc.get_traced_memory()[1]
+        del result
+        current = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return peak - base, current - base
+
+
+def run(pattern=None, min_time=0.2):
+    """ Run benchmarks
+
+    :rtype: dict
+    """
+    results = {}
+    for f in BENCHMARKS:
+        if pattern and not re.search(pattern, f.__name__):
+            continue
+        op = f()
+        if op is None:
+            continue  # not available
+
+        peak, retained = measure_memory(op)
+        results[f.__name__] = {
+            'time': measure_time(op, min_time),
+            'peak': peak,
+            'retained': retained,
+        }
+    return results
+
+#endregion
+
+
+#region Reporting
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.2f}{}'.format(seconds / scale, unit)
+    return '{:.0f}ns'.format(seconds / 1e-9)
+
+
+def _format_bytes(n):
+    for unit, scale in (('MB', 1 << 20), ('KB', 1 << 10)):
+        if abs(n) >= scale:
+            return '{:.1f}{}'.format(float(n) / scale, unit)
+    return '{}B'.format(n)
+
+
+def _format_change(new, old):
+    if not old:
+        return ''
+    return '{:+.0%}'.format(float(new) / old - 1)
+
+
+def report(results, baseline=None):
+    """ Print a table """
+    baseline = baseline or {}
+    header = ('benchmark', 'time', 'peak', 'retained')
+    if baseline:
+        header += ('time vs base', 'peak vs base')
+    rows = [header]
+    for name in sorted(results):
+        r = results[name]
+        row = (name, _format_time(r['time']), _format_bytes(r['peak']), _format_bytes(r['retained']))
+        if baseline:
+            b = baseline.get(name, {})
+            row += (_format_change(r['time'], b.get('time')), _format_change(r['peak'], b.get('peak')))
+        rows.append(row)
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(cell.ljust(w) if i == 0 else cell.rjust(w) for i, (cell, w) in enumerate(zip(row, widths))))
+
+#endregion
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mailem microbenchmarks')
+    parser.add_argument('-k', dest='pattern', help='Only run benchmarks matching this regexp')
+    parser.add_argument('-o', '--output', help='Save results to a JSON file')
+    parser.add_argument('-c', '--compare', help='Compare against results saved in a JSON file')
+    parser.add_argument('-t', '--min-time', type=float, default=0.2, help='Minimum time per round, seconds')
+    args = parser.parse_args()
+
+    results = run(args.pattern, args.min_time)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,12 +19,17 @@ setup(
 
     packages=find_packages(),
     scripts=[],
-    entry_points={},
+    entry_points={
+        'console_scripts': [
+            'mailem-merge = mailem.merge:main',
+        ],
+    },
 
     install_requires=[
-        'future',
     ],
     extras_require={
+        'mx': ['dnspython'],
+        'dkim': ['cryptography'],
     },
     include_package_data=True,
     test_suite='nose.collector',
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+from mailem import Message, Postman
+from mailem.connection import BlackholeConnection
+from mailem.connection.smtp import prepare_message
+from mailem.util import Address, parse_addresses, unique_emails, normalize_domain, _domains
+
+PY2 = sys.version_info[0] == 2
+
+
+class AddressTest(unittest.TestCase):
+    def test_parse(self):
+        """ Formats; normalization """
+        a = Address(u'Honored User <User@Example.COM>')
+        self.assertEqual((a.email, a.name), (u'User@example.com', u'Honored User'))
+        a = Address(u'"Doe, John" <john@example.com>')
+        self.assertEqual((a.email, a.name), (u'john@example.com', u'Doe, John'))
+        self.assertEqual(Address(' a@example.com. ').email, 'a@example.com')
+        self.assertEqual(Address(('a@EXAMPLE.com', u'A')), Address(('a@example.com', u'A')))
+        self.assertRaises(ValueError, Address, u'Nobody <>')
+
+        # Lists
+        self.assertEqual(parse_addresses(u'a@example.com, "B, b" <b@example.com>'),
+                         [Address('a@example.com'), Address(('b@example.com', u'B, b'))])
+        a = Address('a@example.com')
+        self.assertIs(parse_addresses([a])[0], a)
+
+    def test_idna(self):
+        """ Internationalized domains are encoded, and cached """
+        a = Address(u'user@Пример.РФ')
+        self.assertEqual(a.email, u'user@пример.рф')
+        self.assertEqual(a.ascii_email, 'user@xn--e1afmkfd.xn--p1ai')
+        self.assertEqual(normalize_domain(u'Пример.РФ'), (u'пример.рф', 'xn--e1afmkfd.xn--p1ai'))
+        self.assertIn(u'Пример.РФ', _domains)
+
+        # Headers: encoded, unless SMTPUTF8
+        msg = Message([(u'user@пример.рф', u'Вася')], 'Hi', 'Hi', sender='test@example.com')
+        self.assertIn(b'To: =?utf-8?b?0JLQsNGB0Y8=?= <user@xn--e1afmkfd.xn--p1ai>', msg._serialize())
+        if not PY2:  # no SMTPUTF8 support in Python 2
+            self.assertIn(u'To: Вася <user@пример.рф>'.encode('utf-8'), msg._serialize(eightbit=True, utf8=True))
+
+        # Envelope
+        self.assertEqual(prepare_message(msg)[1], ['user@xn--e1afmkfd.xn--p1ai'])
+        self.assertEqual(prepare_message(msg, True, True)[1],
+                         ['user@xn--e1afmkfd.xn--p1ai'] if PY2 else [u'user@пример.рф'])
+
+    def test_unique(self):
+        """ Envelope recipients are unique """
+        self.assertEqual(unique_emails(parse_addresses(['a@example.com', 'A@Example.com', 'b@example.com'])),
+                         ['a@example.com', 'b@example.com'])
+
+        msg = Message(['a@example.com', ('b@example.com', 'B')], 'Hi', 'Hi', sender='test@example.com',
+                      cc=['B@EXAMPLE.COM', 'c@example.com'], bcc=['a@example.com'])
+        self.assertEqual(msg._envelope(), ['a@example.com', 'b@example.com', 'c@example.com'])
+
+        blackhole = BlackholeConnection()
+        with Postman('test@example.com', blackhole).connect() as c:
+            c.sendmail(msg)
+        self.assertEqual(blackhole.recipients, 3)
@@ -1,6 +1,9 @@
 # Used in smtp-test: mail handler
 # Moved here because `async def` is a syntax error in < 3.7
 
+import asyncio
+
+
 class StashingHandler(object):
     def __init__(self):
         self.mail = []
@@ -16,3 +19,41 @@ class StashingHandler(object):
             (envelope.mail_from, envelope.content.decode('utf8', errors='replace'))
         )
         return '250 Message accepted for delivery'
+
+
+class LimitingHandler(StashingHandler):
+    """ Accepts only `limit` messages per session, then asks the client to go away """
+
+    def __init__(self, limit):
+        super(LimitingHandler, self).__init__()
+        self.limit = limit
+
+    async def handle_DATA(self, server, session, envelope):
+        session.messages_count = getattr(session, 'messages_count', 0) + 1
+        if session.messages_count > self.limit:
+            return '421 Too many messages on this connection'
+        return await super(LimitingHandler, self).handle_DATA(server, session, envelope)
+
+
+class SlowHandler(StashingHandler):
+    """ Takes its time to accept a message """
+
+    def __init__(self, delay):
+        super(SlowHandler, self).__init__()
+        self.delay = delay
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delay)
+        return await super(SlowHandler, self).handle_DATA(server, session, envelope)
+
+
+class RecordingHandler(object):
+    """ Accepts mail for any domain, and records every transaction """
+
+    def __init__(self):
+        #: [ (mail_from, rcpt_tos, content) ]
+        self.transactions = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.transactions.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content))
+        return '250 Message accepted for delivery'
@@ -0,0 +1,33 @@
+import unittest
+
+from mailem import Postman
+from mailem.connection import SMTPConnection
+from mailem.metrics import HistogramMetrics
+
+try:
+    from mailem.bench import SMTPSink, run_load, make_template
+except ImportError:  # Python 3 only
+    SMTPSink = None
+
+
+@unittest.skipIf(SMTPSink is None, 'mailem.bench is not available')
+class LoadTest(unittest.TestCase):
+    def test_load(self):
+        """ Load generator pushes everything into the sink """
+        with SMTPSink() as sink:
+            metrics = HistogramMetrics()
+            postman = Postman('bench@example.com', SMTPConnection(sink.host, sink.port, None, None), metrics=metrics)
+            template = make_template(1000, attachment_size=1000).set_metrics(metrics)
+
+            elapsed, errors = run_load(postman, template, 50, concurrency=3)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sink.messages, 50)
+        self.assertEqual(sink.recipients, 50)
+        self.assertEqual(sink.sessions, 3)
+        self.assertGreater(sink.bytes, 50 * 2000)
+
+        summary = metrics.summary()
+        self.assertEqual(summary['render']['count'], 50)
+        self.assertEqual(summary['sendmail']['count'], 50)
+        self.assertEqual(summary['sendmail']['errors'], 0)
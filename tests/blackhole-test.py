@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import unittest
+import threading
+
+from mailem import Message, Postman
+from mailem.connection import BlackholeConnection
+from mailem.metrics import HistogramMetrics
+
+
+class BlackholeConnectionTest(unittest.TestCase):
+    def test_blackhole(self):
+        """ Messages are serialized as for SMTP, and counted """
+        metrics = HistogramMetrics()
+        blackhole = BlackholeConnection()
+        postman = Postman('test@example.com', blackhole, metrics=metrics)
+
+        msg = Message(['a@example.com', 'b@example.com'], u'Привет', u'<b>Привет!</b>', cc=['c@example.com'],
+                      sender='test@example.com')
+        with postman.connect() as c:
+            c.sendmail(msg)
+            c.sendmail(msg)
+
+        self.assertEqual(blackhole.messages, 2)
+        self.assertEqual(blackhole.recipients, 6)
+        self.assertEqual(blackhole.bytes, 2 * len(msg._serialize(eightbit=True)))
+        self.assertGreater(blackhole.seconds, 0)
+        self.assertEqual(metrics.summary()['serialize']['bytes'], blackhole.bytes)
+
+        # 7bit server: non-ASCII texts are encoded
+        seven = BlackholeConnection(eightbit=False)
+        seven.sendmail(None, msg)
+        self.assertEqual(seven.bytes, len(msg._serialize()))
+        self.assertNotEqual(seven.bytes, len(msg._serialize(eightbit=True)))
+
+        blackhole.reset()
+        self.assertEqual((blackhole.messages, blackhole.bytes), (0, 0))
+
+    def test_threads(self):
+        """ Concurrent senders """
+        blackhole = BlackholeConnection()
+        postman = Postman('test@example.com', blackhole)
+
+        def send():
+            with postman.connect() as c:
+                for i in range(50):
+                    c.sendmail(Message(['a@example.com'], u'Hello', u'Hello!'))
+
+        threads = [threading.Thread(target=send) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(blackhole.messages, 200)
+        self.assertEqual(blackhole.recipients, 200)
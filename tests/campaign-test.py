@@ -0,0 +1,133 @@
+import os
+import shutil
+import smtplib
+import tempfile
+import unittest
+
+from mailem import Postman
+from mailem.connection import LoopbackConnection
+from mailem.template import Template
+from mailem.campaign import Campaign, Journal
+from mailem.connection.smtp import PartialDeliveryError
+
+
+class RejectingConnection(LoopbackConnection):
+    """ Loopback that rejects some recipients, and can crash after a number of messages """
+
+    def __init__(self, reject=(), crash_after=None, partial=()):
+        super(RejectingConnection, self).__init__()
+        self.reject = set(reject)
+        self.crash_after = crash_after
+        self.partial = set(partial)
+
+    def sendmail(self, client, message):
+        if self.crash_after is not None and len(self) >= self.crash_after:
+            raise SystemExit('Crash!')
+        if message._recipients[0].email in self.reject:
+            raise smtplib.SMTPRecipientsRefused({message._recipients[0].email: (550, b'No such user')})
+        super(RejectingConnection, self).sendmail(client, message)
+        if message._recipients[0].email in self.partial:
+            raise PartialDeliveryError({'cc@example.com': (451, b'Try again later')}, [message._recipients[0].email])
+
+
+class CampaignTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'campaign.journal')
+        self.template = Template(u'Hello $name', u'Hi, $name!')
+        self.items = [(['user{}@example.com'.format(i)], {'name': u'User {}'.format(i)}) for i in range(100)]
+
+    def _campaign(self, connection, **kwargs):
+        return Campaign('test', self.template, Postman('test@example.com', connection), Journal(self.path, **kwargs))
+
+    def test_resume(self):
+        """ After a crash, only the remaining messages are sent """
+        crashing = RejectingConnection(reject=['user5@example.com'], crash_after=40)
+        campaign = self._campaign(crashing)
+        self.assertRaises(SystemExit, campaign.run, iter(self.items))
+        self.assertEqual(len(crashing), 40)
+
+        # Resume: messages sent already are not even rendered
+        rendered = []
+        template, self.template = self.template, lambda r, v, **kw: rendered.append(r) or template(r, v, **kw)
+        lo = RejectingConnection()
+        stats = self._campaign(lo).run(self.items)
+        self.assertEqual(stats, {'sent': 60, 'failed': 0, 'skipped': 40})
+        self.assertEqual(len(rendered), 60)
+
+        # Everyone got exactly one message; the failed one is retried
+        emails = [m._recipients[0].email for m in crashing + lo]
+        self.assertEqual(sorted(emails), sorted(r[0] for r, v in self.items))
+
+        # Message-IDs are deterministic
+        self.assertEqual(lo[0]._msgid, campaign.message_id('user5@example.com'))
+        self.assertTrue(lo[0]._msgid.endswith('@example.com>'))
+
+        # Nothing left
+        stats = self._campaign(LoopbackConnection()).run(self.items)
+        self.assertEqual(stats, {'sent': 0, 'failed': 0, 'skipped': 100})
+
+    def test_failures(self):
+        """ Failures are recorded, and reported """
+        failed = []
+        stats = self._campaign(RejectingConnection(reject=['user1@example.com', 'user2@example.com'])).run(
+            self.items, on_failed=lambda m, e: failed.append(m._recipients[0].email))
+        self.assertEqual(stats, {'sent': 98, 'failed': 2, 'skipped': 0})
+        self.assertEqual(failed, ['user1@example.com', 'user2@example.com'])
+
+        outcomes = Journal(self.path).read()
+        self.assertEqual(len(outcomes), 100)
+        self.assertEqual(sorted(status for status in outcomes.values()).count('failed'), 2)
+        with open(self.path) as f:
+            self.assertIn(' 550\n', f.read())
+
+    def test_partial(self):
+        """ Partial deliveries are reported as failed, but not resent """
+        lo = RejectingConnection(partial=['user3@example.com'])
+        stats = self._campaign(lo).run(self.items)
+        self.assertEqual(stats, {'sent': 99, 'failed': 1, 'skipped': 0})
+        self.assertEqual(Journal(self.path).read()[self._campaign(lo).message_id('user3@example.com')], 'partial')
+
+        stats = self._campaign(lo).run(self.items)
+        self.assertEqual(stats, {'sent': 0, 'failed': 0, 'skipped': 100})
+        self.assertEqual(len(lo), 100)
+
+    def test_render_failures(self):
+        """ A row that fails to render fails its message, not the campaign """
+        self.items[7][1].pop('name')  # KeyError
+        failed = []
+        lo = LoopbackConnection()
+        stats = self._campaign(lo).run(self.items, workers=2, on_failed=lambda m, e: failed.append((m, e)))
+        self.assertEqual(stats, {'sent': 99, 'failed': 1, 'skipped': 0})
+        self.assertEqual(len(failed), 1)
+        self.assertIsNone(failed[0][0])
+        self.assertEqual(Journal(self.path).read()[self._campaign(lo).message_id('user7@example.com')], 'failed')
+
+    def test_workers(self):
+        """ Several connections """
+        lo = LoopbackConnection()
+        stats = self._campaign(lo).run(self.items, workers=4)
+        self.assertEqual(stats['sent'], 100)
+        self.assertEqual(len(set(m._msgid for m in lo)), 100)
+
+    def test_journal(self):
+        """ Batched fsync; torn lines """
+        journal = Journal(self.path, fsync_every=10, fsync_interval=3600)
+        for i in range(25):
+            journal.record('<{}@example.com>'.format(i), 'sent', 250)
+        self.assertEqual(journal.fsyncs, 2)
+        journal.close()
+        self.assertEqual(journal.fsyncs, 3)
+
+        # A crash tears the last line
+        with open(self.path, 'ab') as f:
+            f.write(b'sent <torn')
+        self.assertEqual(len(Journal(self.path).read()), 25)
+
+        journal = Journal(self.path)
+        journal.record('<26@example.com>', 'sent')
+        journal.close()
+        outcomes = Journal(self.path).read()
+        self.assertEqual(len(outcomes), 26)
+        self.assertNotIn('<torn', outcomes)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import base64
+import unittest
+
+from mailem import Message, Postman, Attachment
+from mailem.connection import BlackholeConnection, LoopbackConnection
+from mailem.connection.smtp import prepare_message
+from mailem.metrics import HistogramMetrics
+from mailem.template import Template
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+    from mailem.dkim import DKIMSigner
+except ImportError:
+    DKIMSigner = None
+
+try:
+    import dkim
+except ImportError:
+    dkim = None
+
+
+@unittest.skipIf(DKIMSigner is None, 'cryptography is not installed')
+class DKIMTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if DKIMSigner is None:
+            return  # nose calls it for skipped classes as well
+        cls.rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.ed_key = ed25519.Ed25519PrivateKey.generate()
+
+    def _dns(self, key):
+        """ Fake DNS for dkimpy: the public key record """
+        if isinstance(key, rsa.RSAPrivateKey):
+            k = 'rsa'
+            pub = key.public_key().public_bytes(serialization.Encoding.DER,
+                                                serialization.PublicFormat.SubjectPublicKeyInfo)
+        else:
+            k = 'ed25519'
+            pub = key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        record = 'v=DKIM1; k={}; p={}'.format(k, base64.b64encode(pub).decode('ascii')).encode('ascii')
+        return lambda name, timeout=5: record if name == b'mail._domainkey.example.com.' else None
+
+    def _message(self, to='a@example.com'):
+        return Message([to], u'Привет', u'<b>Привет!</b>  \n\n\n', text=u'Привет!',
+                       sender=('test@example.com', u'Мы'), cc=['c@example.com'],
+                       attachments=[Attachment(u'data.txt', b'hello  \r\nworld\r\n\r\n')])
+
+    def test_key(self):
+        """ Keys: PEM or objects """
+        pem = self.rsa_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption())
+        self.assertEqual(DKIMSigner('mail', 'example.com', pem).algorithm, 'rsa-sha256')
+        self.assertEqual(DKIMSigner('mail', 'example.com', pem.decode('ascii')).algorithm, 'rsa-sha256')
+        self.assertEqual(DKIMSigner('mail', 'example.com', self.ed_key).algorithm, 'ed25519-sha256')
+        self.assertRaises(ValueError, DKIMSigner, 'mail', 'example.com', object())
+
+    @unittest.skipIf(dkim is None, 'dkimpy is not installed')
+    def test_verify(self):
+        """ Signatures are verified by dkimpy """
+        message = self._message()
+        for key in (self.rsa_key, self.ed_key):
+            for canon in ('relaxed/relaxed', 'relaxed/simple', 'simple/relaxed', 'simple/simple'):
+                signer = DKIMSigner('mail', 'example.com', key, canonicalization=canon)
+                for eightbit in (False, True):
+                    signed = signer.sign(message._serialize(eightbit=eightbit))
+                    self.assertTrue(signed.startswith(b'DKIM-Signature: v=1;'))
+                    self.assertTrue(dkim.verify(signed, dnsfunc=self._dns(key)),
+                                    '{} {} eightbit={}'.format(signer.algorithm, canon, eightbit))
+
+                    # Tampering is detected
+                    tampered = signed.replace(b'Subject:', b'Subject: Re:')
+                    self.assertFalse(dkim.verify(tampered, dnsfunc=self._dns(key)))
+
+    def test_body_hash_cache(self):
+        """ The same body with different headers is hashed once """
+        signer = DKIMSigner('mail', 'example.com', self.rsa_key, cache_size=2)
+        message = Message(['a@example.com'], u'Hello', u'Hello!', sender='test@example.com')
+
+        signed = [signer.sign(message._serialize().replace(b'a@example.com', to))
+                  for to in (b'a@example.com', b'b@example.com', b'c@example.com')]
+        self.assertEqual(len(signer._body_hashes), 1)
+        self.assertEqual(len(set(s.partition(b'\r\n\r\n')[2] for s in signed)), 1)  # same body
+
+        # LRU
+        for body in (u'One', u'Two', u'Three'):
+            signer.sign(Message(['a@example.com'], u'Hello', body, sender='test@example.com')._serialize())
+        self.assertEqual(len(signer._body_hashes), 2)
+
+    def test_body_hash_multipart(self):
+        """ Multipart messages hit the cache: the body is the same whenever the message is serialized """
+        signer = DKIMSigner('mail', 'example.com', self.rsa_key)
+        canonicalized = []
+        canonicalize_body = signer._canonicalize_body
+        signer._canonicalize_body = lambda body: canonicalized.append(body) or canonicalize_body(body)
+
+        message = self._message()
+        signed = [prepare_message(m, dkim=signer)[2]
+                  for m in (message, message, message._with_sender('other@example.com'))]
+        self.assertEqual(len(canonicalized), 1)
+        self.assertEqual(len(signer._body_hashes), 1)
+        self.assertIn(b'multipart/mixed', signed[0])
+        self.assertEqual(len(set(s.partition(b'\r\n\r\n')[2] for s in signed)), 1)  # same body
+        if dkim is not None:
+            self.assertTrue(dkim.verify(signed[1], dnsfunc=self._dns(self.rsa_key)))
+
+        # Another message with the same contents: the same body
+        prepare_message(self._message(to='b@example.com'), dkim=signer)
+        self.assertEqual(len(canonicalized), 1)
+
+        # Other contents, or another encoding: another body
+        prepare_message(Message(['a@example.com'], u'Привет', u'<b>Пока!</b>', sender='test@example.com'), dkim=signer)
+        prepare_message(message, True, False, dkim=signer)
+        self.assertEqual(len(canonicalized), 3)
+
+        # Per-recipient copies of a templated message
+        template = Template(u'Hello $name', u'<b>Our news</b>', text=u'Our news')
+        signed = [prepare_message(template([u'{}@example.com'.format(name)], {'name': name},
+                                           sender='test@example.com'), dkim=signer)[2]
+                  for name in ('a', 'b', 'c')]
+        self.assertEqual(len(canonicalized), 4)
+        if dkim is not None:
+            self.assertTrue(all(dkim.verify(s, dnsfunc=self._dns(self.rsa_key)) for s in signed))
+
+    def test_headers(self):
+        """ Only present headers are signed, From always """
+        signer = DKIMSigner('mail', 'example.com', self.rsa_key, headers=('Subject', 'X-Missing'))
+        signed = signer.sign(self._message()._serialize())
+        self.assertIn(b'h=from:subject;', signed)
+
+    def test_postman(self):
+        """ Postman signs every message when serialized, and records the 'sign' stage """
+        signer = DKIMSigner('mail', 'example.com', self.rsa_key)
+        metrics = HistogramMetrics()
+        blackhole = BlackholeConnection()
+        postman = Postman('test@example.com', blackhole, metrics=metrics, dkim=signer)
+        self.assertIs(blackhole.dkim, signer)
+
+        message = self._message()
+        with postman.connect() as c:
+            c.sendmail(message)
+            c.sendmail(message)
+        self.assertEqual(metrics.summary()['sign']['count'], 2)
+
+        # Messages are not modified
+        self.assertNotIn(b'DKIM-Signature', message._serialize())
+
+        sender, recipients, data, options = prepare_message(message, dkim=signer)
+        self.assertTrue(data.startswith(b'DKIM-Signature:'))
+        self.assertEqual(recipients, ['a@example.com', 'c@example.com'])
+        if dkim is not None:
+            self.assertTrue(dkim.verify(data, dnsfunc=self._dns(self.rsa_key)))
+
+        # Loopback connections don't serialize: nothing to sign
+        lo = Postman('test@example.com', LoopbackConnection(), dkim=signer)
+        with lo.connect() as c:
+            c.sendmail(message)
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+import subprocess
+
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+def import_mailem():
+    """ Import mailem in a fresh interpreter
+
+    :return: (import time in seconds, set of modules loaded)
+    """
+    out = subprocess.check_output([sys.executable, '-c',
+                                   'import sys, time\n'
+                                   'modules = set(sys.modules)\n'
+                                   't = time.time()\n'
+                                   'import mailem\n'
+                                   't = time.time() - t\n'
+                                   'print(t)\n'
+                                   'print(" ".join(set(sys.modules) - modules))\n'],
+                                  cwd=ROOT)
+    seconds, modules = out.decode().splitlines()
+    return float(seconds), set(modules.split())
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'Lazy imports need Python 3.7')
+class ImportTest(unittest.TestCase):
+    #: Import time budget, seconds. Mostly spent on the `email` package, which is always needed.
+    #: Generous, for slow CI machines: the modules check is what catches regressions.
+    #: Set `MAILEM_IMPORT_BUDGET` to tighten it.
+    BUDGET = float(os.environ.get('MAILEM_IMPORT_BUDGET', 1.0))
+
+    def test_lazy(self):
+        """ `import mailem` only imports what's needed to build a Message """
+        seconds, modules = min(import_mailem() for i in range(3))
+
+        for name in ('jinja2', 'smtplib', 'ssl', 'future', 'past',
+                     'mailem.template', 'mailem.connection.smtp'):
+            self.assertNotIn(name, modules)
+        self.assertLess(seconds, self.BUDGET)
+
+    def test_access(self):
+        """ Lazy attributes are imported on access """
+        import mailem
+        from mailem.connection import SMTPConnection, LoopbackConnection
+        from mailem.template.renderer import PythonTemplateRenderer
+
+        self.assertIs(mailem.connection.SMTPConnection, SMTPConnection)
+        self.assertIs(mailem.template.Template, mailem.template.template.Template)
+        self.assertRaises(AttributeError, getattr, mailem, 'nothing')
+        self.assertRaises(AttributeError, getattr, mailem.connection, 'nothing')
+        with self.assertRaises(ImportError):
+            from mailem.connection import nothing
@@ -1,7 +1,9 @@
 import unittest
+import threading
 import smtplib
 
 from mailem import Message, Postman
+from mailem.connection import LoopbackConnection
 
 
 class TestLoopback(unittest.TestCase):
@@ -23,6 +25,143 @@ class TestLoopback(unittest.TestCase):
             self.assertEqual(len(lo), 1)
 
         self.assertEqual(len(lo), 1)  # Still usable
+        self.assertIsInstance(lo, list)
+        sent = lo[0]
+        self.assertEqual(lo, [sent])
+        self.assertEqual((lo.index(sent), lo.count(sent)), (0, 1))
+        self.assertIs(lo.pop(), sent)
 
         # Now fails again
         self.assertRaises(AttributeError, postman.connect().__enter__)
+
+    def test_reconnect(self):
+        """ Reconnect when the session is dropped """
+        lo = DroppingConnection(2)
+
+        # No reconnects: fails
+        postman = Postman('test@example.com', lo)
+        with postman.connect() as c:
+            c.sendmail(Message(['test@gmail.com'], 'Test'))
+            c.sendmail(Message(['test@gmail.com'], 'Test'))
+            self.assertRaises(smtplib.SMTPServerDisconnected, c.sendmail, Message(['test@gmail.com'], 'Test'))
+        self.assertEqual(len(lo), 2)
+
+        # Reconnect
+        postman = Postman('test@example.com', lo, reconnect=1)
+        with postman.connect() as c:
+            for i in range(5):
+                c.sendmail(Message(['test@gmail.com'], 'Test'))
+        self.assertEqual(len(lo), 2 + 5)
+        self.assertEqual(lo.connects, 1 + 3)
+
+        # Permanent errors are not retried
+        with postman.connect() as c:
+            self.assertRaises(smtplib.SMTPDataError, c.sendmail, Message(['test@gmail.com'], 'reject'))
+        self.assertEqual(lo.connects, 1 + 3 + 1)
+
+    def test_get_messages(self):
+        """ get_messages() returns messages in send order, and resets """
+        lo = LoopbackConnection()
+        postman = Postman('test@example.com', lo)
+        with postman.connect() as c:
+            for i in range(3):
+                c.sendmail(Message(['test@gmail.com'], 'Test {}'.format(i)))
+
+        self.assertEqual([m._subject for m in lo.get_messages()], ['Test 0', 'Test 1', 'Test 2'])
+        self.assertEqual(len(lo), 0)
+        self.assertEqual(lo.find(recipient='test@gmail.com'), [])
+        self.assertEqual(lo.sent, 3)
+
+    def test_bounded(self):
+        """ Bounded loopback keeps the latest messages, and their indexes """
+        postman = Postman('test@example.com', None)
+        with postman.loopback(maxlen=3) as lo:
+            with postman.connect() as c:
+                for i in range(10):
+                    c.sendmail(Message(['user{}@example.com'.format(i % 2)], 'Test {}'.format(i),
+                                       cc=['cc@example.com']))
+
+        self.assertEqual(lo.sent, 10)
+        self.assertEqual(lo.recipients, 20)
+        self.assertEqual([m._subject for m in lo], ['Test 7', 'Test 8', 'Test 9'])
+        self.assertEqual([m._subject for m in lo[1:]], ['Test 8', 'Test 9'])
+        self.assertEqual(lo[-1]._subject, 'Test 9')
+        self.assertEqual(lo, list(lo))
+        self.assertEqual([] + lo, lo + [])
+        self.assertEqual(lo.index(lo[1]), 1)
+        self.assertEqual(lo.count(lo[1]), 1)
+        self.assertIn(lo[0], lo)
+        self.assertEqual(list.__len__(lo), 0)  # ring buffer
+
+        # Indexes
+        self.assertEqual([m._subject for m in lo.find(recipient='user1@example.com')], ['Test 7', 'Test 9'])
+        self.assertEqual([m._subject for m in lo.find(recipient='CC@example.com')], ['Test 7', 'Test 8', 'Test 9'])
+        self.assertEqual(lo.find(subject='Test 0'), [])
+        self.assertEqual(lo.find(subject='Test 8'), [lo[1]])
+        self.assertEqual(lo.find(msgid=lo[2]._msgid), [lo[2]])
+        self.assertEqual(lo.find(recipient='user1@example.com', subject='Test 9'), [lo[2]])
+        self.assertEqual(lo.find(recipient='user0@example.com', subject='Test 9'), [])
+
+        # Evicted messages are not indexed
+        self.assertEqual(sum(len(v) for v in lo._indexes['subject'].values()), 3)
+        self.assertEqual(set(lo._indexes['recipient']), {'user0@example.com', 'user1@example.com', 'cc@example.com'})
+
+    def test_counters_only(self):
+        """ store=False: only count """
+        postman = Postman('test@example.com', None)
+        with postman.loopback(store=False) as lo:
+            with postman.connect() as c:
+                for i in range(5):
+                    c.sendmail(Message(['a@example.com', 'b@example.com'], 'Test'))
+
+        self.assertEqual(len(lo), 0)
+        self.assertEqual(lo.sent, 5)
+        self.assertEqual(lo.recipients, 10)
+        self.assertEqual(lo.find(subject='Test'), [])
+
+    def test_shared_message(self):
+        """ A Message is not modified on send, and can be shared by Postmen in multiple threads """
+        msg = Message(['test@gmail.com'], 'Broadcast')
+        lo = LoopbackConnection()
+
+        def send(sender):
+            with Postman(sender, lo).connect() as c:
+                for i in range(100):
+                    self.assertEqual(c.sendmail(msg)._sender.email, sender)
+
+        threads = [threading.Thread(target=send, args=('postman{}@example.com'.format(i),)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertIsNone(msg._sender)
+        self.assertEqual(len(lo), 400)
+        self.assertEqual({m._sender.email for m in lo}, {'postman{}@example.com'.format(i) for i in range(4)})
+        self.assertEqual({m._msgid for m in lo}, {msg._msgid})
+
+        # An explicit sender is kept
+        msg = Message(['test@gmail.com'], 'Test', sender='me@example.com')
+        with Postman('test@example.com', lo).connect() as c:
+            self.assertIs(c.sendmail(msg), msg)
+
+
+class DroppingConnection(LoopbackConnection):
+    """ Loopback that drops the session after `limit` messages """
+
+    def __init__(self, limit):
+        super(DroppingConnection, self).__init__()
+        self.limit = limit
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        return {'sent': 0}
+
+    def sendmail(self, client, message):
+        if message._subject == 'reject':
+            raise smtplib.SMTPDataError(554, b'Rejected')
+        if client['sent'] >= self.limit:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        client['sent'] += 1
+        super(DroppingConnection, self).sendmail(client, message)
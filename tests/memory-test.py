@@ -0,0 +1,88 @@
+import gc
+import os
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from mailem import Message, Attachment, ImageAttachment
+
+
+KB = 1 << 10
+MB = 1 << 20
+
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF' + b'\x00' * (20 * KB)
+
+
+def measure(f, keep=False):
+    """ Measure the memory used by a function call
+
+    :param keep: Keep the result while measuring the retained memory
+    :return: (peak, retained) bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        result = f()
+        peak = tracemalloc.get_traced_memory()[1] - base
+        if not keep:
+            del result
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return peak, retained
+
+
+@unittest.skipIf(tracemalloc is None, 'tracemalloc is not available')
+class MemoryBudgetTest(unittest.TestCase):
+    """ Memory budgets per message.
+
+    * `queued`: the memory a constructed Message holds, i.e. the cost of keeping it in a queue
+    * `peak`: the peak memory while serializing a Message
+    * `retained`: the memory still allocated after the serialized message has been dropped
+
+    When a budget is exceeded, check for new copies of the message data before raising it.
+    """
+
+    def assertBudget(self, make, queued, peak, retained):
+        msg = make()
+        msg._serialize()  # warm up: lazy imports and caches
+
+        q = measure(make, keep=True)[1]
+        self.assertLessEqual(q, queued, 'queued: {} bytes over the budget of {}'.format(q, queued))
+
+        for eightbit in (False, True):
+            p, r = measure(lambda: msg._serialize(eightbit=eightbit))
+            self.assertLessEqual(p, peak, 'peak: {} bytes over the budget of {}'.format(p, peak))
+            self.assertLessEqual(r, retained, 'retained: {} bytes over the budget of {}'.format(r, retained))
+
+    def test_text(self):
+        """ Text-only message """
+        self.assertBudget(
+            lambda: Message(['user@example.com'], u'Hello', text=u'Hello, world!\n' * 100,
+                            sender='noreply@example.com'),
+            queued=4 * KB, peak=40 * KB, retained=4 * KB)
+
+    def test_html_inline_images(self):
+        """ HTML with inline images """
+        self.assertBudget(
+            lambda: Message(['user@example.com'], u'Hello',
+                            u'<img src="cid:1.jpg"><img src="cid:2.jpg">\n' * 50,
+                            sender='noreply@example.com',
+                            attachments=[ImageAttachment('1.jpg', JPEG, 'inline'),
+                                         ImageAttachment('2.jpg', JPEG, 'inline')]),
+            queued=8 * KB, peak=400 * KB, retained=8 * KB)
+
+    def test_large_attachment(self):
+        """ 10 MB attachment """
+        data = os.urandom(10 * MB)
+        self.assertBudget(
+            lambda: Message(['user@example.com'], u'Hello', u'<b>See attached</b>',
+                            sender='noreply@example.com',
+                            attachments=[Attachment(u'data.bin', data)]),
+            # The attachment data itself is shared, and does not count towards `queued`
+            queued=8 * KB, peak=9 * len(data), retained=64 * KB)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from mailem import Postman
+from mailem.connection import LoopbackConnection
+from mailem.template import Template
+from mailem.merge import read_rows, merge, main, Progress
+
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+        # CSV, as exported by a spreadsheet: BOM, CRLF, quoted values
+        self.csv = os.path.join(self.dir, 'users.csv')
+        with io.open(self.csv, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write(u'email,name,city\r\n')
+            for i in range(100):
+                f.write(u'user{0}@example.com,"User, {0}",Москва\r\n'.format(i))
+            f.write(u',Nobody,Nowhere\r\n')  # no email: skipped
+
+        self.jsonl = os.path.join(self.dir, 'users.jsonl.gz')
+        with gzip.open(self.jsonl, 'wt') as f:
+            for i in range(100):
+                f.write(json.dumps({'email': 'user{}@example.com'.format(i), 'name': u'User {}'.format(i),
+                                    'city': u'Москва'}) + '\n')
+            f.write('\n')
+
+    def test_read_rows(self):
+        """ CSV and JSONL are streamed """
+        rows = read_rows(self.csv)
+        self.assertEqual(next(rows), {'email': 'user0@example.com', 'name': 'User, 0', 'city': u'Москва'})
+        self.assertEqual(len(list(rows)), 100)
+
+        rows = list(read_rows(self.jsonl))
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[0]['city'], u'Москва')
+
+        self.assertRaises(ValueError, list, read_rows(os.path.join(self.dir, 'users.xls')))
+
+    def test_merge(self):
+        """ Rows are rendered and sent """
+        lo = LoopbackConnection()
+        out = io.StringIO()
+        with Progress(out=out, interval=0) as progress:
+            stats = merge(read_rows(self.csv), Template(u'Hi $name', u'Hello from $city'),
+                          Postman('test@example.com', lo), name='name', workers=3, progress=progress)
+
+        self.assertEqual(stats, {'sent': 100, 'failed': 0, 'skipped': 0})
+        self.assertEqual(len(lo), 100)
+        self.assertEqual((progress.rows, progress.sent), (101, 100))
+        self.assertIn('100 sent', out.getvalue())
+
+        m = lo.find(recipient='user7@example.com')[0]
+        self.assertEqual(m._subject, u'Hi User, 7')
+        self.assertEqual(m._html, u'Hello from Москва')
+        self.assertEqual(m._recipients[0].name, u'User, 7')
+
+    def test_resume(self):
+        """ With a journal, a merge can be resumed """
+        journal = os.path.join(self.dir, 'journal')
+        template = Template(u'Hi $name', u'Hello')
+
+        def rows(n):
+            for i, row in enumerate(read_rows(self.jsonl)):
+                if i == n:
+                    raise KeyboardInterrupt()
+                yield row
+
+        lo = LoopbackConnection()
+        self.assertRaises(KeyboardInterrupt, merge, rows(30), template, Postman('test@example.com', lo),
+                          workers=1, journal=journal)
+        self.assertEqual(len(lo), 30)
+
+        stats = merge(rows(None), template, Postman('test@example.com', lo), journal=journal)
+        self.assertEqual(stats, {'sent': 70, 'failed': 0, 'skipped': 30})
+        self.assertEqual(len(set(m._recipients[0].email for m in lo)), 100)
+
+        # The campaign is named after the journal
+        self.assertTrue(lo[0]._msgid.startswith('<journal.'))
+
+    def test_msgid(self):
+        """ Without a journal, Message-IDs are unique """
+        lo = LoopbackConnection()
+        for subject in (u'Newsletter 1', u'Newsletter 2'):
+            merge(read_rows(self.csv), Template(subject, u'Hello'), Postman('test@example.com', lo), workers=1)
+        self.assertEqual(len(set(m._msgid for m in lo)), 200)
+
+    def test_cli(self):
+        """ Command line, dry run """
+        templates = os.path.join(self.dir, 'templates')
+        os.makedirs(os.path.join(templates, 'welcome'))
+        for filename, content in (('subject.txt', u'Hi $name'), ('index.htm', u'Welcome to $city')):
+            with io.open(os.path.join(templates, 'welcome', filename), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+        code = main([self.csv, '--templates', templates, '--template', 'welcome',
+                     '--sender', 'test@example.com', '--dry-run', '--progress', '0', '-c', '2'])
+        self.assertEqual(code, 0)
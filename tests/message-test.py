@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import sys
 import unittest
 
 from mailem import Message, Attachment, ImageAttachment
 
-from future.utils import PY2
+PY2 = sys.version_info[0] == 2
 
 
 class MessageTest(unittest.TestCase):
@@ -89,3 +90,55 @@ class MessageTest(unittest.TestCase):
             self.assertIn('Content-Disposition: inline; filename="=?utf-8?q?cute=2Ejpg?="', msg_str)
         else:
             self.assertIn('Content-Disposition: inline; filename="cute.jpg"', msg_str)
+
+    @unittest.skipIf(PY2, 'No 8-bit support in Python 2')
+    def test_eightbit(self):
+        msg = Message(
+            [('vasya@example.com', u'Вася')],
+            u'Привет',
+            u'<b>Привет, мир!</b>',
+            text=u'Привет, ' + u'мир' * 1000,  # too long for 8bit
+        )
+
+        # 7bit
+        msg_bytes = msg._serialize()
+        msg_bytes.decode('ascii')
+        self.assertNotIn(b'8bit', msg_bytes)
+
+        # 8BITMIME: 8bit text parts, encoded headers
+        msg_bytes = msg._serialize(eightbit=True)
+        self.assertIn(b'Subject: =?utf-8?b?', msg_bytes)
+        self.assertIn(b'Content-Type: text/html; charset="utf-8"\nMIME-Version: 1.0\nContent-Transfer-Encoding: 8bit', msg_bytes)
+        self.assertIn(u'<b>Привет, мир!</b>'.encode('utf-8'), msg_bytes)
+        self.assertIn(b'Content-Type: text/plain; charset="utf-8"\nMIME-Version: 1.0\nContent-Transfer-Encoding: base64', msg_bytes)
+
+        # SMTPUTF8: raw headers
+        msg_bytes = msg._serialize(eightbit=True, utf8=True)
+        self.assertIn(u'Subject: Привет'.encode('utf-8'), msg_bytes)
+        self.assertIn(u'To: Вася <vasya@example.com>'.encode('utf-8'), msg_bytes)
+        self.assertIn(u'<b>Привет, мир!</b>'.encode('utf-8'), msg_bytes)
+
+        # SMTPUTF8: internationalized addresses
+        msg = Message([u'вася@пример.рф'], 'Hi', sender=(u'почта@пример.рф', u'Почта'))
+        msg_bytes = msg._serialize(eightbit=True, utf8=True)
+        self.assertIn(u'From: Почта <почта@пример.рф>'.encode('utf-8'), msg_bytes)
+        self.assertIn(u'To: вася@пример.рф'.encode('utf-8'), msg_bytes)
+
+    def test_estimate_size(self):
+        """ Size estimate is close to the real size """
+        data = bytes(bytearray(range(256))) * 4096  # 1 MiB
+        messages = [
+            Message(['test@example.com'], 'Hello', '<b>Hello</b>'),
+            Message([('vasya@example.com', u'Вася')], u'Привет', u'<b>Привет, мир!</b>' * 500,
+                    text=u'Привет, мир! ' * 500, sender='test@example.com'),
+            Message(['test@example.com'], 'Report', 'See attached', sender='test@example.com',
+                    attachments=[Attachment('report.bin', data), Attachment('notes.txt', b'Notes' * 10000)]),
+        ]
+        for msg in messages:
+            for eightbit in ((False,) if PY2 else (False, True)):
+                real = len(msg._serialize(eightbit=eightbit)) if not PY2 else len(str(msg))
+                estimate = msg.estimate_size(eightbit)
+                if real > 10000:
+                    self.assertAlmostEqual(estimate, real, delta=real * 0.05)
+                else:
+                    self.assertAlmostEqual(estimate, real, delta=300)
@@ -0,0 +1,71 @@
+import smtplib
+import unittest
+
+from mailem import Message, Postman
+from mailem.connection import LoopbackConnection
+from mailem.metrics import HistogramMetrics, timer
+from mailem.template import Template, TemplateRegistry
+
+
+class HistogramMetricsTest(unittest.TestCase):
+    def test_histogram(self):
+        metrics = HistogramMetrics(precision=0.01)
+        for i in range(1, 1001):
+            metrics.record('smtp', i / 1000.0, bytes=100, recipients=2, code=250)
+        metrics.record('smtp', 5.0, error='SMTPDataError', code=451)
+
+        # Percentiles are accurate within the precision
+        self.assertAlmostEqual(metrics.percentile('smtp', 50), 0.5, delta=0.5 * 0.01)
+        self.assertAlmostEqual(metrics.percentile('smtp', 99), 0.99, delta=0.99 * 0.01)
+        self.assertEqual(metrics.percentile('smtp', 100), 5.0)
+        self.assertIsNone(metrics.percentile('connect', 50))
+
+        # Summary
+        summary = metrics.summary()['smtp']
+        self.assertEqual(summary['count'], 1001)
+        self.assertEqual(summary['bytes'], 100 * 1000)
+        self.assertEqual(summary['recipients'], 2 * 1000)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['codes'], {250: 1000, 451: 1})
+        self.assertEqual(summary['max'], 5.0)
+        self.assertEqual(set(summary), {'count', 'mean', 'max', 'bytes', 'recipients', 'errors', 'codes',
+                                        'p50', 'p90', 'p99'})
+
+        # Reset
+        metrics.reset()
+        self.assertEqual(metrics.stages(), [])
+
+    def test_timer(self):
+        metrics = HistogramMetrics()
+
+        with timer(metrics, 'ok', recipients=1) as t:
+            t.info['code'] = 250
+        with self.assertRaises(smtplib.SMTPDataError):
+            with timer(metrics, 'fail'):
+                raise smtplib.SMTPDataError(554, b'Rejected')
+        with timer(None, 'nothing'):
+            pass
+
+        summary = metrics.summary()
+        self.assertEqual(sorted(summary), ['fail', 'ok'])
+        self.assertEqual(summary['ok']['codes'], {250: 1})
+        self.assertEqual(summary['fail']['codes'], {554: 1})
+        self.assertEqual(summary['fail']['errors'], 1)
+
+    def test_hooks(self):
+        """ Postman and Template report their stages """
+        metrics = HistogramMetrics()
+
+        registry = TemplateRegistry().set_metrics(metrics)
+        template = registry.add('test', Template('Hello $user', 'Hi $user'))
+
+        postman = Postman('test@example.com', LoopbackConnection(), metrics=metrics)
+        with postman.connect() as c:
+            for i in range(3):
+                c.sendmail(template(['test@example.com', 'other@example.com'], {'user': 'Honored User'}))
+
+        summary = metrics.summary()
+        self.assertEqual(summary['render']['count'], 3)
+        self.assertEqual(summary['sendmail']['count'], 3)
+        self.assertEqual(summary['sendmail']['recipients'], 6)
+        self.assertEqual(summary['sendmail']['codes'], {250: 3})
@@ -0,0 +1,84 @@
+import socket
+import smtplib
+import unittest
+
+from mailem import Message, Postman
+from mailem.connection import LoopbackConnection, MultiConnection
+
+
+class BrokenConnection(LoopbackConnection):
+    """ Connection that fails to connect """
+
+    def connect(self):
+        raise socket.error('Connection refused')
+
+
+class RejectingConnection(LoopbackConnection):
+    """ Connection that rejects all messages """
+
+    def sendmail(self, client, message):
+        raise smtplib.SMTPDataError(554, b'Rejected')
+
+
+class MultiConnectionTest(unittest.TestCase):
+    def test_round_robin(self):
+        """ Weighted round-robin """
+        a, b = LoopbackConnection(), LoopbackConnection()
+        postman = Postman('test@example.com', MultiConnection([(a, 2), (b, 1)]))
+
+        with postman.connect() as c:
+            for i in range(9):
+                c.sendmail(Message(['test@example.com'], 'Test'))
+
+        self.assertEqual(len(a), 6)
+        self.assertEqual(len(b), 3)
+
+    def test_least_outstanding(self):
+        """ Least-outstanding: with no concurrency, always goes to the first relay """
+        a, b = LoopbackConnection(), LoopbackConnection()
+        postman = Postman('test@example.com', MultiConnection([a, b], strategy='least-outstanding'))
+
+        with postman.connect() as c:
+            for i in range(3):
+                c.sendmail(Message(['test@example.com'], 'Test'))
+
+        self.assertEqual(len(a), 3)
+        self.assertEqual(len(b), 0)
+
+    def test_failover(self):
+        """ Failover to a healthy relay, cool-down """
+        broken, a = BrokenConnection(), LoopbackConnection()
+        connection = MultiConnection([broken, a], max_failures=1, cooldown=60)
+        postman = Postman('test@example.com', connection)
+
+        with postman.connect() as c:
+            for i in range(4):
+                c.sendmail(Message(['test@example.com'], 'Test'))
+
+        # Nothing lost
+        self.assertEqual(len(a), 4)
+
+        # The broken relay is cooling down
+        broken_relay = connection.relays[0]
+        self.assertEqual(broken_relay.failures, 1)
+        self.assertGreater(broken_relay.down_until, 0)
+        self.assertEqual(connection.relays[1].failures, 0)
+
+    def test_all_failed(self):
+        """ All relays are down: error """
+        postman = Postman('test@example.com', MultiConnection([BrokenConnection(), BrokenConnection()]))
+
+        with postman.connect() as c:
+            self.assertRaises(socket.error, c.sendmail, Message(['test@example.com'], 'Test'))
+
+    def test_permanent_error(self):
+        """ Permanent errors are not retried through other relays """
+        rejecting, a = RejectingConnection(), LoopbackConnection()
+        connection = MultiConnection([rejecting, a])
+        postman = Postman('test@example.com', connection)
+
+        with postman.connect() as c:
+            self.assertRaises(smtplib.SMTPDataError, c.sendmail, Message(['test@example.com'], 'Test'))
+
+        self.assertEqual(len(a), 0)
+        self.assertEqual(connection.relays[0].failures, 0)  # the relay is fine
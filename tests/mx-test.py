@@ -0,0 +1,129 @@
+import smtplib
+import unittest
+from time import sleep
+
+from mailem import Message, Postman
+from mailem.connection import MXConnection
+from mailem.connection.mx import StaticResolver
+from mailem.connection.smtp import PartialDeliveryError, is_transient_error, is_disconnect_error
+from mailem.retry import RetryScheduler
+
+try:
+    import aiosmtpd
+
+    from aiosmtpd.controller import Controller
+    from .asyncio_utils import RecordingHandler
+except ImportError:
+    aiosmtpd = None
+
+
+class CountingResolver(StaticResolver):
+    def __init__(self, *args, **kwargs):
+        super(CountingResolver, self).__init__(*args, **kwargs)
+        self.lookups = 0
+
+    def resolve(self, domain):
+        self.lookups += 1
+        return super(CountingResolver, self).resolve(domain)
+
+
+@unittest.skipIf(aiosmtpd is None, 'aiosmtpd not available')
+class MXConnectionTest(unittest.TestCase):
+    port = 50597
+    dead_port = 50599  # nothing listens here
+
+    def setUp(self):
+        self.handlers = [RecordingHandler(), RecordingHandler()]
+        for i, handler in enumerate(self.handlers):
+            controller = Controller(handler, loop=None, hostname='localhost', port=self.port + i)
+            controller.start()
+            self.addCleanup(controller.stop)
+        sleep(0.1)
+
+        self.resolver = CountingResolver({
+            'one.test': [('localhost', self.port)],
+            'two.test': [('localhost', self.port + 1)],
+            'fallback.test': [('localhost', self.dead_port), ('localhost', self.port + 1)],
+        })
+
+    def test_mx(self):
+        """ Recipients are grouped by domain; sessions are pooled per server """
+        mx = MXConnection(self.resolver)
+        postman = Postman('test@example.com', mx)
+
+        msg = Message(['a@one.test', 'b@two.test'], 'Test', cc=['c@ONE.test'], bcc=['d@fallback.test'])
+        with postman.connect() as c:
+            c.sendmail(msg)
+        with postman.connect() as c:
+            c.sendmail(Message(['e@one.test'], 'Test'))
+
+        one, two = self.handlers
+        self.assertEqual([t[:2] for t in one.transactions], [
+            ('test@example.com', ['a@one.test', 'c@one.test']),  # domains are lowercased
+            ('test@example.com', ['e@one.test']),
+        ])
+        self.assertEqual([t[:2] for t in two.transactions], [
+            ('test@example.com', ['b@two.test']),
+            ('test@example.com', ['d@fallback.test']),  # through the second MX
+        ])
+
+        # The same message everywhere
+        self.assertIn(b'To: a@one.test, b@two.test', one.transactions[0][2])
+        self.assertIn(b'To: a@one.test, b@two.test', two.transactions[0][2])
+
+        # MX records are cached; sessions are pooled
+        self.assertEqual(self.resolver.lookups, 3)
+        self.assertEqual(len(mx._pools[('localhost', self.port)]), 1)
+        self.assertEqual(len(mx._pools[('localhost', self.port + 1)]), 1)
+        mx.close()
+        self.assertEqual(len(mx._pools[('localhost', self.port)]), 0)
+
+    def test_ttl(self):
+        """ MX records expire """
+        self.resolver.ttl = 0
+        postman = Postman('test@example.com', MXConnection(self.resolver))
+        with postman.connect() as c:
+            c.sendmail(Message(['a@one.test'], 'Test'))
+            c.sendmail(Message(['a@one.test'], 'Test'))
+        self.assertEqual(self.resolver.lookups, 2)
+
+    def test_failures(self):
+        """ Partial failures report the failed recipients only """
+        postman = Postman('test@example.com', MXConnection(self.resolver))
+
+        with postman.connect() as c:
+            with self.assertRaises(PartialDeliveryError) as e:
+                c.sendmail(Message(['a@one.test', 'b@unknown.test', 'c@unknown.test'], 'Test'))
+            self.assertEqual(sorted(e.exception.recipients), ['b@unknown.test', 'c@unknown.test'])
+            self.assertEqual(e.exception.accepted, ['a@one.test'])
+            self.assertEqual({code for code, msg in e.exception.recipients.values()}, {550})
+            self.assertEqual(len(self.handlers[0].transactions), 1)
+
+            # Single domain: its own error
+            self.resolver.table['dead.test'] = [('localhost', self.dead_port)]
+            self.assertRaises(OSError, c.sendmail, Message(['a@dead.test'], 'Test'))
+
+    def test_partial_no_retry(self):
+        """ A partial delivery is never retried: the healthy domain gets exactly one copy """
+        self.resolver.table['dead.test'] = [('localhost', self.dead_port)]
+        msg = Message(['a@one.test', 'b@dead.test'], 'Test')
+
+        # Reconnects
+        postman = Postman('test@example.com', MXConnection(self.resolver), reconnect=3)
+        with postman.connect() as c:
+            with self.assertRaises(PartialDeliveryError) as e:
+                c.sendmail(msg)
+        self.assertEqual(e.exception.accepted, ['a@one.test'])
+        self.assertEqual(e.exception.recipients['b@dead.test'][0], 451)  # the dead domain itself is transient
+        self.assertFalse(is_transient_error(e.exception))
+        self.assertFalse(is_disconnect_error(e.exception))
+        self.assertEqual(len(self.handlers[0].transactions), 1)
+
+        # Retries
+        failed = []
+        scheduler = RetryScheduler(postman, base_delay=0, jitter=0, on_failed=lambda m, e: failed.append(e))
+        scheduler.schedule(msg)
+        scheduler.run()
+        self.assertEqual(len(failed), 1)
+        self.assertIsInstance(failed[0], PartialDeliveryError)
+        self.assertEqual(len(self.handlers[0].transactions), 2)
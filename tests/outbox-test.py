@@ -0,0 +1,118 @@
+import time
+import socket
+import smtplib
+import threading
+import unittest
+
+from mailem import Message, Postman, Attachment
+from mailem.connection import LoopbackConnection
+from mailem.outbox import Outbox, OutboxFull
+
+
+class SlowConnection(LoopbackConnection):
+    """ Loopback that takes time to send, and fails some messages """
+
+    def __init__(self, delay=0):
+        super(SlowConnection, self).__init__()
+        self.delay = delay
+        self.sessions = 0
+
+    def connect(self):
+        self.sessions += 1
+        return {}
+
+    def sendmail(self, client, message):
+        time.sleep(self.delay)
+        if message._subject == 'reject':
+            raise smtplib.SMTPDataError(554, b'Rejected')
+        if message._subject == 'drop':
+            raise socket.error('Connection reset')
+        super(SlowConnection, self).sendmail(client, message)
+
+
+class OutboxTest(unittest.TestCase):
+    def test_backpressure(self):
+        """ Producers are blocked while the outbox is full """
+        lo = SlowConnection(delay=0.001)
+        outbox = Postman('test@example.com', lo).outbox(max_messages=5, workers=2)
+        longest = [0]
+
+        def watch():
+            while outbox._threads:
+                longest[0] = max(longest[0], len(outbox))
+                time.sleep(0.001)
+
+        with outbox:
+            threading.Thread(target=watch).start()
+            for i in range(100):
+                outbox.put(Message(['test@gmail.com'], 'Test {}'.format(i)))
+
+        self.assertEqual(len(lo), 100)
+        self.assertLessEqual(longest[0], 5)
+        self.assertEqual(lo.sessions, 2)
+        self.assertEqual((len(outbox), outbox.bytes), (0, 0))
+        self.assertRaises(RuntimeError, outbox.put, Message(['test@gmail.com'], 'Late'))
+
+    def test_reject(self):
+        """ Non-blocking outbox rejects producers; limits by bytes """
+        outbox = Outbox(Postman('test@example.com', LoopbackConnection()), max_messages=3, max_bytes=1000, block=False)
+
+        outbox.put(Message(['test@gmail.com'], 'Test', attachments=[Attachment('a.bin', b'0' * 600)]))
+        self.assertRaises(OutboxFull, outbox.put, Message(['test@gmail.com'], 'Test', text=u'1' * 600))
+        outbox.put(Message(['test@gmail.com'], 'Test', text=u'1' * 300))
+        self.assertEqual((len(outbox), outbox.bytes), (2, 900))
+
+        # Blocking with a timeout
+        self.assertRaises(OutboxFull, outbox.put, Message(['test@gmail.com'], 'Test', text=u'1' * 300),
+                          block=True, timeout=0.01)
+
+        # Consumer
+        self.assertEqual(outbox.get()._text, None)
+        self.assertEqual(outbox.bytes, 300)
+        outbox.task_done()
+        outbox.get()
+        outbox.task_done()
+        self.assertIsNone(outbox.get(timeout=0.01))
+        outbox.join()
+
+        # A big message is accepted when the outbox is empty
+        outbox.put(Message(['test@gmail.com'], 'Test', text=u'1' * 5000))
+        self.assertEqual(len(outbox), 1)
+
+    def test_failures(self):
+        """ Failures are reported; lost sessions are reopened """
+        lo = SlowConnection()
+        sent, failed = [], []
+        with Outbox(Postman('test@example.com', lo),
+                    on_sent=lambda m: sent.append(m._subject),
+                    on_failed=lambda m, e: failed.append(m._subject)) as outbox:
+            for subject in ('a', 'reject', 'b', 'drop', 'c'):
+                outbox.put(Message(['test@gmail.com'], subject))
+
+        self.assertEqual(sent, ['a', 'b', 'c'])
+        self.assertEqual(failed, ['reject', 'drop'])
+        self.assertEqual(lo.sessions, 2)
+
+    def test_failing_callbacks(self):
+        """ Failing callbacks do not stop the consumer, and every message is handled once """
+        lo = SlowConnection()
+        seen = []
+
+        def callback(m, e=None):
+            seen.append(m._subject)
+            raise ValueError('Callback bug')
+
+        outbox = Outbox(Postman('test@example.com', lo), on_sent=callback, on_failed=callback).start()
+        for subject in ('a', 'reject', 'b', 'drop', 'c'):
+            outbox.put(Message(['test@gmail.com'], subject))
+
+        t = threading.Thread(target=outbox.join)
+        t.daemon = True
+        t.start()
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        outbox.stop()
+
+        self.assertEqual(seen, ['a', 'reject', 'b', 'drop', 'c'])
+        self.assertEqual(outbox._inflight, 0)
+        self.assertEqual(lo.sessions, 2)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import io
+import re
+import sys
+import base64
+import shutil
+import pickle
+import tempfile
+import unittest
+
+from mailem import Message, Attachment, ImageAttachment
+from mailem.pack import dumps, loads, dump, load, MemoryAttachmentStore, DirectoryAttachmentStore
+
+PY2 = sys.version_info[0] == 2
+
+PNG = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+class PackTest(unittest.TestCase):
+    def _message(self, data=b'\x00\x01' * 1000):
+        return Message([('a@example.com', u'Вася'), 'b@example.com'], u'Привет', u'<b>Привет!</b>', u'Привет!',
+                       sender=('test@example.com', u'Мы'), cc=['c@example.com'], bcc=['d@example.com'],
+                       reply_to='r@example.com', date=1500000000.0, headers={'X-Custom': 'Test'},
+                       attachments=[Attachment(u'data.bin', data),
+                                    Attachment(u'note.txt', u'Заметка', 'text/plain'),
+                                    ImageAttachment(u'dot.png', PNG, 'inline')])
+
+    def assertSameMessage(self, a, b):
+        """ Messages are the same: the same MIME, except for boundaries """
+        self.assertEqual(a._msgid, b._msgid)
+        boundary = lambda m: re.sub(br'=_[0-9a-f]{24}', b'BOUNDARY', m._serialize())
+        self.assertEqual(boundary(a), boundary(b))
+
+    def test_roundtrip(self):
+        """ Messages survive the round trip; attachments are views of the encoded data """
+        message = self._message()
+        data = dumps(message)
+        self.assertTrue(data.startswith(b'MLEM'))
+        decoded = loads(data)
+        self.assertSameMessage(message, decoded)
+
+        a = decoded._attachments
+        if not PY2:  # Python 2 copies
+            self.assertIsInstance(a[0].data, memoryview)
+            self.assertEqual(a[0].data.obj, data)  # zero-copy: a view of the encoded message
+        self.assertEqual(a[1].data, u'Заметка')
+        self.assertIn(base64.b64encode(u'Заметка'.encode('utf-8')), decoded._serialize())  # text is sent as UTF-8
+        self.assertIsInstance(a[2], ImageAttachment)
+        self.assertEqual(a[2].headers['Content-ID'], '<dot.png>')
+
+        # Much smaller than a pickle: no object graph
+        self.assertLess(len(data), len(pickle.dumps(message, 2)))
+
+        # Files; memoryviews of other buffers
+        f = io.BytesIO()
+        dump(message, f)
+        self.assertEqual(f.getvalue(), data)
+        f.seek(0)
+        self.assertSameMessage(message, load(f))
+        self.assertSameMessage(message, loads(memoryview(bytearray(data))))
+
+        # Garbage
+        self.assertRaises(ValueError, loads, b'')
+        self.assertRaises(ValueError, loads, b'PK\x03\x04' + data[4:])
+
+    def test_shared_data(self):
+        """ The same data attached twice is included once """
+        blob = b'x' * 10000
+        message = Message(['a@example.com'], u'Hi', u'Hi', attachments=[Attachment(u'a', blob), Attachment(u'b', blob)])
+        data = dumps(message)
+        self.assertLess(len(data), 11000)
+        decoded = loads(data)
+        self.assertEqual(bytes(decoded._attachments[1].data), blob)
+
+    def test_store(self):
+        """ Attachments go to the store once, by content hash """
+        blob = b'\xff' * 100000
+        for store in (MemoryAttachmentStore(), None):
+            if store is None:
+                path = tempfile.mkdtemp()
+                self.addCleanup(shutil.rmtree, path)
+                store = DirectoryAttachmentStore(path)
+
+            messages = [self._message(blob) for i in range(3)]
+            packed = [dumps(m, store) for m in messages]
+            self.assertLess(len(packed[0]), 2000)  # only references
+            if isinstance(store, MemoryAttachmentStore):
+                self.assertEqual(len(store._data), 3)
+
+            decoded = loads(packed[0], store)
+            self.assertEqual(bytes(decoded._attachments[0].data), blob)
+            self.assertSameMessage(messages[0], decoded)
+
+            # Stored attachments are required
+            self.assertRaises(KeyError, loads, packed[0])
+            self.assertRaises(KeyError, loads, packed[0], MemoryAttachmentStore())
+
+        # Files are mapped, not read
+        if not PY2:
+            self.assertIsInstance(decoded._attachments[0].data, memoryview)
+
+    def test_unsupported(self):
+        """ Attachment subclasses can't be encoded """
+        class MyAttachment(Attachment):
+            pass
+
+        self.assertRaises(TypeError, dumps, Message(['a@example.com'], u'Hi', u'Hi',
+                                                    attachments=[MyAttachment(u'a', b'a')]))
@@ -0,0 +1,128 @@
+import time
+import smtplib
+import unittest
+
+from mailem import Message, Postman
+from mailem.connection import LoopbackConnection, PooledConnection, MultiConnection
+
+
+class CountingConnection(LoopbackConnection):
+    """ Loopback that counts sessions, and can fail messages """
+
+    def __init__(self, connect_delay=0):
+        super(CountingConnection, self).__init__()
+        self.connect_delay = connect_delay
+        self.opened = 0
+        self.closed = 0
+        self.fail = False
+
+    def sendmail(self, client, message):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed: timed out')
+        super(CountingConnection, self).sendmail(client, message)
+
+    def connect(self):
+        time.sleep(self.connect_delay)
+        self.opened += 1
+        return object()
+
+    def disconnect(self, client):
+        self.closed += 1
+
+
+class PooledConnectionTest(unittest.TestCase):
+    def test_pool(self):
+        """ Sessions are reused """
+        lo = CountingConnection()
+        pool = PooledConnection(lo, size=2)
+        postman = Postman('test@example.com', pool)
+
+        for i in range(3):
+            with postman.connect() as c:
+                c.sendmail(Message(['test@example.com'], 'Test'))
+
+        self.assertEqual(len(lo), 3)
+        self.assertEqual((lo.opened, lo.closed), (1, 0))
+        self.assertEqual(len(pool), 1)
+
+        # Two at a time
+        with postman.connect() as c1, postman.connect() as c2, postman.connect() as c3:
+            self.assertIsNot(c1.client, c2.client)
+        self.assertEqual((lo.opened, lo.closed), (3, 1))  # pool is full
+        self.assertEqual(len(pool), 2)
+
+        # Close
+        pool.close()
+        self.assertEqual((lo.opened, lo.closed), (3, 3))
+        self.assertEqual(len(pool), 0)
+
+    def test_failed(self):
+        """ Failed sessions are not returned to the pool """
+        lo = CountingConnection()
+        pool = PooledConnection(lo, size=2)
+        postman = Postman('test@example.com', pool)
+
+        # The last message has failed, mid-transaction
+        lo.fail = True
+        with postman.connect() as c:
+            failed = c.client
+            self.assertRaises(smtplib.SMTPServerDisconnected, c.sendmail, Message(['test@example.com'], 'Test'))
+        self.assertEqual((lo.opened, lo.closed, len(pool)), (1, 1, 0))
+
+        # The next connect() gets a fresh session
+        lo.fail = False
+        with postman.connect() as c:
+            self.assertIsNot(c.client, failed)
+            c.sendmail(Message(['test@example.com'], 'Test'))
+        self.assertEqual((lo.opened, lo.closed, len(pool)), (2, 1, 1))
+
+        # The block has failed
+        with self.assertRaises(ValueError):
+            with postman.connect() as c:
+                raise ValueError()
+        self.assertEqual((lo.opened, lo.closed, len(pool)), (2, 2, 0))
+
+    def test_max_idle_time(self):
+        """ Stale sessions are not reused """
+        lo = CountingConnection()
+        pool = PooledConnection(lo, size=2, max_idle_time=0.1)
+        postman = Postman('test@example.com', pool)
+
+        with postman.connect() as c:
+            pass
+        time.sleep(0.2)
+        with postman.connect() as c:
+            pass
+        self.assertEqual((lo.opened, lo.closed), (2, 1))
+
+    def test_warmup(self):
+        """ Warm-up opens sessions in the background """
+        lo = CountingConnection(connect_delay=0.1)
+        pool = PooledConnection(lo, size=3, min_idle=2)
+        postman = Postman('test@example.com', pool)
+
+        # Warm up
+        postman.warmup(wait=True)
+        self.assertEqual(lo.opened, 3)
+
+        # Ready sessions: no waiting
+        start = time.time()
+        with postman.connect() as c1, postman.connect() as c2:
+            self.assertLess(time.time() - start, 0.05)
+
+            # The pool is running low: refilled in the background
+            pool.warmup(pool.min_idle, wait=True)
+            self.assertEqual(len(pool), 2)
+            self.assertEqual(lo.opened, 3 + 1)
+
+        # Raising the target of a running warm-up
+        pool.close()
+        pool.warmup(1)
+        pool.warmup(3, wait=True)
+        self.assertEqual(len(pool), 3)
+        self.assertIsNone(pool._warmer)
+        self.assertEqual(pool._warmup_target, 0)
+
+        # Warm-up is harmless with connections that have no pool
+        Postman('test@example.com', LoopbackConnection()).warmup()
+        Postman('test@example.com', MultiConnection([pool])).warmup(wait=True)
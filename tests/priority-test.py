@@ -0,0 +1,107 @@
+import time
+import smtplib
+import threading
+import unittest
+
+from mailem import Message, Postman
+from mailem.connection import LoopbackConnection
+from mailem.metrics import HistogramMetrics
+from mailem.priority import PriorityScheduler, PriorityClass
+
+
+class SlowConnection(LoopbackConnection):
+    """ Loopback that takes time to send, and records which session sent what """
+
+    def __init__(self, delay=0):
+        super(SlowConnection, self).__init__()
+        self.delay = delay
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            self.sessions += 1
+        return {}
+
+    def sendmail(self, client, message):
+        if message._subject == 'reject':
+            raise smtplib.SMTPDataError(554, b'Rejected')
+        time.sleep(self.delay)
+        super(SlowConnection, self).sendmail(client, message)
+
+
+def messages(subject, n):
+    return [Message(['test@gmail.com'], subject) for i in range(n)]
+
+
+class PrioritySchedulerTest(unittest.TestCase):
+    def test_fair_queuing(self):
+        """ Shared connections are split between classes by weight """
+        lo = SlowConnection()
+        scheduler = PriorityScheduler(Postman('test@example.com', lo),
+                                      [PriorityClass('high', weight=3), PriorityClass('low', weight=1)],
+                                      workers=1)
+        for msg in messages('low', 20):
+            scheduler.submit(msg, 'low')
+        for msg in messages('high', 20):
+            scheduler.submit(msg, 'high')
+
+        with scheduler:
+            pass
+
+        subjects = [m._subject for m in lo]
+        self.assertEqual(len(subjects), 40)
+        self.assertEqual(subjects[:16].count('high'), 12)
+        self.assertEqual(subjects[:16].count('low'), 4)
+        self.assertEqual(lo.sessions, 1)  # the session is kept
+
+    def test_reserved(self):
+        """ Urgent messages do not wait behind bulk ones """
+        lo = SlowConnection(delay=0.01)
+        sent = []
+        scheduler = PriorityScheduler(Postman('test@example.com', lo), workers=2,
+                                      on_sent=lambda message: sent.append(message._subject))
+        with scheduler:
+            for msg in messages('bulk', 50):
+                scheduler.submit(msg)
+            time.sleep(0.05)
+            scheduler.submit(Message(['test@gmail.com'], 'urgent'), 'urgent')
+            time.sleep(0.05)
+            self.assertIn('urgent', sent)
+            self.assertLess(len(sent), 20)
+
+        self.assertEqual(len(sent), 51)
+        self.assertEqual(len(scheduler), 0)
+
+    def test_failures(self):
+        """ Failures are reported, and the others are sent """
+        lo = SlowConnection()
+        failed = []
+        metrics = HistogramMetrics()
+        scheduler = PriorityScheduler(Postman('test@example.com', lo), workers=3, metrics=metrics,
+                                      on_failed=lambda message, e: failed.append(e))
+        with scheduler:
+            scheduler.submit(Message(['test@gmail.com'], 'reject'))
+            for msg in messages('bulk', 10):
+                scheduler.submit(msg)
+            self.assertRaises(KeyError, scheduler.submit, Message(['test@gmail.com'], 'test'), 'unknown')
+
+        self.assertEqual(len(lo), 10)
+        self.assertEqual(len(failed), 1)
+        self.assertIsInstance(failed[0], smtplib.SMTPDataError)
+        self.assertEqual(metrics.summary()['queue']['count'], 11)
+
+    def test_stop(self):
+        """ Stopped scheduler keeps the queue """
+        lo = SlowConnection()
+        scheduler = PriorityScheduler(Postman('test@example.com', lo), workers=2, idle_timeout=0.01)
+        scheduler.start()
+        scheduler.submit(Message(['test@gmail.com'], 'test'))
+        self.assertTrue(scheduler.join(1))
+        time.sleep(0.05)  # idle sessions are closed
+        scheduler.stop()
+
+        scheduler.submit(Message(['test@gmail.com'], 'test'))
+        self.assertEqual(len(scheduler), 1)
+        self.assertFalse(scheduler.join(0.01))
+        self.assertEqual(len(lo), 1)
@@ -0,0 +1,84 @@
+import socket
+import smtplib
+import unittest
+
+from mailem import Message, Postman
+from mailem.connection import LoopbackConnection
+from mailem.retry import RetryScheduler
+
+
+class FlakyConnection(LoopbackConnection):
+    """ Loopback that fails messages according to their subject """
+
+    def __init__(self):
+        super(FlakyConnection, self).__init__()
+        self.attempts = {}
+
+    def sendmail(self, client, message):
+        n = self.attempts[message._subject] = self.attempts.get(message._subject, 0) + 1
+        if message._subject == 'permanent':
+            raise smtplib.SMTPDataError(554, b'Rejected')
+        if message._subject == 'transient' and n < 3:
+            raise smtplib.SMTPDataError(451, b'Try again later')
+        if message._subject == 'forever':
+            raise socket.timeout('timed out')
+        super(FlakyConnection, self).sendmail(client, message)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+class RetrySchedulerTest(unittest.TestCase):
+    def test_retry(self):
+        lo = FlakyConnection()
+        clock = FakeClock()
+        sent, failed = [], []
+        scheduler = RetryScheduler(Postman('test@example.com', lo),
+                                   max_attempts=4, base_delay=10, jitter=0,
+                                   on_sent=lambda m: sent.append(m._subject),
+                                   on_failed=lambda m, e: failed.append((m._subject, e)),
+                                   clock=clock)
+
+        for subject in ('transient', 'permanent', 'ok', 'forever'):
+            scheduler.schedule(Message(['test@example.com'], subject))
+
+        # First tick: failures do not block the others
+        self.assertEqual(scheduler.tick(), 10)
+        self.assertEqual(sent, ['ok'])
+        self.assertEqual([s for s, e in failed], ['permanent'])
+        self.assertEqual(len(scheduler), 2)
+
+        # Nothing's due yet
+        clock.sleep(5)
+        self.assertEqual(scheduler.tick(), 5)
+        self.assertEqual(lo.attempts['transient'], 1)
+
+        # Second attempt: backoff doubles
+        clock.sleep(5)
+        self.assertEqual(scheduler.tick(), 20)
+
+        # Run the rest
+        scheduler.run(clock.sleep)
+        self.assertEqual(sent, ['ok', 'transient'])
+        self.assertEqual([s for s, e in failed], ['permanent', 'forever'])
+        self.assertIsInstance(failed[1][1], socket.timeout)
+        self.assertEqual(lo.attempts, {'transient': 3, 'permanent': 1, 'ok': 1, 'forever': 4})
+        self.assertEqual(clock.now, 1000 + 10 + 20 + 40)
+        self.assertEqual(len(scheduler), 0)
+
+    def test_backoff(self):
+        scheduler = RetryScheduler(None, base_delay=1, max_delay=60, jitter=0.5)
+
+        for attempt in range(1, 10):
+            delay = scheduler.backoff(attempt)
+            expected = min(60, 2 ** (attempt - 1))
+            self.assertLessEqual(delay, expected)
+            self.assertGreaterEqual(delay, expected / 2.0)
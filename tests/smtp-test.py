@@ -1,38 +1,39 @@
 # -*- coding: utf-8 -*-
 
+import os
+import ssl
 import socket
 import unittest
 import smtplib
 import smtpd
 import threading
 import asyncore
-from time import sleep
+from time import sleep, time
 
-from mailem import Message, Postman
-from mailem.connection import SMTPConnection
+from mailem import Message, Postman, Attachment
+from mailem.connection import SMTPConnection, MultiConnection
+from mailem.metrics import HistogramMetrics
 
 try:
     import aiosmtpd
 
     from aiosmtpd.controller import Controller
-    from .asyncio_utils import StashingHandler
+    from .asyncio_utils import StashingHandler, LimitingHandler, SlowHandler
 except ImportError:
     aiosmtpd = None
 
 
 class TestSMTP(unittest.TestCase):
     def test_smtp(self):
-        # Set socket timeout (because in some cases the test hangs for 120 seconds)
-        socket.setdefaulttimeout(2.0)
-        self.addCleanup(socket.setdefaulttimeout, None)
-
         # Fake
         msg = Message(['test@gmail.com'], 'Test')
         postman = Postman('test@example.com',
                           SMTPConnection(
                               'smtp.gmail.com', 587,
                               'test@gmail.com', 'wrong',
-                              tls=True))
+                              tls=True,
+                              # Timeout, because in some cases the test hangs for 120 seconds
+                              connect_timeout=2.0))
 
         # try to connect: an error should occur
         try:
@@ -42,6 +43,27 @@ class TestSMTP(unittest.TestCase):
             self.assertEqual(e.smtp_code, 535)
             self.assertIn(b'Username and Password not accepted', e.smtp_error)
 
+    def test_timeouts(self):
+        """ Test read timeout and deadlines with a server that never replies """
+        # A server that accepts connections, but never talks
+        server = socket.socket()
+        server.bind(('localhost', 0))
+        server.listen(5)
+        self.addCleanup(server.close)
+        port = server.getsockname()[1]
+
+        # Read timeout
+        start = time()
+        connection = SMTPConnection('localhost', port, None, None, read_timeout=0.2)
+        self.assertRaises((socket.timeout, smtplib.SMTPServerDisconnected), connection.connect)
+        self.assertLess(time() - start, 1.0)
+
+        # Deadline is stricter than the read timeout
+        start = time()
+        connection = SMTPConnection('localhost', port, None, None, read_timeout=10, deadline=0.2)
+        self.assertRaises((socket.timeout, smtplib.SMTPServerDisconnected), connection.connect)
+        self.assertLess(time() - start, 1.0)
+
     smtpd_port = 50587
 
     def test_real_mail_aiosmtpd(self):
@@ -59,8 +81,10 @@ class TestSMTP(unittest.TestCase):
         sleep(0.5)
 
         # Initialize a Postman
+        metrics = HistogramMetrics()
         postman = Postman('test@example.com',
-                          NoLoginSMTP('localhost', self.smtpd_port, None, None))
+                          NoLoginSMTP('localhost', self.smtpd_port, None, None),
+                          metrics=metrics)
 
         # Send messages
         with postman.connect() as c:
@@ -78,6 +102,204 @@ class TestSMTP(unittest.TestCase):
         # Test
         self.assertEqual(len(mail_handler.mail), 2)
 
+        # Metrics
+        summary = metrics.summary()
+        self.assertEqual(sorted(summary), ['build', 'sendmail', 'serialize', 'smtp'])
+        self.assertEqual(summary['smtp']['codes'], {250: 2})
+        self.assertGreater(summary['smtp']['bytes'], 0)
+        self.assertEqual(summary['smtp']['bytes'], summary['serialize']['bytes'])
+
+    def test_multi_failover_aiosmtpd(self):
+        """ Test MultiConnection failing over between real-world SMTPD servers """
+        if aiosmtpd is None:
+            self.skipTest('aiosmtpd not available')
+
+        # Start two smtp servers
+        handlers = [StashingHandler(), StashingHandler()]
+        controllers = [Controller(handler, loop=None, hostname='localhost', port=self.smtpd_port + 2 + i)
+                       for i, handler in enumerate(handlers)]
+        for controller in controllers:
+            controller.start()
+        self.addCleanup(controllers[1].stop)
+        sleep(0.5)
+
+        # Initialize a Postman
+        postman = Postman('test@example.com',
+                          MultiConnection([
+                              NoLoginSMTP('localhost', self.smtpd_port + 2, None, None),
+                              NoLoginSMTP('localhost', self.smtpd_port + 3, None, None),
+                          ], cooldown=60))
+
+        # Send messages; kill one server mid-batch
+        with postman.connect() as c:
+            for i in range(10):
+                if i == 4:
+                    controllers[0].stop()
+                c.sendmail(Message(['test@example.com'], 'Message #{}'.format(i)))
+
+        # Both were used, and nothing is lost
+        self.assertEqual(len(handlers[0].mail), 2)
+        self.assertEqual(len(handlers[1].mail), 8)
+
+    def test_eightbit_aiosmtpd(self):
+        """ Test 8BITMIME/SMTPUTF8 negotiation """
+        if aiosmtpd is None:
+            self.skipTest('aiosmtpd not available')
+
+        # Start an smtp server
+        mail_handler = StashingHandler()
+        controller = Controller(mail_handler, loop=None,
+                                hostname='localhost', port=self.smtpd_port + 5,
+                                enable_SMTPUTF8=True)
+        controller.start()
+        self.addCleanup(controller.stop)
+        sleep(0.5)
+
+        # Send, with and without 8-bit support
+        for eightbit in (True, False):
+            postman = Postman('test@example.com',
+                              NoLoginSMTP('localhost', self.smtpd_port + 5, None, None, eightbit=eightbit))
+            with postman.connect() as c:
+                c.sendmail(Message([('test@example.com', u'Håkon')], u'Håkon', u'Håkon'))
+
+        # Test
+        (sender, eightbit_content), (sender, sevenbit_content) = mail_handler.mail
+        self.assertIn(u'Subject: Håkon', eightbit_content)
+        self.assertIn(u'To: Håkon <test@example.com>', eightbit_content)
+        self.assertIn(u'Content-Transfer-Encoding: 8bit', eightbit_content)
+        self.assertNotIn(u'Håkon', sevenbit_content)
+        self.assertLess(len(eightbit_content), len(sevenbit_content))
+
+    def test_deadline_aiosmtpd(self):
+        """ Test per-message deadline with a slow server """
+        if aiosmtpd is None:
+            self.skipTest('aiosmtpd not available')
+
+        # Start an smtp server which takes 2 seconds to accept a message
+        controller = Controller(SlowHandler(2.0), loop=None,
+                                hostname='localhost', port=self.smtpd_port + 6)
+        controller.start()
+        self.addCleanup(controller.stop)
+        sleep(0.5)
+
+        postman = Postman('test@example.com',
+                          NoLoginSMTP('localhost', self.smtpd_port + 6, None, None, read_timeout=10, deadline=0.3))
+        start = time()
+        with self.assertRaises((socket.timeout, smtplib.SMTPServerDisconnected)):
+            with postman.connect() as c:
+                c.sendmail(Message(['test@example.com'], 'Subject'))
+        self.assertLess(time() - start, 1.0)
+
+        # A deadline that has passed closes the session: it's in the middle of an exchange
+        client = postman._connection.connect()
+        client.set_deadline(-1)
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            client.noop()
+        self.assertIsNone(client.sock)
+
+    def test_tls_aiosmtpd(self):
+        """ Test STARTTLS with a shared context, and TLS session resumption """
+        if aiosmtpd is None:
+            self.skipTest('aiosmtpd not available')
+
+        # Start an smtp server with STARTTLS
+        cert = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(cert)
+        mail_handler = StashingHandler()
+        controller = Controller(mail_handler, loop=None,
+                                hostname='localhost', port=self.smtpd_port + 7,
+                                tls_context=server_context, require_starttls=True)
+        controller.start()
+        self.addCleanup(controller.stop)
+        sleep(0.5)
+
+        # Our own context: trust the certificate
+        context = ssl.create_default_context(cafile=cert)
+        connection = SMTPConnection('localhost', self.smtpd_port + 7, None, None, tls=True, ssl_context=context)
+        postman = Postman('test@example.com', connection)
+
+        # Send; reconnect
+        sessions_reused = []
+        for i in range(3):
+            with postman.connect() as c:
+                self.assertIs(c.client.sock.context, context)
+                sessions_reused.append(c.client.sock.session_reused)
+                c.sendmail(Message(['test@example.com'], 'Subject'))
+
+        # Test
+        self.assertEqual(len(mail_handler.mail), 3)
+        self.assertEqual(sessions_reused, [False, True, True])
+
+        # Default context
+        connection = SMTPConnection('localhost', self.smtpd_port + 7, None, None, tls=True)
+        with Postman('test@example.com', connection).connect() as c:
+            c.sendmail(Message(['test@example.com'], 'Subject'))
+        self.assertIsInstance(connection.ssl_context, ssl.SSLContext)
+
+    def test_reconnect_aiosmtpd(self):
+        """ Test ConnectedPostman reconnecting when the server drops the session """
+        if aiosmtpd is None:
+            self.skipTest('aiosmtpd not available')
+
+        # Start an smtp server which accepts 3 messages per session
+        mail_handler = LimitingHandler(3)
+        controller = Controller(mail_handler, loop=None,
+                                hostname='localhost', port=self.smtpd_port + 4)
+        controller.start()
+        self.addCleanup(controller.stop)
+        sleep(0.5)
+
+        connection = NoLoginSMTP('localhost', self.smtpd_port + 4, None, None)
+
+        # Without reconnects, the batch dies
+        postman = Postman('test@example.com', connection)
+        with postman.connect() as c:
+            for i in range(3):
+                c.sendmail(Message(['test@example.com'], 'Subject'))
+            with self.assertRaises(smtplib.SMTPDataError) as e:
+                c.sendmail(Message(['test@example.com'], 'Subject'))
+            self.assertEqual(e.exception.smtp_code, 421)
+        self.assertEqual(len(mail_handler.mail), 3)
+
+        # With reconnects, it goes on
+        postman = Postman('test@example.com', connection, reconnect=1)
+        with postman.connect() as c:
+            for i in range(10):
+                c.sendmail(Message(['test@example.com'], 'Subject'))
+        self.assertEqual(len(mail_handler.mail), 3 + 10)
+
+    def test_size_aiosmtpd(self):
+        """ Test the SIZE limit: oversized messages are refused before they're sent """
+        if aiosmtpd is None:
+            self.skipTest('aiosmtpd not available')
+
+        # Start an smtp server with a 100 KiB limit
+        mail_handler = StashingHandler()
+        controller = Controller(mail_handler, loop=None,
+                                hostname='localhost', port=self.smtpd_port + 8, data_size_limit=100 * 1024)
+        controller.start()
+        self.addCleanup(controller.stop)
+        sleep(0.5)
+
+        postman = Postman('test@example.com', NoLoginSMTP('localhost', self.smtpd_port + 8, None, None))
+        with postman.connect() as c:
+            # Way too big: refused without serialization
+            msg = Message(['test@example.com'], 'Big', 'Big', attachments=[Attachment('big.bin', b'\0' * 1024 * 1024)])
+            msg._serialize = None
+            with self.assertRaises(smtplib.SMTPSenderRefused) as e:
+                c.sendmail(msg)
+            self.assertEqual(e.exception.smtp_code, 552)
+
+            # Just a bit too big: refused after serialization
+            with self.assertRaises(smtplib.SMTPSenderRefused):
+                c.sendmail(Message(['test@example.com'], 'Big', 'Big',
+                                   attachments=[Attachment('big.bin', b'\0' * 76 * 1024)]))
+
+            # The session goes on
+            c.sendmail(Message(['test@example.com'], 'Small', 'Small'))
+        self.assertEqual(len(mail_handler.mail), 1)
+
     # TODO: remove this test when Python 2 becomes obsolete
     def test_real_mail_smtpd(self):
         """ Test sending messages with a real SMTPD server """
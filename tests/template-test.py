@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import sys
 import unittest
+import threading
 
 from mailem import Attachment, ImageAttachment
 from mailem.template import Template, TemplateRegistry
-from mailem.template.renderer import Jinja2TemplateRenderer
+from mailem.template.renderer import Jinja2TemplateRenderer, PythonTemplateRenderer
 
-from future.utils import PY2
+PY2 = sys.version_info[0] == 2
 
 
 class TemplateTest(unittest.TestCase):
@@ -80,3 +82,47 @@ class TemplateTest(unittest.TestCase):
         """ Test TemplateRegistry """
         registry = TemplateRegistry.from_directory('tests/data').defaults(dict(domain='localhost'))
         self._check_signup_template(registry.get('signup'))
+
+    @unittest.skipIf(PY2, 'No asyncio in Python 2')
+    def test_render_async(self):
+        """ Test Template.render_async() """
+        import asyncio
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        # Sync renderer: in a thread
+        threads = []
+
+        class ThreadRenderer(PythonTemplateRenderer):
+            def __call__(self, values):
+                threads.append(threading.current_thread())
+                return super(ThreadRenderer, self).__call__(values)
+
+        hello = Template(u'Hello $user', u'Hi, $user!').set_renderer(ThreadRenderer)
+        msg = loop.run_until_complete(hello.render_async(['user@example.com'], dict(user='User'), sender='test@example.com'))
+        self.assertEqual((msg._subject, msg._html, msg._sender.email), (u'Hello User', u'Hi, User!', 'test@example.com'))
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+        # The default renderer
+        signup = Template.from_directory('tests/data/signup').defaults(dict(domain='localhost'))
+        self._check_signup_template(_Rendered(loop, signup))
+
+        # Async renderer: in the loop, awaiting values
+        signup = Template(u'Hello {{ user }} °C',
+                          u'You are signed up -- <img src="cid:flower.jpg" /> {{ domain() }}\n',
+                          attachments=[ImageAttachment('flower.jpg', b'\xff\xd8\xff\xe0\x00\x10JFIF', 'inline')],
+                          defaults=dict(domain=lambda: asyncio.sleep(0, result='localhost')))
+        signup.set_renderer(Jinja2TemplateRenderer, enable_async=True)
+        self._check_signup_template(_Rendered(loop, signup))
+
+
+class _Rendered(object):
+    """ A template that renders with render_async() """
+
+    def __init__(self, loop, template):
+        self.loop = loop
+        self.template = template
+
+    def __call__(self, recipients, values, **kwargs):
+        return self.loop.run_until_complete(self.template.render_async(recipients, values, **kwargs))